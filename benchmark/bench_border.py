@@ -0,0 +1,51 @@
+"""Compares full and multi-resolution border detection on large JPEG and TIFF files.
+
+Run with `python -m benchmark.bench_border`."""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from PIL import Image
+
+from benchmark.helpers import make_synthetic_image, time_call
+from image_tools.common.image.border import detect_border, detect_border_multi_resolution
+from image_tools.common.image.types import size_to_str
+
+CASES = [
+    # Size, border thickness
+    ((6000, 4000), 0),
+    ((6000, 4000), 300),
+    ((11000, 8000), 0),
+    ((11000, 8000), 600),
+]
+
+FORMATS = [".jpg", ".tif"]
+
+
+def main() -> None:
+    print(f"{'size':>12} {'border':>7} {'format':>6} {'decode':>8} {'full':>8} {'multi-res':>10} {'speedup':>8}")
+    with TemporaryDirectory() as temp_dir:
+        for size, border in CASES:
+            image = make_synthetic_image(size, border)
+            for extension in FORMATS:
+                path = Path(temp_dir) / f"image{extension}"
+                image.save(path)
+
+                def decode() -> Image.Image:
+                    decoded = Image.open(path)
+                    decoded.load()
+                    return decoded
+
+                decode_time = time_call(decode)
+                decoded = decode()
+                assert detect_border(decoded) == detect_border_multi_resolution(decoded)
+                full_time = time_call(lambda: detect_border(decoded))
+                multi_time = time_call(lambda: detect_border_multi_resolution(decoded))
+                print(
+                    f"{size_to_str(size):>12} {border:>7} {extension:>6} {decode_time:>7.3f}s {full_time:>7.3f}s "
+                    f"{multi_time:>9.3f}s {full_time / multi_time:>7.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
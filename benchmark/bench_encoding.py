@@ -0,0 +1,40 @@
+"""Compares the encoder profiles for each output format: encoding time and output file size.
+
+Run with `python -m benchmark.bench_encoding`."""
+
+from io import BytesIO
+
+from benchmark.helpers import make_synthetic_image, time_call
+from image_tools.common.image.encoding import EncoderOptions, EncoderProfile, OutputFormat
+from image_tools.common.image.imageio import save_image
+from image_tools.common.image.types import size_to_str
+
+# Typical sizes of output images, and of full resolution photos.
+SIZES = [(2000, 1600), (6000, 4000)]
+
+
+def main() -> None:
+    print(f"{'size':>12} {'format':>6} {'profile':>9} {'encode':>8} {'file size':>10} {'bits/px':>8}")
+    for size in SIZES:
+        image = make_synthetic_image(size)
+        for format in OutputFormat:
+            for profile in EncoderProfile:
+                options = EncoderOptions(profile)
+                buffer = BytesIO()
+
+                def encode() -> None:
+                    buffer.seek(0)
+                    buffer.truncate()
+                    save_image(image, buffer, format.name, {}, options)
+
+                seconds = time_call(encode)
+                file_size = buffer.tell()
+                bits_per_pixel = file_size * 8 / (size[0] * size[1])
+                print(
+                    f"{size_to_str(size):>12} {str(format):>6} {str(profile):>9} {seconds:>7.3f}s "
+                    f"{file_size / 2**20:>7.2f}MiB {bits_per_pixel:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compares the quality and fast scaling modes of instagramable, from decoding to the final resized image.
+
+Run with `python -m benchmark.bench_scaling`."""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from benchmark.helpers import make_synthetic_image, time_call
+from image_tools.common.image.types import size_to_str
+from image_tools.instagramable.cli import get_config
+from image_tools.instagramable.options import ScalingMode
+from image_tools.instagramable.processing import create_output_image
+
+CASES = [
+    # Size, border thickness, maximum dimension
+    ((6000, 4000), 0, 2000),
+    ((6000, 4000), 300, 2000),
+    ((6000, 4000), 0, 1080),
+    ((10000, 7000), 0, 2000),
+]
+
+FORMATS = [".jpg", ".tif"]
+
+
+def main() -> None:
+    print(
+        f"{'size':>12} {'border':>7} {'max dim':>8} {'format':>6} {'quality':>8} {'fast':>8} {'speedup':>8} "
+        f"{'mean diff':>10}"
+    )
+    with TemporaryDirectory() as temp_dir:
+        for size, border, max_dimension in CASES:
+            image = make_synthetic_image(size, border)
+            for extension in FORMATS:
+                path = Path(temp_dir) / f"image{extension}"
+                image.save(path)
+                times = {}
+                outputs = {}
+                for mode in ScalingMode:
+                    config = get_config([str(path), "--scaling", str(mode), "--max-dimension", str(max_dimension)])
+                    times[mode] = time_call(lambda: create_output_image(path, config))
+                    outputs[mode] = np.asarray(create_output_image(path, config)[0], dtype=np.float32)
+                quality_time = times[ScalingMode.QUALITY]
+                fast_time = times[ScalingMode.FAST]
+                if outputs[ScalingMode.QUALITY].shape == outputs[ScalingMode.FAST].shape:
+                    mean_diff = f"{np.mean(np.abs(outputs[ScalingMode.QUALITY] - outputs[ScalingMode.FAST])):.2f}"
+                else:
+                    mean_diff = "n/a"
+                print(
+                    f"{size_to_str(size):>12} {border:>7} {max_dimension:>8} {extension:>6} {quality_time:>7.3f}s "
+                    f"{fast_time:>7.3f}s {quality_time / fast_time:>7.1f}x {mean_diff:>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compares two `benchmark.suite` results files, e.g. from before and after a commit, and reports regressions.
+
+Exits with status 1 if any benchmark got slower or used more memory than the threshold allows.
+
+Run with `python -m benchmark.compare baseline.json new.json`."""
+
+import json
+import sys
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from pathlib import Path
+from typing import Any
+
+# Results below these are dominated by noise, so they never count as regressions.
+MIN_SECONDS = 0.005
+MIN_PEAK_MEMORY = 2**20
+
+
+def load_results(path: Path) -> dict[tuple[str, ...], dict[str, Any]]:
+    results = json.loads(path.read_text())["results"]
+    return {(r["benchmark"], r["size"], r["mode"], r["border"]): r for r in results}
+
+
+def main() -> None:
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("baseline", type=Path, help="Baseline results file.")
+    parser.add_argument("new", type=Path, help="New results file.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative increase counted as a regression.")
+    parsed = parser.parse_args()
+
+    baseline = load_results(parsed.baseline)
+    new = load_results(parsed.new)
+
+    regressions = 0
+    print(f"{'benchmark':>32} {'size':>6} {'mode':>5} {'border':>6} {'time':>8} {'memory':>8}")
+    for key, new_result in new.items():
+        baseline_result = baseline.get(key)
+        if baseline_result is None or "error" in baseline_result or "error" in new_result:
+            continue
+        changes = []
+        for field, minimum in (("seconds", MIN_SECONDS), ("peak_memory", MIN_PEAK_MEMORY)):
+            old_value = max(baseline_result[field], minimum)
+            new_value = max(new_result[field], minimum)
+            change = new_value / old_value - 1
+            if change > parsed.threshold:
+                regressions += 1
+            changes.append(f"{change:>+7.0%}{'!' if change > parsed.threshold else ' '}")
+        print(f"{key[0]:>32} {key[1]:>6} {key[2]:>5} {key[3]:>6} {' '.join(changes)}")
+
+    for key in baseline.keys() - new.keys():
+        print(f"{' '.join(key)}: missing from new results")
+
+    if regressions:
+        print(f"{regressions} regressions above {parsed.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
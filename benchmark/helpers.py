@@ -0,0 +1,44 @@
+import time
+from collections.abc import Callable
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_tools.common.image.types import IntSize
+
+
+def make_synthetic_image(size: IntSize, border: int = 0, mode: str = "RGB", seed: int = 0) -> Image.Image:
+    """Creates photo-like content (smooth gradients plus noise) with a uniform white border on all sides."""
+
+    rng = np.random.default_rng(seed)
+    content_width, content_height = size[0] - 2 * border, size[1] - 2 * border
+    # Generated a channel at a time in float32 to keep memory usage reasonable for very large images.
+    x = np.arange(content_width, dtype=np.float32)[np.newaxis, :]
+    y = np.arange(content_height, dtype=np.float32)[:, np.newaxis]
+    data = np.empty((content_height, content_width, 3), dtype=np.uint8)
+    for channel in range(3):
+        fx, fy = rng.uniform(1, 6, size=2) / max(size)
+        values = np.sin(x * (fx * np.pi)) * np.cos(y * (fy * np.pi))
+        values *= 100
+        values += 127
+        values += rng.standard_normal(values.shape, dtype=np.float32) * 8
+        data[:, :, channel] = np.clip(values, 0, 255)
+    image = Image.fromarray(data)
+    image = ImageOps.expand(image, border=border, fill="white")
+    if mode == "I;16":
+        # Pillow can't convert RGB to I;16 directly, and a plain conversion would only use 8 bits of the range.
+        image = Image.fromarray(np.asarray(image.convert("L"), dtype=np.uint16) * 257)
+    elif mode != image.mode:
+        image = image.convert(mode)
+    return image
+
+
+def time_call(func: Callable[[], object], repeat: int = 3) -> float:
+    """Gets the best of `repeat` wall clock times of calling `func`, in seconds."""
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
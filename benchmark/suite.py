@@ -0,0 +1,253 @@
+"""Times and measures the peak memory of every image processing hot path, and saves the results as JSON.
+
+Each benchmark runs in its own subprocess so peak memory measurements don't interfere with each other. Peak memory is
+in bytes, above the memory used once the input image is loaded.
+Compare two results files with `python -m benchmark.compare`.
+
+Run with `python -m benchmark.suite --output results.json`."""
+
+import json
+import platform
+import subprocess
+import sys
+from argparse import SUPPRESS, ArgumentDefaultsHelpFormatter, ArgumentParser
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timezone
+from importlib.metadata import version
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from colour import Color
+from PIL import Image
+
+from benchmark.helpers import make_synthetic_image, time_call
+from image_tools.common.cli.stats import get_peak_memory, reset_peak_memory
+from image_tools.common.image.types import IntSize
+
+SIZES: dict[str, IntSize] = {
+    "1MP": (1224, 816),
+    "6MP": (3000, 2000),
+    "24MP": (6000, 4000),
+    "50MP": (8688, 5792),
+    "100MP": (12240, 8160),
+}
+
+MODES = ["RGB", "L", "RGBA", "I;16"]
+
+# Border thickness, as a proportion of the smaller image dimension.
+BORDERS: dict[str, float] = {
+    "none": 0,
+    "thin": 0.01,
+    "thick": 0.1,
+}
+
+# Per benchmark run, so the whole suite can't hang.
+CASE_TIMEOUT = 30 * 60
+
+
+@dataclass(frozen=True)
+class Case:
+    benchmark: str
+    size: str
+    mode: str
+    border: str
+    input_path: Path  # Pre-generated image
+    output_directory: Path
+    repeat: int
+
+
+# Each benchmark takes the case and the loaded input image, and returns the function to measure.
+Benchmark = Callable[[Case, Image.Image], Callable[[], object]]
+
+
+def bench_detect_border(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.common.image.border import detect_border
+
+    return lambda: detect_border(image)
+
+
+def bench_detect_border_multi_resolution(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.common.image.border import detect_border_multi_resolution
+
+    return lambda: detect_border_multi_resolution(image)
+
+
+def bench_remove_border(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.common.image.border import detect_border, remove_border
+
+    border = detect_border(image)
+    return lambda: remove_border(image, border)
+
+
+def bench_apply_new_border(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.instagramable.border import apply_new_border
+
+    colour = Color("white")
+    return lambda: apply_new_border(image, colour, 0.05)
+
+
+def bench_adjust_image_size(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.instagramable.sizing import adjust_image_size
+
+    return lambda: adjust_image_size(image, 1080)
+
+
+def bench_draw_annotation_text(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.annotate_info.text import TextPosition, draw_annotation_text
+
+    text = "Camera\nLens  @ 50mm\nf/2.8  1/250s  ISO100"
+    colour = Color("red")
+    # Draws over the same image each time, which doesn't change the amount of work.
+    return lambda: draw_annotation_text(image, text, TextPosition.BOTTOM_RIGHT, colour)
+
+
+def bench_instagramable(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.instagramable.cli import get_config, process_image
+
+    output_path = case.output_directory / f"instagramable{case.input_path.suffix}"
+    config = get_config([str(case.input_path), "--overwrite"])
+    return lambda: process_image(case.input_path, output_path, config)
+
+
+def bench_annotate_info(case: Case, image: Image.Image) -> Callable[[], object]:
+    from image_tools.annotate_info.cli import get_config, process_image
+
+    output_path = case.output_directory / f"annotate_info{case.input_path.suffix}"
+    config = get_config([str(case.input_path), "--all-info", "--overwrite"])
+    return lambda: process_image(case.input_path, output_path, config)
+
+
+BENCHMARKS: dict[str, Benchmark] = {
+    "detect_border": bench_detect_border,
+    "detect_border_multi_resolution": bench_detect_border_multi_resolution,
+    "remove_border": bench_remove_border,
+    "apply_new_border": bench_apply_new_border,
+    "adjust_image_size": bench_adjust_image_size,
+    "draw_annotation_text": bench_draw_annotation_text,
+    "instagramable": bench_instagramable,
+    "annotate_info": bench_annotate_info,
+}
+
+
+def run_case(case: Case) -> dict[str, Any]:
+    """Runs one benchmark in this process. Called in the subprocess."""
+
+    case = replace(case, input_path=Path(case.input_path), output_directory=Path(case.output_directory))
+    image = Image.open(case.input_path)
+    image.load()
+    func = BENCHMARKS[case.benchmark](case, image)
+    reset_peak_memory()
+    baseline_memory = get_peak_memory()
+    seconds = time_call(func, case.repeat)
+    return {
+        "seconds": seconds,
+        "peak_memory": get_peak_memory() - baseline_memory,
+    }
+
+
+def run_case_in_subprocess(case: Case) -> dict[str, Any]:
+    case_json = json.dumps(asdict(case), default=str)
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmark.suite", "--run-case", case_json],
+            capture_output=True,
+            text=True,
+            timeout=CASE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": f"Timed out after {CASE_TIMEOUT}s"}
+    if completed.returncode != 0:
+        error_lines = completed.stderr.strip().splitlines() or [f"Exit code {completed.returncode}"]
+        return {"error": error_lines[-1]}
+    return json.loads(completed.stdout)
+
+
+def create_input_image(size: IntSize, mode: str, border: float, directory: Path) -> Path:
+    border_pixels = int(min(size) * border)
+    image = make_synthetic_image(size, border_pixels, mode)
+    # JPEG where the mode allows it, since that's what most photos are.
+    extension = ".jpg" if mode in ("RGB", "L") else ".tif"
+    path = directory / f"input{extension}"
+    image.save(path)
+    return path
+
+
+def get_git_commit() -> str | None:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+
+def get_environment() -> dict[str, Any]:
+    return {
+        "commit": get_git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "pillow": version("pillow"),
+        "numpy": version("numpy"),
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--output", type=Path, help="JSON results file path.")
+    parser.add_argument("--size", choices=list(SIZES), action="append", help="Image sizes to run. Defaults to all.")
+    parser.add_argument("--mode", choices=MODES, action="append", help="Image modes to run. Defaults to all.")
+    parser.add_argument("--border", choices=list(BORDERS), action="append", help="Borders to run. Defaults to all.")
+    parser.add_argument(
+        "--benchmark", choices=list(BENCHMARKS), action="append", help="Benchmarks to run. Defaults to all."
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per benchmark, best is kept.")
+    parser.add_argument("--run-case", type=str, help=SUPPRESS)
+    parsed = parser.parse_args()
+
+    if parsed.run_case is not None:
+        case = Case(**json.loads(parsed.run_case))
+        print(json.dumps(run_case(case)))
+        return
+    if parsed.output is None:
+        parser.error("--output is required")
+
+    results = []
+    with TemporaryDirectory() as temp_dir:
+        directory = Path(temp_dir)
+        for size_name in parsed.size or SIZES:
+            for mode in parsed.mode or MODES:
+                for border_name in parsed.border or BORDERS:
+                    size = SIZES[size_name]
+                    input_path = create_input_image(size, mode, BORDERS[border_name], directory)
+                    for benchmark in parsed.benchmark or BENCHMARKS:
+                        case = Case(benchmark, size_name, mode, border_name, input_path, directory, parsed.repeat)
+                        result = {
+                            "benchmark": benchmark,
+                            "size": size_name,
+                            "mode": mode,
+                            "border": border_name,
+                            "width": size[0],
+                            "height": size[1],
+                        }
+                        result |= run_case_in_subprocess(case)
+                        results.append(result)
+                        if "error" in result:
+                            print(f"{benchmark:>32} {size_name:>6} {mode:>5} {border_name:>6}  {result['error']}")
+                        else:
+                            print(
+                                f"{benchmark:>32} {size_name:>6} {mode:>5} {border_name:>6} {result['seconds']:>8.3f}s "
+                                f"{result['peak_memory'] / 2**20:>8.1f}MiB"
+                            )
+                    input_path.unlink()
+
+    parsed.output.write_text(json.dumps({"environment": get_environment(), "results": results}, indent=2))
+    print(f"Wrote results to '{parsed.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from typing import TYPE_CHECKING
+
+from image_tools.annotate_info.options import ProcessingOptions
+
+if TYPE_CHECKING:
+    from image_tools.annotate_info.api import process
+
+__all__ = ["ProcessingOptions", "process"]
+
+
+def __getattr__(name: str):
+    # Imported on first use, so the command line tool doesn't load the image libraries before it needs them.
+    if name == "process":
+        from image_tools.annotate_info.api import process
+
+        return process
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,27 @@
+"""Library API: processes images in memory, without files or command line arguments.
+Safe to call from multiple threads at once."""
+
+from io import BytesIO
+
+from PIL import Image
+
+from image_tools.annotate_info.processing import ProcessingOptions, read_image, transform_image, use_decoded_image
+from image_tools.common.image.imageio import ImageSource, encode_image
+
+
+def process(data: ImageSource, options: ProcessingOptions = ProcessingOptions(), format: str | None = None) -> bytes:
+    """Annotates an image with information about how it was taken, the same as the command line tool.
+
+    :param data: Image file content, or an already decoded image. A decoded image isn't modified, but shouldn't be
+        modified by another thread during the call.
+    :param format: Output image format, e.g. "JPEG". Defaults to the input format, or PNG if that's not known.
+    :return: Output image file content."""
+
+    if isinstance(data, Image.Image):
+        source = use_decoded_image(data)
+        input_format = data.format
+    else:
+        source = read_image(BytesIO(data) if isinstance(data, bytes) else data, options)
+        input_format = source.image.format
+    image, write_params = transform_image(source, options)
+    return encode_image(image, format or input_format or "PNG", write_params, options.encoder)
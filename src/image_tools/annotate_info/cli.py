@@ -1,38 +1,50 @@
+import dataclasses
 import logging
 import sys
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
 from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
 from colour import Color
-from PIL import Image
 
-from .metadata import get_image_metadata
-from image_tools.annotate_info.text import AnnotationOptions, TextPosition, create_annotation_text, draw_annotation_text
+from image_tools.annotate_info.options import AnnotationOptions, ProcessingOptions, TextPosition
 from image_tools.common.cli.batch import (
-    get_image_input_file_paths,
-    get_output_image_path,
-    validate_output_paths,
+    BatchOptions,
+    ImagePipeline,
+    add_batch_arguments,
+    get_batch_options,
+    iter_batch_input_paths,
+    iter_batch_paths,
+    run_batch,
 )
+from image_tools.common.cli.encoding import add_encoder_arguments, get_encoder_options
 from image_tools.common.cli.exception import AppError
 from image_tools.common.cli.logging import log_config, suppress_external_logging
-from image_tools.common.image.imageio import get_pil_image_write_params
+from image_tools.common.cli.report import ReportRecord, write_report
+from image_tools.common.cli.stats import record_size, stage
+from image_tools.common.image.encoding import OutputFormat, get_format_from_path
+
+# The image processing modules are imported where they're needed, so that argument parsing and runs with no images to
+# process don't wait for numpy and Pillow to load.
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from image_tools.annotate_info.processing import SourceImage
 
 logger = logging.getLogger()
-logging.basicConfig(style="{", format="{levelname}: {message}")
 
 
-@dataclass(frozen=True)
-class AppConfig:
+@dataclass(frozen=True, kw_only=True)
+class AppConfig(ProcessingOptions):
     input_path: str  # File name or glob
     output_directory: Path | None  # If none, output to input directory
     output_file_name_suffix: str
     allow_overwrite: bool
+    output_format: OutputFormat | None  # If none, same as the input
     dry_run: bool
     verbose: bool
-    text_position: TextPosition
-    text_colour: Color
-    annotate: AnnotationOptions
+    batch: BatchOptions
 
 
 def get_config(args: list[str]) -> AppConfig:
@@ -49,7 +61,10 @@ def get_config(args: list[str]) -> AppConfig:
         "--overwrite", action="store_true", default=False, help="Allow overwriting files which already exist."
     )
     parser.add_argument(
-        "--dry-run", action="store_true", default=False, help="Simulate the operation without writing any files."
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="Plan the operation without writing any files. Only image headers are read.",
     )
     parser.add_argument(
         "--verbose", action="store_true", default=False, help="Print more information about the operation."
@@ -62,10 +77,15 @@ def get_config(args: list[str]) -> AppConfig:
         help="Where to place the annotation text on the image.",
     )
     parser.add_argument("--text-colour", type=Color, default="red", help="Border colour, as a W3C colour name.")
+    parser.add_argument(
+        "--font", type=Path, default=None, help="TrueType/OpenType font file to use. Defaults to Pillow's font."
+    )
     parser.add_argument("--camera", action="store_true", default=False, help="Annotate camera body information.")
     parser.add_argument("--lens", action="store_true", default=False, help="Annotate lens information.")
     parser.add_argument("--exposure", action="store_true", default=False, help="Annotate exposure information.")
     parser.add_argument("--all-info", action="store_true", default=False, help="Annotate all supported information.")
+    add_encoder_arguments(parser)
+    add_batch_arguments(parser)
 
     parsed = parser.parse_args(args)
 
@@ -76,45 +96,129 @@ def get_config(args: list[str]) -> AppConfig:
     )
     if not annotation_options.any:
         parser.error("At least one annotation option is required")
+    if parsed.font is not None:
+        from PIL import ImageFont
+
+        try:
+            ImageFont.truetype(parsed.font)
+        except OSError as e:
+            parser.error(f"Cannot load font '{parsed.font}': {e}")
 
     return AppConfig(
         input_path=parsed.files,
         output_directory=parsed.output_dir,
         output_file_name_suffix=parsed.output_suffix,
         allow_overwrite=parsed.overwrite,
+        output_format=parsed.output_format,
         dry_run=parsed.dry_run,
         verbose=parsed.verbose,
+        encoder=get_encoder_options(parsed),
+        batch=get_batch_options(parser, parsed),
         text_position=parsed.text_position,
         text_colour=parsed.text_colour,
+        font_path=parsed.font,
         annotate=annotation_options,
     )
 
 
-def process_image(input_path: Path, output_path: Path, config: AppConfig) -> None:
+# Peak memory needed to process an image, relative to its decoded size. Measured on 24 MP images; mostly taken by the
+# decoded image and the encoder's buffers.
+PEAK_MEMORY_FACTOR = 3.5
+
+
+def estimate_peak_memory(input_path: Path, config: AppConfig) -> int:
+    """Estimates the peak memory needed by `process_image()`, in bytes, reading only the image header."""
+
+    from PIL import Image
+
+    from image_tools.common.image.imageio import get_decoded_image_size
+
+    with Image.open(input_path) as image:
+        return int(get_decoded_image_size(image) * PEAK_MEMORY_FACTOR)
+
+
+def estimate_cost(input_path: Path, config: AppConfig) -> tuple[str, float]:
+    """Gets the cost class and megapixels of an image to order a batch by, reading only the image header."""
+
+    from PIL import Image
+
+    with Image.open(input_path) as image:
+        return image.format or "unknown", image.width * image.height / 1e6
+
+
+def plan_image(input_path: Path, output_path: Path, config: AppConfig) -> ReportRecord:
+    """Works out what `process_image()` would do, reading only the image header and metadata."""
+
+    from image_tools.annotate_info.text import (
+        calculate_font_size,
+        calculate_text_position_and_anchor,
+        create_annotation_text,
+    )
+    from image_tools.common.cli.index import get_image_info
+
+    logger.info(f"Planning '{input_path}'")
+
+    # Only reads the header, if the image isn't in the index already.
+    info = get_image_info(input_path, config.batch.index_path)
+
+    annotation_text = create_annotation_text(info.metadata, config.annotate)
+    font_size = calculate_font_size(info.size)
+    (text_x, text_y), anchor = calculate_text_position_and_anchor(info.size, config.text_position)
+    logger.info(f"Dry run: Would save image to '{output_path}'")
+
+    return {
+        "input": str(input_path),
+        "output": str(output_path),
+        "format": info.format,
+        "mode": info.mode,
+        "width": info.size[0],
+        "height": info.size[1],
+        **dataclasses.asdict(info.metadata),
+        "text": annotation_text,
+        "font_size": font_size,
+        "text_x": text_x,
+        "text_y": text_y,
+        "text_anchor": anchor,
+    }
+
+
+def read_image(input_path: Path, config: AppConfig) -> "SourceImage":
+    from image_tools.annotate_info import processing
+
     logger.info(f"Processing '{input_path}'")
+    return processing.read_image(input_path, config)
+
+
+def transform_image(source: "SourceImage", config: AppConfig) -> tuple["Image.Image", dict[str, Any]]:
+    from image_tools.annotate_info import processing
 
-    # Note if the file is not a valid image, we fail everything. User probably needs to take action.
-    image = Image.open(input_path)
+    return processing.transform_image(source, config)
 
-    # We're trying to preserve as much as possible from the original image, so save the info now in case it's changed.
-    write_params = get_pil_image_write_params(image)
 
-    metadata = get_image_metadata(image)
-    annotation_text = create_annotation_text(metadata, config.annotate)
-    image = draw_annotation_text(image, annotation_text, config.text_position, config.text_colour)
+def write_image(output: tuple["Image.Image", dict[str, Any]], output_path: Path, config: AppConfig) -> None:
+    from image_tools.common.image.imageio import save_image
 
-    if config.dry_run:
-        logger.info(f"Dry run: Would save image to '{output_path}'")
-    else:
-        # Create the output directory if required.
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        if not config.allow_overwrite and output_path.exists():
-            raise AppError(f"Would overwrite existing file: '{output_path}'")
-        image.save(output_path, **write_params)
-        logger.info(f"Saved image to '{output_path}'")
+    image, write_params = output
+    record_size("output", image.size)
+
+    # Create the output directory if required.
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.exists() and not config.allow_overwrite:
+        raise AppError(f"Would overwrite existing file: '{output_path}'")
+    with stage("save"):
+        save_image(image, output_path, get_format_from_path(output_path), write_params, config.encoder)
+    logger.info(f"Saved image to '{output_path}'")
+
+
+def process_image(input_path: Path, output_path: Path, config: AppConfig) -> None:
+    write_image(transform_image(read_image(input_path, config), config), output_path, config)
+
+
+PIPELINE = ImagePipeline(read_image, transform_image, write_image)
 
 
 def main():
+    logging.basicConfig(style="{", format="{levelname}: {message}")
     try:
         config = get_config(sys.argv[1:])
 
@@ -126,19 +230,32 @@ def main():
 
         log_config(config)
 
-        input_file_paths = get_image_input_file_paths(config.input_path)
-        if not input_file_paths:
+        input_paths = iter_batch_input_paths(config.input_path, config.batch)
+        paths = iter_batch_paths(
+            input_paths,
+            config.output_directory,
+            config.output_file_name_suffix,
+            config.allow_overwrite,
+            config.output_format,
+            check_outputs=config.batch.check_outputs_early,
+        )
+        records: list[ReportRecord] = []
+        process_func = plan_image if config.dry_run else process_image
+        processed = run_batch(
+            process_func,
+            paths,
+            config,
+            config.batch,
+            records.append,
+            PIPELINE,
+            estimate_peak_memory,
+            cost_estimator=estimate_cost,
+        )
+        if processed == 0:
             logger.info("No files to process")
             return
-
-        output_file_paths = [
-            get_output_image_path(p, config.output_directory, config.output_file_name_suffix) for p in input_file_paths
-        ]
-
-        validate_output_paths(output_file_paths, config.allow_overwrite)
-
-        for input_path, output_path in zip(input_file_paths, output_file_paths):
-            process_image(input_path, output_path, config)
+        if config.batch.report_path is not None:
+            write_report(records, config.batch.report_path)
 
         logger.info("Success")
     except Exception as e:
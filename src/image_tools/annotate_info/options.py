@@ -0,0 +1,46 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+
+from colour import Color
+
+from image_tools.common.image.encoding import EncoderOptions
+
+
+class TextPosition(Enum):
+    TOP_LEFT = "top-left"
+    TOP_MIDDLE = "top-middle"
+    TOP_RIGHT = "top-right"
+    MIDDLE_LEFT = "middle-left"
+    MIDDLE = "middle"
+    MIDDLE_RIGHT = "middle-right"
+    BOTTOM_LEFT = "bottom-left"
+    BOTTOM_MIDDLE = "bottom-middle"
+    BOTTOM_RIGHT = "bottom-right"
+
+    # For argparse help output.
+    def __str__(self):
+        return self.value
+
+
+@dataclass(frozen=True)
+class AnnotationOptions:
+    camera: bool  # Camera body model
+    lens: bool  # Lens model, focal length
+    exposure: bool  # Aperture, shutter speed, ISO
+
+    @property
+    def any(self) -> bool:
+        return any((self.camera, self.lens, self.exposure))
+
+
+@dataclass(frozen=True, kw_only=True)
+class ProcessingOptions:
+    """Options which affect the output image. Defaults are the same as the command line defaults, except all
+    information is annotated."""
+
+    text_position: TextPosition = TextPosition.TOP_LEFT
+    text_colour: Color = field(default_factory=lambda: Color("red"))
+    font_path: Path | None = None  # If none, use the default font
+    annotate: AnnotationOptions = AnnotationOptions(camera=True, lens=True, exposure=True)
+    encoder: EncoderOptions = EncoderOptions()
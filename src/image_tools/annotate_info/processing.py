@@ -0,0 +1,59 @@
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from PIL import Image
+
+from image_tools.annotate_info.options import ProcessingOptions
+from image_tools.annotate_info.text import create_annotation_text, draw_annotation_text
+from image_tools.common.cli.stats import record_size, stage
+from image_tools.common.image.imageio import get_pil_image_write_params
+from image_tools.common.image.metadata import ImageMetadata, get_image_metadata
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SourceImage:
+    """An input image, decoded and ready to annotate."""
+
+    image: Image.Image
+    metadata: ImageMetadata
+    write_params: dict[str, Any]  # To pass to `Image.save()`
+
+
+def read_image(file: Path | BinaryIO, options: ProcessingOptions) -> SourceImage:
+    # Note if the file is not a valid image, we fail everything. User probably needs to take action.
+    image = Image.open(file)
+
+    # We're trying to preserve as much as possible from the original image, so save the info now in case it's changed.
+    with stage("metadata"):
+        write_params = get_pil_image_write_params(image)
+        metadata = get_image_metadata(image)
+    record_size("input", image.size)
+
+    with stage("decode"):
+        image.load()
+
+    return SourceImage(image, metadata, write_params)
+
+
+def use_decoded_image(image: Image.Image) -> SourceImage:
+    """Uses an already decoded image as the input. The image is copied, as annotating draws onto the image."""
+
+    record_size("input", image.size)
+    return SourceImage(image.copy(), get_image_metadata(image), get_pil_image_write_params(image))
+
+
+def transform_image(source: SourceImage, options: ProcessingOptions) -> tuple[Image.Image, dict[str, Any]]:
+    """Draws the annotation onto a loaded image, in place.
+
+    :return: Annotated image, and params to pass to `Image.save()`."""
+
+    annotation_text = create_annotation_text(source.metadata, options.annotate)
+    with stage("draw_text"):
+        image = draw_annotation_text(
+            source.image, annotation_text, options.text_position, options.text_colour, options.font_path
+        )
+    return image, source.write_params
@@ -1,42 +1,28 @@
 import logging
-from dataclasses import dataclass
-from enum import Enum
+import threading
+from functools import lru_cache
+from pathlib import Path
 
 from colour import Color
-from PIL import ImageDraw
+from PIL import Image as PILImage
+from PIL import ImageDraw, ImageFont
 from PIL.Image import Image
 
-from image_tools.annotate_info.metadata import ImageMetadata
+from image_tools.annotate_info.options import AnnotationOptions, TextPosition
+from image_tools.common.image.metadata import ImageMetadata
 from image_tools.common.image.types import IntPos, IntSize
 
 logger = logging.getLogger(__name__)
 
+Font = ImageFont.FreeTypeFont | ImageFont.ImageFont
 
-class TextPosition(Enum):
-    TOP_LEFT = "top-left"
-    TOP_MIDDLE = "top-middle"
-    TOP_RIGHT = "top-right"
-    MIDDLE_LEFT = "middle-left"
-    MIDDLE = "middle"
-    MIDDLE_RIGHT = "middle-right"
-    BOTTOM_LEFT = "bottom-left"
-    BOTTOM_MIDDLE = "bottom-middle"
-    BOTTOM_RIGHT = "bottom-right"
+# Most images in a batch share the same text and size, so rendered text is worth reusing.
+# Masks are kept per process; the limits bound the memory used for large images.
+FONT_CACHE_SIZE = 16
+TEXT_MASK_CACHE_SIZE = 32
 
-    # For argparse help output.
-    def __str__(self):
-        return self.value
-
-
-@dataclass(frozen=True)
-class AnnotationOptions:
-    camera: bool  # Camera body model
-    lens: bool  # Lens model, focal length
-    exposure: bool  # Aperture, shutter speed, ISO
-
-    @property
-    def any(self) -> bool:
-        return any((self.camera, self.lens, self.exposure))
+# FreeType fonts can't be used from multiple threads at once, and cached fonts are shared.
+_font_lock = threading.Lock()
 
 
 def create_annotation_text(metadata: ImageMetadata, options: AnnotationOptions) -> str:
@@ -125,11 +111,60 @@ def calculate_font_size(image_size: IntSize) -> int:
     return int(image_size[0] / 1000 * 30)
 
 
-def draw_annotation_text(image: Image, text: str, position: TextPosition, colour: Color) -> Image:
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_path: Path | None, font_size: int) -> Font:
+    """Loads a font, cached.
+
+    :param font_path: TrueType/OpenType font file, or None for Pillow's default font.
+    :param font_size: Font size in pixels."""
+
+    if font_path is None:
+        return ImageFont.load_default(font_size)
+    else:
+        return ImageFont.truetype(font_path, font_size)
+
+
+@lru_cache(maxsize=TEXT_MASK_CACHE_SIZE)
+def render_text_mask(
+    text: str, font_path: Path | None, font_size: int, anchor: str, font_mode: str
+) -> tuple[Image, IntPos]:
+    """Renders text to a coverage mask, cached.
+
+    :param font_mode: Rendering mode of the target image's `ImageDraw`, "L" for antialiased text or "1" for none.
+    :return: The mask and its offset relative to the anchor point."""
+
+    font = load_font(font_path, font_size)
+    with _font_lock:
+        draw = ImageDraw.Draw(PILImage.new("L", (1, 1)))
+        left, top, right, bottom = (int(v) for v in draw.multiline_textbbox((0, 0), text, font=font, anchor=anchor))
+        mask = PILImage.new("L", (max(right - left, 1), max(bottom - top, 1)))
+        draw = ImageDraw.Draw(mask)
+        draw.fontmode = font_mode
+        draw.text(xy=(-left, -top), anchor=anchor, text=text, fill=255, font=font)
+    return mask, (left, top)
+
+
+def format_cache_info(info: tuple[int, int, int | None, int]) -> str:
+    """Formats the hits, misses, max size and current size from an `lru_cache` function's `cache_info()`."""
+
+    hits, misses, _, size = info
+    total = hits + misses
+    hit_rate = hits / total if total else 0.0
+    return f"{hits}/{total} hits ({hit_rate:.0%}), {size} entries"
+
+
+def draw_annotation_text(
+    image: Image, text: str, position: TextPosition, colour: Color, font_path: Path | None = None
+) -> Image:
     font_size = calculate_font_size(image.size)
     logger.debug(f"Using font size {font_size}")
     position_pixels, anchor = calculate_text_position_and_anchor(image.size, position)
     logger.debug(f"Drawing text at position={position_pixels} anchor={anchor}")
     draw = ImageDraw.Draw(image)
-    draw.text(xy=position_pixels, anchor=anchor, text=text, fill=colour.get_hex_l(), font_size=font_size)
+    mask, offset = render_text_mask(text, font_path, font_size, anchor, draw.fontmode)
+    draw.bitmap((position_pixels[0] + offset[0], position_pixels[1] + offset[1]), mask, fill=colour.get_hex_l())
+    logger.debug(
+        f"Font cache: {format_cache_info(load_font.cache_info())}; "
+        f"text mask cache: {format_cache_info(render_text_mask.cache_info())}"
+    )
     return image
@@ -0,0 +1,344 @@
+"""The `image-tools run` command, which applies several tools' operations to each image in memory, decoding and encoding
+it only once."""
+
+import logging
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, ArgumentTypeError
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from colour import Color
+
+from image_tools.annotate_info.options import AnnotationOptions, TextPosition
+from image_tools.chain.options import (
+    AnnotateOperation,
+    BorderOperation,
+    Operation,
+    ProcessingOptions,
+    ResizeOperation,
+)
+from image_tools.common.cli.batch import (
+    BatchOptions,
+    ImagePipeline,
+    add_batch_arguments,
+    get_batch_options,
+    iter_batch_input_paths,
+    iter_batch_paths,
+    run_batch,
+)
+from image_tools.common.cli.encoding import add_encoder_arguments, get_encoder_options
+from image_tools.common.cli.exception import AppError
+from image_tools.common.cli.logging import log_config, suppress_external_logging
+from image_tools.common.cli.report import ReportRecord, write_report
+from image_tools.common.cli.stats import record_size, stage
+from image_tools.common.image.encoding import OutputFormat, get_format_from_path
+from image_tools.common.image.types import size_to_str
+from image_tools.instagramable.options import BorderDetectionMode, ExistingBorderHandling
+
+# The image processing modules are imported where they're needed, so that argument parsing and runs with no images to
+# process don't wait for numpy and Pillow to load.
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from image_tools.chain.processing import SourceImage
+
+logger = logging.getLogger()
+
+
+@dataclass(frozen=True, kw_only=True)
+class AppConfig(ProcessingOptions):
+    input_path: str  # File name or glob
+    output_directory: Path | None  # If none, output to input directory
+    output_file_name_suffix: str
+    allow_overwrite: bool
+    output_format: OutputFormat | None  # If none, same as the input
+    dry_run: bool
+    verbose: bool
+    batch: BatchOptions
+
+
+_ANNOTATION_INFO = ("camera", "lens", "exposure")
+
+
+def parse_annotation_info(text: str) -> AnnotationOptions:
+    """Parses `all`, or information names joined with `+`, e.g. `camera+lens`."""
+
+    names = set(text.split("+"))
+    if names == {"all"}:
+        names = set(_ANNOTATION_INFO)
+    if not names <= set(_ANNOTATION_INFO):
+        raise ValueError(text)
+    return AnnotationOptions(**{name: name in names for name in _ANNOTATION_INFO})
+
+
+# Operation name -> operation type, and its keys -> field name and value parser.
+# Keys are the same as the options of the single tools.
+_OPERATIONS: dict[str, tuple[type, dict[str, tuple[str, Callable[[str], Any]]]]] = {
+    "annotate": (
+        AnnotateOperation,
+        {
+            "info": ("annotate", parse_annotation_info),
+            "text-position": ("text_position", TextPosition),
+            "text-colour": ("text_colour", Color),
+            "font": ("font_path", Path),
+        },
+    ),
+    "border": (
+        BorderOperation,
+        {
+            "existing-border": ("existing_border_handling", ExistingBorderHandling),
+            "border-detection": ("border_detection", BorderDetectionMode),
+            "border-colour": ("border_colour", Color),
+            "border-size": ("border_baseline_size", float),
+        },
+    ),
+    "resize": (ResizeOperation, {"max-dimension": ("max_dimension", int)}),
+}
+
+
+def parse_operation(text: str) -> Operation:
+    """Parses an --op value: the operation name, optionally followed by `:` and comma separated KEY=VALUE."""
+
+    name, _, spec = text.partition(":")
+    if name not in _OPERATIONS:
+        raise ArgumentTypeError(f"Unknown operation '{name}', expected one of: {', '.join(_OPERATIONS)}")
+    operation_type, keys = _OPERATIONS[name]
+    fields: dict[str, Any] = {}
+    for item in spec.split(",") if spec else ():
+        key, separator, value = item.partition("=")
+        if not separator or key.strip() not in keys:
+            raise ArgumentTypeError(
+                f"Expected comma separated KEY=VALUE after '{name}:' with keys {', '.join(keys)}: '{text}'"
+            )
+        field_name, parse_value = keys[key.strip()]
+        try:
+            fields[field_name] = parse_value(value.strip())
+        except ValueError:
+            raise ArgumentTypeError(f"Invalid {key.strip()}: '{value}'")
+    return operation_type(**fields)
+
+
+def get_config(args: list[str]) -> AppConfig:
+    parser = ArgumentParser(prog="image-tools run", formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("files", type=str, help="File path, directory path, or path glob to process.")
+    parser.add_argument(
+        "--op",
+        type=parse_operation,
+        action="append",
+        required=True,
+        help="Operation to apply, in the order given. May be repeated. Each is NAME or NAME:KEY=VALUE,... "
+        "annotate: Write image metadata onto the image. Keys: info (all by default, or some of camera+lens+exposure), "
+        "text-position, text-colour, font. "
+        "border: Add a new border, by default replacing an existing border. Keys: existing-border, border-detection, "
+        "border-colour, border-size. "
+        "resize: Downscale the image if it's too large. Keys: max-dimension. "
+        "Keys have the same meaning and defaults as the options of annotate-image-info and instagramable. "
+        "E.g. --op annotate:info=camera+lens --op border:border-colour=black --op resize:max-dimension=1080",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=None,
+        help="Output directory path. Defaults to output in the same directory as the input.",
+    )
+    parser.add_argument("--output-suffix", type=str, default="-edited", help="Output file name suffix.")
+    parser.add_argument(
+        "--overwrite", action="store_true", default=False, help="Allow overwriting files which already exist."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="Plan the operation without writing any files. Only image headers are read, so existing borders are "
+        "ignored when planning.",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", default=False, help="Print more information about the operation."
+    )
+    add_encoder_arguments(parser)
+    add_batch_arguments(parser)
+
+    parsed = parser.parse_args(args)
+
+    for operation in parsed.op:
+        if isinstance(operation, AnnotateOperation) and operation.font_path is not None:
+            from PIL import ImageFont
+
+            try:
+                ImageFont.truetype(operation.font_path)
+            except OSError as e:
+                parser.error(f"Cannot load font '{operation.font_path}': {e}")
+
+    return AppConfig(
+        input_path=parsed.files,
+        operations=tuple(parsed.op),
+        output_directory=parsed.output_dir,
+        output_file_name_suffix=parsed.output_suffix,
+        allow_overwrite=parsed.overwrite,
+        output_format=parsed.output_format,
+        dry_run=parsed.dry_run,
+        verbose=parsed.verbose,
+        encoder=get_encoder_options(parsed),
+        batch=get_batch_options(parser, parsed),
+    )
+
+
+# Peak memory needed to process an image, relative to its decoded size. Each border or resize operation makes a new
+# copy of the image, and the previous copy is freed once the operation is done.
+PEAK_MEMORY_FACTOR = 4.0
+
+
+def estimate_peak_memory(input_path: Path, config: AppConfig) -> int:
+    """Estimates the peak memory needed by `process_image()`, in bytes, reading only the image header."""
+
+    from PIL import Image
+
+    from image_tools.common.image.imageio import get_decoded_image_size
+
+    with Image.open(input_path) as image:
+        return int(get_decoded_image_size(image) * PEAK_MEMORY_FACTOR)
+
+
+def estimate_cost(input_path: Path, config: AppConfig) -> tuple[str, float]:
+    """Gets the cost class and megapixels of an image to order a batch by, reading only the image header.
+    The class includes the operations, and whether they have anything to do for the image."""
+
+    from PIL import Image
+
+    with Image.open(input_path) as image:
+        format, size = image.format, image.size
+    cost_class = [format or "unknown"]
+    for operation in config.operations:
+        match operation:
+            case AnnotateOperation():
+                cost_class.append("annotate")
+            case BorderOperation():
+                if operation.existing_border_handling == ExistingBorderHandling.REPLACE:
+                    cost_class.append(f"border-detect-{operation.border_detection}")
+                else:
+                    cost_class.append("border")
+            case ResizeOperation():
+                if max(size) > operation.max_dimension:
+                    cost_class.append("resize")
+            case v:  # type: ignore
+                raise AssertionError(f"Unhandled Operation {v}")
+    return ",".join(cost_class), size[0] * size[1] / 1e6
+
+
+def plan_image(input_path: Path, output_path: Path, config: AppConfig) -> ReportRecord:
+    """Works out what `process_image()` would do, reading only the image header."""
+
+    from PIL import Image
+
+    from image_tools.common.image.sizing import clamp_max_dimension
+    from image_tools.instagramable.border import calculate_new_border_size
+
+    logger.info(f"Planning '{input_path}'")
+
+    # Only reads the header.
+    with Image.open(input_path) as image:
+        format, mode, input_size = image.format, image.mode, image.size
+
+    size = input_size
+    for operation in config.operations:
+        match operation:
+            case AnnotateOperation():
+                pass
+            case BorderOperation():
+                border = calculate_new_border_size(size, operation.border_baseline_size)
+                size = (size[0] + border.left + border.right, size[1] + border.top + border.bottom)
+            case ResizeOperation():
+                size = clamp_max_dimension(size, operation.max_dimension)
+            case v:  # type: ignore
+                raise AssertionError(f"Unhandled Operation {v}")
+    logger.info(f"Dry run: Would save {size_to_str(size)} image to '{output_path}'")
+
+    return {
+        "input": str(input_path),
+        "output": str(output_path),
+        "format": format,
+        "mode": mode,
+        "input_width": input_size[0],
+        "input_height": input_size[1],
+        "output_width": size[0],
+        "output_height": size[1],
+    }
+
+
+def read_image(input_path: Path, config: AppConfig) -> "SourceImage":
+    from image_tools.chain import processing
+
+    logger.info(f"Processing '{input_path}'")
+    return processing.read_image(input_path, config)
+
+
+def transform_image(source: "SourceImage", config: AppConfig) -> tuple["Image.Image", dict[str, Any]]:
+    from image_tools.chain import processing
+
+    return processing.transform_image(source, config)
+
+
+def write_image(output: tuple["Image.Image", dict[str, Any]], output_path: Path, config: AppConfig) -> None:
+    from image_tools.common.image.imageio import save_image
+
+    image, write_params = output
+    record_size("output", image.size)
+
+    # Create the output directory if required.
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.exists() and not config.allow_overwrite:
+        raise AppError(f"Would overwrite existing file: '{output_path}'")
+    with stage("save"):
+        save_image(image, output_path, get_format_from_path(output_path), write_params, config.encoder)
+    logger.info(f"Saved {size_to_str(image.size)} image to '{output_path}'")
+
+
+def process_image(input_path: Path, output_path: Path, config: AppConfig) -> None:
+    write_image(transform_image(read_image(input_path, config), config), output_path, config)
+
+
+PIPELINE = ImagePipeline(read_image, transform_image, write_image)
+
+
+def run(args: list[str]) -> None:
+    """Runs the command with its command line arguments."""
+
+    config = get_config(args)
+
+    if config.verbose:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+    suppress_external_logging()
+
+    log_config(config)
+
+    input_paths = iter_batch_input_paths(config.input_path, config.batch)
+    paths = iter_batch_paths(
+        input_paths,
+        config.output_directory,
+        config.output_file_name_suffix,
+        config.allow_overwrite,
+        config.output_format,
+        check_outputs=config.batch.check_outputs_early,
+    )
+    records: list[ReportRecord] = []
+    process_func = plan_image if config.dry_run else process_image
+    processed = run_batch(
+        process_func,
+        paths,
+        config,
+        config.batch,
+        records.append,
+        PIPELINE,
+        estimate_peak_memory,
+        cost_estimator=estimate_cost,
+    )
+    if processed == 0:
+        logger.info("No files to process")
+        return
+    if config.batch.report_path is not None:
+        write_report(records, config.batch.report_path)
+
+    logger.info("Success")
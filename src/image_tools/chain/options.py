@@ -0,0 +1,46 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from colour import Color
+
+from image_tools.annotate_info.options import AnnotationOptions, TextPosition
+from image_tools.common.image.encoding import EncoderOptions
+from image_tools.instagramable.options import BorderDetectionMode, ExistingBorderHandling
+
+
+@dataclass(frozen=True, kw_only=True)
+class AnnotateOperation:
+    """Writes image metadata onto the image, as `annotate-image-info` does."""
+
+    annotate: AnnotationOptions = AnnotationOptions(camera=True, lens=True, exposure=True)
+    text_position: TextPosition = TextPosition.TOP_LEFT
+    text_colour: Color = field(default_factory=lambda: Color("red"))
+    font_path: Path | None = None  # If none, use the default font
+
+
+@dataclass(frozen=True, kw_only=True)
+class BorderOperation:
+    """Adds a new border, optionally replacing an existing one, as `instagramable` does."""
+
+    existing_border_handling: ExistingBorderHandling = ExistingBorderHandling.REPLACE
+    border_detection: BorderDetectionMode = BorderDetectionMode.MULTI_RESOLUTION
+    border_colour: Color = field(default_factory=lambda: Color("white"))
+    border_baseline_size: float = 0.1  # Proportional to image size
+
+
+@dataclass(frozen=True, kw_only=True)
+class ResizeOperation:
+    """Downscales the image if it's larger than a maximum size."""
+
+    max_dimension: int = 2000
+
+
+Operation = AnnotateOperation | BorderOperation | ResizeOperation
+
+
+@dataclass(frozen=True, kw_only=True)
+class ProcessingOptions:
+    """Options which affect the output image."""
+
+    operations: tuple[Operation, ...]  # Applied in order
+    encoder: EncoderOptions = EncoderOptions()
@@ -0,0 +1,85 @@
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from PIL import Image
+
+from image_tools.annotate_info.text import create_annotation_text, draw_annotation_text
+from image_tools.chain.options import AnnotateOperation, BorderOperation, Operation, ProcessingOptions, ResizeOperation
+from image_tools.common.cli.stats import record_size, stage
+from image_tools.common.image.border import remove_border
+from image_tools.common.image.imageio import get_pil_image_write_params
+from image_tools.common.image.metadata import ImageMetadata, get_image_metadata
+from image_tools.instagramable.border import apply_new_border
+from image_tools.instagramable.options import ProcessingOptions as InstagramableOptions
+from image_tools.instagramable.processing import get_border_to_remove
+from image_tools.instagramable.sizing import adjust_image_size
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SourceImage:
+    """An input image, decoded and ready for the operations."""
+
+    image: Image.Image
+    metadata: ImageMetadata  # Of the input file, as operations may not preserve it on the image
+    write_params: dict[str, Any]  # To pass to `Image.save()`
+
+
+def read_image(file: Path | BinaryIO, options: ProcessingOptions) -> SourceImage:
+    # Note if the file is not a valid image, we fail everything. User probably needs to take action.
+    image = Image.open(file)
+
+    # We're trying to preserve as much as possible from the original image, so save the info now in case it's changed.
+    with stage("metadata"):
+        write_params = get_pil_image_write_params(image)
+        metadata = get_image_metadata(image)
+    record_size("input", image.size)
+
+    with stage("decode"):
+        image.load()
+
+    return SourceImage(image, metadata, write_params)
+
+
+def apply_operation(image: Image.Image, operation: Operation, metadata: ImageMetadata) -> Image.Image:
+    """Applies one operation. May modify `image` in place."""
+
+    match operation:
+        case AnnotateOperation():
+            annotation_text = create_annotation_text(metadata, operation.annotate)
+            with stage("draw_text"):
+                return draw_annotation_text(
+                    image, annotation_text, operation.text_position, operation.text_colour, operation.font_path
+                )
+        case BorderOperation():
+            with stage("detect_border"):
+                existing_border = get_border_to_remove(
+                    image,
+                    InstagramableOptions(
+                        existing_border_handling=operation.existing_border_handling,
+                        border_detection=operation.border_detection,
+                    ),
+                )
+            with stage("border"):
+                if existing_border is not None:
+                    image = remove_border(image, existing_border)
+                return apply_new_border(image, operation.border_colour, operation.border_baseline_size)
+        case ResizeOperation():
+            with stage("resize"):
+                return adjust_image_size(image, operation.max_dimension)
+        case v:  # type: ignore
+            raise AssertionError(f"Unhandled Operation {v}")
+
+
+def transform_image(source: SourceImage, options: ProcessingOptions) -> tuple[Image.Image, dict[str, Any]]:
+    """Applies the operations in order to a loaded image, which may be modified in place.
+
+    :return: New image, and params to pass to `Image.save()`."""
+
+    image = source.image
+    for operation in options.operations:
+        image = apply_operation(image, operation, source.metadata)
+    return image, source.write_params
@@ -0,0 +1,140 @@
+"""The `image-tools` command, which runs the image processing server or sends jobs to it, or runs a chain of the tools'
+operations on images.
+
+Only the standard library is imported up front, so the client commands start quickly."""
+
+import json
+import logging
+import signal
+import sys
+from argparse import REMAINDER, ArgumentDefaultsHelpFormatter, ArgumentParser, ArgumentTypeError, Namespace
+
+from image_tools.server.client import (
+    TOOLS,
+    Address,
+    get_default_address,
+    get_default_token,
+    get_metrics,
+    parse_address,
+    run_tool,
+)
+
+logger = logging.getLogger()
+
+
+def address_argument(text: str) -> Address:
+    try:
+        return parse_address(text)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+
+def get_args(args: list[str]) -> Namespace:
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    address_help = (
+        "Server address, HOST:PORT or unix:PATH. Defaults to $IMAGE_TOOLS_SERVER if set, otherwise a Unix socket only "
+        "the current user can access. TCP addresses require the server and clients to have the same "
+        "$IMAGE_TOOLS_SERVER_TOKEN."
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        help="Run a server which processes images with warm worker processes.",
+    )
+    serve_parser.add_argument("--address", type=address_argument, default=get_default_address(), help=address_help)
+    serve_parser.add_argument(
+        "--workers", type=int, default=None, help="Number of jobs run at once. Defaults to the number of CPUs."
+    )
+    serve_parser.add_argument(
+        "--max-queued",
+        type=int,
+        default=16,
+        help="Number of jobs which may wait for a worker. Further jobs are rejected until the queue has space.",
+    )
+    serve_parser.add_argument(
+        "--verbose", action="store_true", default=False, help="Print more information about the operation."
+    )
+
+    client_parser = subparsers.add_parser(
+        "client",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+        help="Run a tool on the server, with the same arguments as running it directly. Each job processes its images "
+        "with one process unless --jobs is given, as the server runs jobs in parallel.",
+    )
+    client_parser.add_argument("--address", type=address_argument, default=get_default_address(), help=address_help)
+    client_parser.add_argument("tool", choices=list(TOOLS), help="Tool to run.")
+    client_parser.add_argument("args", nargs=REMAINDER, help="Arguments for the tool.")
+
+    status_parser = subparsers.add_parser(
+        "status", formatter_class=ArgumentDefaultsHelpFormatter, help="Print the server's metrics."
+    )
+    status_parser.add_argument("--address", type=address_argument, default=get_default_address(), help=address_help)
+
+    # The run command parses its own arguments, so its options are only imported when it's used.
+    subparsers.add_parser(
+        "run",
+        add_help=False,
+        help="Apply several operations (annotate, border, resize) to images in order, decoding and saving each image "
+        "only once. See 'image-tools run --help'.",
+    )
+
+    # The run command's arguments are left unrecognised. (A REMAINDER argument wouldn't take arguments starting with
+    # `-` if they come first.)
+    parsed, unrecognised = parser.parse_known_args(args)
+    if parsed.command == "run":
+        parsed.args = unrecognised
+    elif unrecognised:
+        parser.error(f"unrecognized arguments: {' '.join(unrecognised)}")
+    if parsed.command == "serve":
+        if parsed.workers is not None and parsed.workers < 1:
+            serve_parser.error("--workers must be at least 1")
+        if parsed.max_queued < 0:
+            serve_parser.error("--max-queued must not be negative")
+    return parsed
+
+
+def serve(parsed: Namespace) -> None:
+    # Only the server needs the image processing libraries.
+    from image_tools.common.cli.batch import get_available_cpu_count
+    from image_tools.server.server import ServerOptions, serve
+
+    workers = parsed.workers if parsed.workers is not None else get_available_cpu_count()
+    # Shut down cleanly when stopped by a service manager.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        serve(ServerOptions(parsed.address, workers, parsed.max_queued, get_default_token()))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    logging.basicConfig(style="{", format="{levelname}: {message}")
+    try:
+        parsed = get_args(sys.argv[1:])
+        logger.setLevel(logging.DEBUG if getattr(parsed, "verbose", False) else logging.INFO)
+
+        match parsed.command:
+            case "serve":
+                serve(parsed)
+            case "client":
+                result = run_tool(parsed.address, parsed.tool, parsed.args)
+                sys.stdout.write(result.stdout)
+                sys.stderr.write(result.stderr)
+                sys.exit(result.exit_code)
+            case "status":
+                print(json.dumps(get_metrics(parsed.address), indent=2))
+            case "run":
+                from image_tools.chain.cli import run
+
+                run(parsed.args)
+            case v:  # type: ignore
+                raise AssertionError(f"Unhandled command {v}")
+    except Exception as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
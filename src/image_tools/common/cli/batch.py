@@ -1,53 +1,1273 @@
+import copyreg
+import hashlib
 import logging
+import os
 import os.path
-from collections.abc import Iterable
-from glob import glob
-from pathlib import Path
+import queue
+import re
+import signal
+import threading
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import partial
+from glob import iglob
+from itertools import chain, takewhile
+from pathlib import Path, PurePath
+from typing import TYPE_CHECKING, Any
+
+from colour import Color
 
 from image_tools.common.cli.exception import AppError
+from image_tools.common.cli.index_filter import INDEX_FIELDS, IndexFilter, parse_index_filter
+from image_tools.common.cli.logging import suppress_external_logging
+from image_tools.common.cli.stats import (
+    ImageStatsCollector,
+    StatsWriter,
+    collect_image_stats,
+    record_value,
+    stage,
+)
+from image_tools.common.cli.units import format_byte_size, parse_byte_size
+from image_tools.common.image.encoding import OutputFormat, get_format_from_path
+
+if TYPE_CHECKING:
+    from image_tools.common.cli.cache import ResultCache
+    from image_tools.common.cli.claims import WorkClaims
+    from image_tools.common.cli.schedule import CostEstimator, LargestFirstScheduler
 
 logger = logging.getLogger(__name__)
 
 
-def get_image_input_file_paths(name_or_glob: str) -> list[Path]:
+def iter_image_input_file_paths(
+    name_or_glob: str,
+    recursive: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    shard: tuple[int, int] | None = None,
+) -> Iterator[Path]:
     """Generic image input path handling.
-    Input may be: file name, directory name, file glob."""
+    Input may be: file name, directory name, file glob.
+    Paths are generated lazily, so processing can start before all input files are found.
+
+    :param recursive: Also find files in subdirectories of a directory, or match `**` in a glob.
+    :param include: If not empty, only files matching at least one of these patterns are used.
+    :param exclude: Files and directories matching any of these patterns are not used.
+        Patterns are matched against the path relative to the input directory (or the whole path for a glob) with
+        `PurePath.match()`, so a relative pattern like `*.jpg` can match at any depth.
+    :param shard: (index, count) to only use the files in one of `count` shards, numbered from 1. Files are assigned to
+        shards by their path relative to `get_input_root()`, so every machine agrees on the shards."""
 
     if os.path.isfile(name_or_glob):
         # If path is a file, process just that file.
         logger.info("Input path is a file")
-        return [Path(name_or_glob)]
+        if shard is None or is_in_shard(os.path.basename(name_or_glob), shard):
+            yield Path(name_or_glob)
     elif os.path.isdir(name_or_glob):
         # If path is a directory, process all files in that directory.
-        logger.info("Input path is a directory, will process all contained supported image files")
-        return [p for p in Path(name_or_glob).iterdir() if p.is_file() and is_image_file_supported(p)]
+        if recursive:
+            logger.info(
+                "Input path is a directory, will process all supported image files in it and its subdirectories"
+            )
+        else:
+            logger.info("Input path is a directory, will process all contained supported image files")
+        # Stack of (directory path, path relative to the input directory).
+        directories = [(name_or_glob, "")]
+        while directories:
+            directory, relative_directory = directories.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative_path = relative_directory + entry.name
+                    # DirEntry caches the file type from the directory listing, so this usually doesn't stat the file.
+                    if entry.is_file():
+                        if (
+                            is_image_file_supported(entry.name)
+                            and path_matches_filters(relative_path, include, exclude)
+                            and (shard is None or is_in_shard(relative_path.replace(os.sep, "/"), shard))
+                        ):
+                            yield Path(entry.path)
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        if not any(PurePath(relative_path).match(pattern) for pattern in exclude):
+                            directories.append((entry.path, relative_path + os.sep))
     else:
         # Otherwise, find files via glob.
-        logger.info("Input path is a glob, will process all matching files")
-        return [Path(p) for p in glob(name_or_glob) if os.path.isfile(p)]
+        logger.info("Input path is a glob, will process all matching supported image files")
+        root = get_input_root(name_or_glob)
+        for path in iglob(name_or_glob, recursive=recursive):
+            if (
+                is_image_file_supported(path)
+                and path_matches_filters(path, include, exclude)
+                and (shard is None or is_in_shard(get_relative_input_path(Path(path), root), shard))
+                and os.path.isfile(path)
+            ):
+                yield Path(path)
+
+
+def iter_batch_input_paths(name_or_glob: str, options: "BatchOptions") -> Iterator[Path]:
+    """Gets the input file paths for a batch with `iter_image_input_file_paths()`, or by watching for new files if
+    `BatchOptions.watch` is set. If `BatchOptions.index_path` is set, the paths are filtered with the image index."""
+
+    paths: Iterator[Path]
+    if options.watch:
+        from image_tools.common.cli.watch import iter_watched_image_paths
+
+        paths = iter_watched_image_paths(
+            name_or_glob,
+            options.recursive,
+            options.include,
+            options.exclude,
+            options.shard,
+            options.watch_settle_time,
+            options.watch_poll_interval,
+        )
+    else:
+        paths = iter_image_input_file_paths(
+            name_or_glob, options.recursive, options.include, options.exclude, options.shard
+        )
+    if options.index_path is not None:
+        from image_tools.common.cli.index import iter_indexed_image_paths
+
+        paths = iter_indexed_image_paths(paths, options.index_path, options.index_filters)
+    return paths
+
+
+def path_matches_filters(path: str, include: Sequence[str], exclude: Sequence[str]) -> bool:
+    """Checks if a path is selected by include and exclude patterns, as for `iter_image_input_file_paths()`."""
+
+    if not include and not exclude:
+        return True
+    pure_path = PurePath(path)
+    if include and not any(pure_path.match(pattern) for pattern in include):
+        return False
+    return not any(pure_path.match(pattern) for pattern in exclude)
+
+
+def get_input_root(name_or_glob: str) -> str:
+    """Gets the directory which input file paths are made relative to, so the same file can be identified on machines
+    which mount the input in different places: the input directory, the directory of an input file, or a glob's
+    directories before its first wildcard."""
+
+    if os.path.isdir(name_or_glob):
+        return name_or_glob
+    if os.path.isfile(name_or_glob):
+        return os.path.dirname(name_or_glob) or os.curdir
+    parts = PurePath(name_or_glob).parts
+    fixed_parts = list(takewhile(lambda part: not _GLOB_WILDCARD.search(part), parts[:-1]))
+    return str(PurePath(*fixed_parts)) if fixed_parts else os.curdir
+
+
+_GLOB_WILDCARD = re.compile(r"[*?[]")
+
+
+def get_relative_input_path(input_path: Path, input_root: str) -> str:
+    """Gets an input file's path relative to `get_input_root()`, with `/` separators on every platform."""
+
+    return PurePath(os.path.relpath(input_path, input_root)).as_posix()
+
+
+def is_in_shard(relative_path: str, shard: tuple[int, int]) -> bool:
+    """Checks if an input file is in a shard, as for `iter_image_input_file_paths()`. Uses a hash which is the same in
+    every process and on every machine, unlike `hash()`."""
+
+    index, count = shard
+    digest = hashlib.sha256(relative_path.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count == index - 1
 
 
 # TODO? make this configurable
-SUPPORTED_IMAGE_EXTENSIONS = frozenset((".jpg", ".jpeg", ".png", ".tif", ".tiff"))
+SUPPORTED_IMAGE_EXTENSIONS = frozenset((".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp"))
+
 
+def is_image_file_supported(p: str | os.PathLike[str]) -> bool:
+    return os.path.splitext(p)[1].lower() in SUPPORTED_IMAGE_EXTENSIONS
 
-def is_image_file_supported(p: Path) -> bool:
-    return p.suffix.lower() in SUPPORTED_IMAGE_EXTENSIONS
 
+def get_output_image_path(
+    input_path: Path, output_directory: Path | None, output_suffix: str, output_format: OutputFormat | None = None
+) -> Path:
+    """:param output_format: If set, the extension is changed to match, unless it already does."""
 
-def get_output_image_path(input_path: Path, output_directory: Path | None, output_suffix: str) -> Path:
     out_dir = output_directory or input_path.parent
     name = input_path.name
     if output_suffix:
         parts = name.split(".")
         parts[0] = parts[0] + output_suffix
         name = ".".join(parts)
-    return out_dir / name
+    output_path = out_dir / name
+    if output_format is not None and get_format_from_path(output_path) != output_format.name:
+        output_path = output_path.with_suffix(output_format.extension)
+    return output_path
+
+
+def check_output_path(output_path: Path, allow_overwrite: bool) -> None:
+    if not allow_overwrite and output_path.exists():
+        raise AppError(f"Would overwrite existing file: '{output_path}'")
+
+
+def iter_batch_paths(
+    input_paths: Iterable[Path],
+    output_directory: Path | None,
+    output_suffix: str,
+    allow_overwrite: bool,
+    output_format: OutputFormat | None = None,
+    check_outputs: bool = True,
+) -> Iterator[tuple[Path, Path]]:
+    """Pairs each input path with its output path.
+    Output paths are checked as they're generated, so the batch fails before the image would have been processed.
+
+    :param check_outputs: False to only check output paths when each image is written, see
+        `BatchOptions.check_outputs_early`."""
+
+    for input_path in input_paths:
+        output_path = get_output_image_path(input_path, output_directory, output_suffix, output_format)
+        if check_outputs:
+            check_output_path(output_path, allow_overwrite)
+        yield input_path, output_path
+
+
+def get_available_cpu_count() -> int:
+    """Number of CPUs this process may run on (which may be fewer than the number of CPUs in the system)."""
+
+    if hasattr(os, "process_cpu_count"):
+        count = os.process_cpu_count()
+    elif hasattr(os, "sched_getaffinity"):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count()
+    return count or 1
+
+
+@dataclass(frozen=True)
+class BatchOptions:
+    jobs: int  # Number of images processed in parallel
+    continue_on_error: bool  # If false, stop at the first failed image
+    recursive: bool  # Find input files in subdirectories
+    include: tuple[str, ...]  # Input file patterns to include (all if empty)
+    exclude: tuple[str, ...]  # Input file and directory patterns to exclude
+    cache_directory: Path | None  # Result cache location, if enabled
+    cache_size_limit: int  # Bytes
+    report_path: Path | None  # Where to write the dry run report, if requested
+    stats_path: Path | None  # Where to write processing stats, if requested ("-" for stdout)
+    pipeline_threads: tuple[int, int, int] | None  # Read, transform, write thread counts, if pipelining is enabled
+    memory_budget: int | None  # Bytes, for the estimated memory of all images in flight at once
+    shard: tuple[int, int] | None  # (index from 1, count) of the shard of input files to process, if sharding
+    claim_directory: Path | None  # Coordination directory to claim images in, if sharing work between processes
+    claim_timeout: float  # Seconds after which another process's claim is considered stale
+    journal_path: Path | None  # Where to record the progress of the batch, if requested
+    resume: bool  # Skip images which the journal records as finished
+    watch: bool  # Keep watching the input directory for new and changed files, instead of processing existing files
+    watch_settle_time: float  # Seconds a watched file must go unchanged for before it's processed
+    watch_poll_interval: float | None  # Seconds between checks for watched files, or None to use inotify if possible
+    index_path: Path | None  # Image index database to select input files with and plan from, if requested
+    index_filters: tuple[IndexFilter, ...]  # Conditions on indexed fields which input files must all meet
+    largest_first: bool  # Start the images predicted to take longest first
+    cost_model_path: Path | None  # Where to learn processing times per class of image for ordering, if requested
+
+    @property
+    def check_outputs_early(self) -> bool:
+        """Whether output paths can be checked before the batch starts processing them, with `iter_batch_paths()`.
+        With claims or when resuming, outputs of images which will be skipped may exist already, and when watching a
+        failed check mustn't stop the batch, so outputs are only checked when they're written."""
+
+        return self.claim_directory is None and not self.resume and not self.watch
+
+
+def add_batch_arguments(parser: ArgumentParser) -> None:
+    """Adds the arguments for `BatchOptions` to a parser."""
+
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of images to process in parallel. Defaults to the number of available CPUs, or 1 with "
+        "--pipeline-threads.",
+    )
+    parser.add_argument(
+        "--pipeline-threads",
+        type=parse_pipeline_threads,
+        default=None,
+        metavar="READ,TRANSFORM,WRITE",
+        help="Process images in a single process with a pipeline of reading, transforming and writing stages, each "
+        "with this many threads, so that file I/O, decoding, processing and encoding of different images overlap.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=parse_byte_size,
+        default=None,
+        help="Only start an image while the estimated memory needed by all images being processed stays within this "
+        "size, e.g. 8G. Estimates are made from each image's dimensions and mode. An image estimated to need more than "
+        "the budget is processed on its own.",
+    )
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        default=False,
+        help="Process files in subdirectories of the input directory, and allow ** in input globs.",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Only process files matching this pattern, e.g. '*.jpg' or '2024/*'. May be given multiple times.",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Don't process files or directories matching this pattern. May be given multiple times.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Directory of a cache of output images, used to skip images which were already processed with the same "
+        "options. Cached outputs are hard linked where possible, so don't modify outputs in place.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=parse_byte_size,
+        default="10G",
+        help="Maximum size of the output image cache. Least recently used outputs are removed first.",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help="With --dry-run, write the planned output of each image to this file. "
+        "CSV if the file extension is .csv, otherwise JSON.",
+    )
+    parser.add_argument(
+        "--stats",
+        type=Path,
+        default=None,
+        help="Write the time taken by each processing stage of each image, and a summary of the batch, as JSON lines "
+        "to this file. Use - for standard output.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="I/N",
+        help="Only process the I-th of N shards of the input files, numbered from 1, e.g. 2/4. Files are assigned to "
+        "shards by a hash of their path relative to the input directory, so N machines can each process a different "
+        "shard of the same input.",
+    )
+    parser.add_argument(
+        "--claim-dir",
+        type=Path,
+        default=None,
+        help="Coordination directory on a filesystem shared with other machines or processes running the same batch. "
+        "Each image is claimed before processing it, so they share the work without processing any image twice. "
+        "Images claimed by a process which stopped are taken over after --claim-timeout.",
+    )
+    parser.add_argument(
+        "--claim-timeout",
+        type=float,
+        default=600,
+        metavar="SECONDS",
+        help="With --claim-dir, how long before a claim on an unfinished image is considered abandoned. Must be longer "
+        "than any image takes to process.",
+    )
+    parser.add_argument(
+        "--journal",
+        type=Path,
+        default=None,
+        help="Record each image in this file as it's started and finished, and each output as it's written, so the "
+        "batch can be resumed with --resume if it stops part way through.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="With --journal, skip images which the journal records as finished by a previous run of the same batch. "
+        "Outputs written for images which were started but not finished are replaced.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="Keep running and process supported images as they're added to or changed in the input directory, until "
+        "interrupted with Ctrl+C. Images already in the directory aren't processed. Failed images don't stop "
+        "watching. Changed images are only processed again with --overwrite.",
+    )
+    parser.add_argument(
+        "--watch-settle",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="With --watch, how long a file must go unchanged for before it's processed, so files which are still "
+        "being written or copied aren't processed.",
+    )
+    parser.add_argument(
+        "--watch-poll",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="With --watch, check for changes at this interval instead of being notified of them by inotify. Needed "
+        "for network filesystems written to by other machines. Defaults to inotify where available, otherwise polling "
+        "every 5 seconds.",
+    )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=None,
+        help="SQLite database of the dimensions, mode and metadata of input files, updated for files which are new or "
+        "changed since they were last indexed. Used to select input files with --where and to plan dry runs, so "
+        "unchanged files aren't opened.",
+    )
+    parser.add_argument(
+        "--where",
+        type=parse_index_filter,
+        action="append",
+        default=[],
+        metavar="FIELD OP VALUE",
+        help="With --index, only process files whose indexed FIELD compares to VALUE, e.g. 'camera_model ~ x-t5' or "
+        "'width >= 3000'. OP is one of = != < <= > >=, or ~ for text containing VALUE. Text is compared ignoring case. "
+        f"Fields: {', '.join(INDEX_FIELDS)}. Filtering on border fields detects each file's existing border once. "
+        "May be given multiple times, and files must match all of them.",
+    )
+    parser.add_argument(
+        "--largest-first",
+        action="store_true",
+        default=False,
+        help="Read every input's header before starting, and start the images predicted to take longest first, so the "
+        "batch doesn't end with a few large images processing while other workers are idle. Images are predicted to "
+        "take time in proportion to their size, unless --cost-model has learned otherwise. Results are handled as "
+        "images finish rather than in input order.",
+    )
+    parser.add_argument(
+        "--cost-model",
+        type=Path,
+        default=None,
+        help="With --largest-first, JSON file of the time per megapixel taken by each format and kind of processing, "
+        "used to predict how long images take and updated with the times of this batch.",
+    )
+    parser.add_argument(
+        "--continue-on-error",
+        action="store_true",
+        default=False,
+        help="Keep processing the remaining images if an image fails, instead of stopping.",
+    )
+
+
+def parse_pipeline_threads(text: str) -> tuple[int, int, int]:
+    """Parses pipeline stage thread counts, e.g. `2,1,2`. For use as an argparse argument type."""
+
+    try:
+        read, transform, write = (int(part) for part in text.split(","))
+    except ValueError:
+        raise ArgumentTypeError(f"Expected 3 comma separated thread counts: '{text}'")
+    if min(read, transform, write) < 1:
+        raise ArgumentTypeError(f"Thread counts must be at least 1: '{text}'")
+    return read, transform, write
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """Parses a shard, e.g. `2/4`. For use as an argparse argument type."""
+
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ArgumentTypeError(f"Expected I/N: '{text}'")
+    if not 1 <= index <= count:
+        raise ArgumentTypeError(f"Shard must be from 1/N to N/N: '{text}'")
+    return index, count
+
+
+def get_batch_options(parser: ArgumentParser, parsed: Namespace) -> BatchOptions:
+    if parsed.pipeline_threads is not None:
+        if parsed.jobs not in (None, 1):
+            parser.error("--pipeline-threads processes images in a single process, so can't be used with --jobs")
+        jobs = 1
+    else:
+        jobs = parsed.jobs if parsed.jobs is not None else get_available_cpu_count()
+    if jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if parsed.report is not None and not parsed.dry_run:
+        parser.error("--report requires --dry-run")
+    if parsed.claim_dir is not None and parsed.dry_run:
+        parser.error("--claim-dir can't be used with --dry-run, which doesn't process images")
+    if parsed.claim_timeout <= 0:
+        parser.error("--claim-timeout must be positive")
+    if parsed.journal is not None and parsed.dry_run:
+        parser.error("--journal can't be used with --dry-run, which doesn't process images")
+    if parsed.resume and parsed.journal is None:
+        parser.error("--resume requires --journal")
+    if parsed.watch and parsed.dry_run:
+        parser.error("--watch can't be used with --dry-run")
+    if parsed.watch and parsed.resume:
+        parser.error("--watch only processes images added after it starts, so can't be used with --resume")
+    if parsed.watch_settle < 0:
+        parser.error("--watch-settle can't be negative")
+    if parsed.watch_poll is not None and parsed.watch_poll <= 0:
+        parser.error("--watch-poll must be positive")
+    if parsed.largest_first and parsed.watch:
+        parser.error("--largest-first needs every input before starting, so can't be used with --watch")
+    if parsed.cost_model is not None and not parsed.largest_first:
+        parser.error("--cost-model requires --largest-first")
+    if parsed.where and parsed.index is None:
+        parser.error("--where requires --index")
+    if parsed.journal is not None and parsed.claim_dir is not None:
+        parser.error("--journal can't be used with --claim-dir, which records finished images itself")
+    return BatchOptions(
+        jobs=jobs,
+        # A watch runs until it's interrupted, so a failed image mustn't stop it.
+        continue_on_error=parsed.continue_on_error or parsed.watch,
+        recursive=parsed.recursive,
+        include=tuple(parsed.include),
+        exclude=tuple(parsed.exclude),
+        cache_directory=parsed.cache_dir,
+        cache_size_limit=parsed.cache_size,
+        report_path=parsed.report,
+        stats_path=parsed.stats,
+        pipeline_threads=parsed.pipeline_threads,
+        memory_budget=parsed.memory_budget,
+        shard=parsed.shard,
+        claim_directory=parsed.claim_dir,
+        claim_timeout=parsed.claim_timeout,
+        journal_path=parsed.journal,
+        resume=parsed.resume,
+        watch=parsed.watch,
+        watch_settle_time=parsed.watch_settle,
+        watch_poll_interval=parsed.watch_poll,
+        index_path=parsed.index,
+        index_filters=tuple(parsed.where),
+        largest_first=parsed.largest_first,
+        cost_model_path=parsed.cost_model,
+    )
+
+
+# Signature of a tool's process_image(): input path, output path, app config.
+# May return a result for the image, e.g. a planning report record.
+ProcessImageFunc = Callable[[Path, Path, Any], Any]
+
+# Receives the results of ProcessImageFunc, in the main process.
+ResultHandler = Callable[[Any], None]
+
+# Estimates the peak memory needed to process an image, in bytes, from its input path and the app config.
+# Should only read the image header.
+MemoryEstimator = Callable[[Path, Any], int]
+
+# Called in the main process when an image is finished, with its input path and whether it was processed successfully.
+FinishedHandler = Callable[[Path, bool], None]
+
+# Gets every file written for an image from its output path and the app config, for tools which can write more than one
+# output per input. The output path from `iter_batch_paths()` is the first of them.
+OutputPathsFunc = Callable[[Path, Any], list[Path]]
+
+
+def _get_output_paths(output_path: Path, config: Any, output_paths_func: OutputPathsFunc | None) -> list[Path]:
+    return [output_path] if output_paths_func is None else output_paths_func(output_path, config)
+
+
+@dataclass(frozen=True)
+class ImagePipeline:
+    """A tool's process_image() split into stages, so that different images can be in different stages at the same time.
+    Each stage runs in its own thread pool. Pillow releases the GIL for most of decoding, resampling and encoding."""
+
+    read: Callable[[Path, Any], Any]  # (input path, app config) -> decoded image
+    transform: Callable[[Any, Any], Any]  # (decoded image, app config) -> output image
+    write: Callable[[Any, Path, Any], None]  # (output image, output path, app config)
+
+
+def run_batch(
+    process_func: ProcessImageFunc,
+    paths: Iterable[tuple[Path, Path]],
+    config: Any,
+    options: BatchOptions,
+    result_handler: ResultHandler | None = None,
+    pipeline: ImagePipeline | None = None,
+    memory_estimator: MemoryEstimator | None = None,
+    output_paths_func: OutputPathsFunc | None = None,
+    cost_estimator: "CostEstimator | None" = None,
+) -> int:
+    """Runs `process_func` for each (input path, output path) pair.
+
+    :param result_handler: Called with each non-None result of `process_func`, in input order, or in the order images
+        finish with `BatchOptions.largest_first`.
+    :param pipeline: `process_func` split into stages. Used instead of `process_func` if
+        `BatchOptions.pipeline_threads` is set, except for dry runs.
+    :param memory_estimator: Required to limit memory use by `BatchOptions.memory_budget`.
+    :param output_paths_func: Required if `process_func` writes more than one file per image, so they're all cached and
+        counted in stats.
+    :param cost_estimator: Required to order images by `BatchOptions.largest_first`.
+    :return: Number of images processed."""
+
+    scheduler = None
+    # The order doesn't matter for dry runs, which don't decode images, and they mustn't be learned from.
+    if options.largest_first and cost_estimator is not None and not config.dry_run:
+        from image_tools.common.cli.schedule import CostModel, LargestFirstScheduler
+
+        scheduler = LargestFirstScheduler(cost_estimator, config, CostModel(options.cost_model_path))
+        paths = scheduler.order(paths)
+    if options.watch:
+        # Outputs may be written to the watched directory.
+        paths = _skip_outputs_as_inputs(
+            paths, partial(_get_output_paths, config=config, output_paths_func=output_paths_func)
+        )
+    finished_handlers: list[FinishedHandler] = []
+    journal = None
+    if options.journal_path is not None and not config.dry_run:
+        from image_tools.common.cli.journal import BatchJournal
+
+        journal = BatchJournal(options.journal_path, options.resume)
+        paths = journal.iter_unfinished(
+            paths, partial(_get_output_paths, config=config, output_paths_func=output_paths_func)
+        )
+        finished_handlers.append(journal.finish)
+    claims = None
+    if options.claim_directory is not None and not config.dry_run:
+        from image_tools.common.cli.claims import WorkClaims
+
+        claims = WorkClaims(options.claim_directory, options.claim_timeout)
+        # Images are identified by their path relative to the input, as other machines may mount it elsewhere.
+        get_claim_key = partial(_get_claim_key, get_input_root(config.input_path))
+        paths = claims.iter_claimed(paths, get_claim_key)
+        finished_handlers.append(partial(_finish_claim, claims, get_claim_key))
+    finished_handler = partial(_call_finished_handlers, finished_handlers) if finished_handlers else None
+    if options.watch:
+        paths = _iter_with_idle(paths, WATCH_IDLE_INTERVAL)
+
+    # Nothing needs setting up if there are no images.
+    paths = iter(paths)
+    first_paths = next(paths, None)
+    if first_paths is None:
+        return 0
+    paths = chain([first_paths], paths)
+
+    cache = None
+    if options.cache_directory is not None:
+        from image_tools.common.cli.cache import ResultCache
+
+        cache = _CachedProcessImage(
+            process_func, ResultCache(options.cache_directory, options.cache_size_limit), output_paths_func
+        )
+        process_func = cache
+    if options.pipeline_threads is None or config.dry_run:
+        pipeline = None
+    # Images are processed one at a time anyway without parallelism, and dry runs don't decode images.
+    if options.memory_budget is not None and memory_estimator is not None and not config.dry_run:
+        memory_budget = _MemoryBudget(options.memory_budget, memory_estimator, config)
+    else:
+        memory_budget = None
+
+    with (
+        journal if journal is not None else nullcontext(),
+        claims if claims is not None else nullcontext(),
+        scheduler if scheduler is not None else nullcontext(),
+        StatsWriter(options.stats_path) if options.stats_path is not None else nullcontext() as stats_writer,
+    ):
+        # The scheduler learns from the stats of each image, even if they aren't written.
+        collect_stats = stats_writer is not None or scheduler is not None
+        if collect_stats:
+            process_func = _StatsProcessImage(process_func, output_paths_func)
+            result_handler = partial(_handle_stats_result, stats_writer, scheduler, result_handler)
+        # Once the largest images are started, the others are handled as they finish, so that waiting for a large image
+        # doesn't stop more images being started on the other workers.
+        in_order = scheduler is None
+        if pipeline is not None:
+            processed, failed = _run_batch_pipelined(
+                pipeline,
+                cache,
+                output_paths_func if collect_stats else None,
+                collect_stats,
+                paths,
+                config,
+                options,
+                result_handler,
+                memory_budget,
+                finished_handler,
+                in_order,
+            )
+        elif options.jobs == 1:
+            processed, failed = _run_batch_sequential(
+                process_func, paths, config, options, result_handler, finished_handler
+            )
+        else:
+            processed, failed = _run_batch_parallel(
+                process_func,
+                paths,
+                config,
+                options,
+                result_handler,
+                memory_budget,
+                finished_handler,
+                in_order,
+                journal.output_listener if journal is not None else None,
+            )
+    if failed:
+        raise AppError(f"Failed to process {failed} of {processed} images")
+    return processed
+
+
+# Outputs of the most recent images which `_skip_outputs_as_inputs()` remembers, so a batch which watches its input
+# directory indefinitely doesn't keep every output path. Outputs are noticed by the watch soon after they're written.
+MAX_REMEMBERED_OUTPUTS = 10000
+
+
+def _skip_outputs_as_inputs(
+    paths: Iterable[tuple[Path, Path]], get_output_paths: Callable[[Path], list[Path]]
+) -> Iterator[tuple[Path, Path]]:
+    """Skips inputs which are outputs of recent images in the batch."""
+
+    # Least recently written or seen first. Outputs seen as inputs are kept, as they're seen again if they're replaced.
+    outputs: OrderedDict[Path, None] = OrderedDict()
+
+    # The output directory may be spelled differently from the watched directory, e.g. relative or through a symlink.
+    def normalise(path: Path) -> Path:
+        return Path(os.path.realpath(path))
+
+    def remember(path: Path) -> None:
+        outputs[path] = None
+        outputs.move_to_end(path)
+        if len(outputs) > MAX_REMEMBERED_OUTPUTS:
+            outputs.popitem(last=False)
+
+    for input_path, output_path in paths:
+        if normalise(input_path) in outputs:
+            remember(normalise(input_path))
+            continue
+        for path in get_output_paths(output_path):
+            remember(normalise(path))
+        yield input_path, output_path
+
+
+# Seconds without new paths after which a watching batch handles the results of images which have finished.
+WATCH_IDLE_INTERVAL = 0.5
+
+# Yielded by `_iter_with_idle()` when no paths arrive for a while.
+_IDLE: Any = object()
+
+
+def _iter_with_idle(paths: Iterable[tuple[Path, Path]], interval: float) -> Iterator[tuple[Path, Path]]:
+    """Gets `paths` in a background thread, which may wait indefinitely for each path, yielding `_IDLE` every `interval`
+    seconds while there are none so that finished images can be handled in the meantime.
+    If interrupted with Ctrl+C, stops so that the images already started can finish."""
+
+    # Bounded, so paths aren't consumed (and e.g. claimed) far ahead of being processed.
+    items: queue.Queue[tuple[str, Any]] = queue.Queue(maxsize=1)
+
+    def produce() -> None:
+        try:
+            for item in paths:
+                items.put(("item", item))
+        except BaseException as e:
+            items.put(("error", e))
+        else:
+            items.put(("end", None))
+
+    threading.Thread(target=produce, name="batch-paths", daemon=True).start()
+    while True:
+        try:
+            kind, value = items.get(timeout=interval)
+        except queue.Empty:
+            yield _IDLE
+            continue
+        except KeyboardInterrupt:
+            logger.info("Interrupted, finishing the images already started")
+            return
+        match kind:
+            case "item":
+                yield value
+            case "error":
+                raise value
+            case _:
+                return
+
+
+def _call_finished_handlers(handlers: list[FinishedHandler], input_path: Path, succeeded: bool) -> None:
+    for handler in handlers:
+        handler(input_path, succeeded)
+
+
+def _get_claim_key(input_root: str, input_path: Path) -> str:
+    return get_relative_input_path(input_path, input_root)
+
+
+def _finish_claim(
+    claims: "WorkClaims", get_claim_key: Callable[[Path], str], input_path: Path, succeeded: bool
+) -> None:
+    if succeeded:
+        claims.complete(get_claim_key(input_path))
+    else:
+        # Let another process try it, or a later run.
+        claims.release(get_claim_key(input_path))
+
+
+@dataclass(frozen=True)
+class _CachedProcessImage:
+    """Wraps a tool's process_image() to reuse outputs from a `ResultCache`."""
+
+    process_func: ProcessImageFunc
+    cache: "ResultCache"
+    output_paths_func: OutputPathsFunc | None = None
+
+    def __call__(self, input_path: Path, output_path: Path, config: Any) -> Any:
+        if config.dry_run:
+            return self.process_func(input_path, output_path, config)
+        key = self.restore(input_path, output_path, config)
+        if key is not None:
+            self.process_func(input_path, output_path, config)
+            self.store(key, output_path, config)
+
+    def restore(self, input_path: Path, output_path: Path, config: Any) -> str | None:
+        """Restores the outputs for an image from the cache, if they're all there.
+
+        :return: None if the outputs were restored, otherwise the key to store the outputs under once they're
+            created."""
+
+        # The tool is identified by the module of its process_image().
+        key = self.cache.get_key(input_path, self.process_func.__module__, config)
+        output_paths = _get_output_paths(output_path, config, self.output_paths_func)
+        for path in output_paths:
+            check_output_path(path, config.allow_overwrite)
+        with stage("cache_restore"):
+            restored: list[Path] = []
+            for index, path in enumerate(output_paths):
+                if not self.cache.restore(self._get_output_key(key, index), path):
+                    break
+                restored.append(path)
+            if len(restored) < len(output_paths):
+                # Don't leave some of the outputs behind, as they'd block writing the new outputs.
+                for path in restored:
+                    path.unlink()
+        record_value("cached", len(restored) == len(output_paths))
+        if len(restored) == len(output_paths):
+            outputs = ", ".join(f"'{path}'" for path in output_paths)
+            logger.info(f"Reused cached output for '{input_path}': {outputs}")
+            return None
+        return key
+
+    def store(self, key: str, output_path: Path, config: Any) -> None:
+        with stage("cache_store"):
+            for index, path in enumerate(_get_output_paths(output_path, config, self.output_paths_func)):
+                self.cache.store(self._get_output_key(key, index), path)
+
+    @staticmethod
+    def _get_output_key(key: str, index: int) -> str:
+        # The first output uses the image's key, so single output tools are unaffected.
+        return key if index == 0 else f"{key}-{index}"
+
+
+@dataclass(frozen=True)
+class _StatsResult:
+    result: Any  # Return value of the process function
+    record: dict[str, Any]  # Stats record for the image
+
+
+@dataclass(frozen=True)
+class _StatsProcessImage:
+    """Wraps a tool's process_image() to collect stats about it."""
+
+    process_func: ProcessImageFunc
+    output_paths_func: OutputPathsFunc | None = None
+
+    def __call__(self, input_path: Path, output_path: Path, config: Any) -> _StatsResult:
+        output_paths = _get_output_paths(output_path, config, self.output_paths_func)
+        with collect_image_stats(
+            input_path, output_path, writes_output=not config.dry_run, other_output_paths=output_paths[1:]
+        ) as record:
+            result = self.process_func(input_path, output_path, config)
+        return _StatsResult(result, record)
+
+
+def _handle_stats_result(
+    stats_writer: StatsWriter | None,
+    scheduler: "LargestFirstScheduler | None",
+    result_handler: ResultHandler | None,
+    stats_result: "_StatsResult",
+) -> None:
+    if stats_writer is not None:
+        stats_writer.add(stats_result.record)
+    if scheduler is not None:
+        scheduler.learn(stats_result.record)
+    if stats_result.result is not None and result_handler is not None:
+        result_handler(stats_result.result)
+
+
+def _handle_image_error(input_path: Path, message: str, options: BatchOptions) -> None:
+    if options.continue_on_error:
+        logger.error(f"Failed to process '{input_path}': {message}")
+    else:
+        raise AppError(message)
+
+
+def _run_batch_sequential(
+    process_func: ProcessImageFunc,
+    paths: Iterable[tuple[Path, Path]],
+    config: Any,
+    options: BatchOptions,
+    result_handler: ResultHandler | None,
+    finished_handler: FinishedHandler | None = None,
+) -> tuple[int, int]:
+    processed = 0
+    failed = 0
+    for batch_paths in paths:
+        if batch_paths is _IDLE:
+            continue
+        input_path, output_path = batch_paths
+        processed += 1
+        try:
+            result = process_func(input_path, output_path, config)
+        except Exception as e:
+            failed += 1
+            if finished_handler is not None:
+                finished_handler(input_path, False)
+            _handle_image_error(input_path, str(e), options)
+        else:
+            if finished_handler is not None:
+                finished_handler(input_path, True)
+            if result is not None and result_handler is not None:
+                result_handler(result)
+    return processed, failed
+
+
+def _run_batch_parallel(
+    process_func: ProcessImageFunc,
+    paths: Iterable[tuple[Path, Path]],
+    config: Any,
+    options: BatchOptions,
+    result_handler: ResultHandler | None,
+    memory_budget: "_MemoryBudget | None",
+    finished_handler: FinishedHandler | None = None,
+    in_order: bool = True,
+    output_listener: Callable[[Path], None] | None = None,
+) -> tuple[int, int]:
+    processed = 0
+    failed = 0
+    # Imported here as multiprocessing is slow to import, and most runs don't need it.
+    from concurrent.futures import ProcessPoolExecutor
+
+    log_level = logging.getLogger().getEffectiveLevel()
+    # While watching, Ctrl+C stops the batch gracefully, so the workers should finish the images they've started.
+    with ProcessPoolExecutor(
+        max_workers=options.jobs,
+        initializer=_init_worker_process,
+        initargs=(log_level, options.watch, output_listener),
+    ) as executor:
+        # Results are consumed in submission order unless `in_order` is false, so the log output reads the same as a
+        # sequential run. Only a bounded number of images are in flight so that `paths` can be consumed lazily.
+        # Each entry is (input path, future, estimated memory).
+        pending: deque[tuple[Path, Future[_WorkerResult], int]] = deque()
+
+        def handle_next_result() -> None:
+            nonlocal failed
+            input_path, future, memory = _pop_next_pending(pending, in_order)
+            if memory_budget is not None:
+                memory_budget.release(memory)
+            result = future.result()
+            for record in result.log_records:
+                logging.getLogger(record.name).handle(record)
+            if finished_handler is not None:
+                finished_handler(input_path, result.error is None)
+            if result.error is not None:
+                failed += 1
+                _handle_image_error(input_path, result.error, options)
+            elif result.result is not None and result_handler is not None:
+                result_handler(result.result)
+
+        try:
+            for batch_paths in paths:
+                if batch_paths is _IDLE:
+                    while pending and pending[0][1].done():
+                        handle_next_result()
+                    continue
+                input_path, output_path = batch_paths
+                processed += 1
+                memory = 0
+                if memory_budget is not None:
+                    memory = memory_budget.estimate(input_path)
+                    while pending and not memory_budget.fits(memory):
+                        handle_next_result()
+                    memory_budget.acquire(memory)
+                future = executor.submit(_process_in_worker, process_func, input_path, output_path, config)
+                pending.append((input_path, future, memory))
+                if len(pending) >= 2 * options.jobs:
+                    handle_next_result()
+            while pending:
+                handle_next_result()
+        except BaseException:
+            # Fail fast: don't start any more images.
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+    return processed, failed
+
+
+def _run_batch_pipelined(
+    pipeline: ImagePipeline,
+    cache: _CachedProcessImage | None,
+    output_paths_func: OutputPathsFunc | None,
+    collect_stats: bool,
+    paths: Iterable[tuple[Path, Path]],
+    config: Any,
+    options: BatchOptions,
+    result_handler: ResultHandler | None,
+    memory_budget: "_MemoryBudget | None",
+    finished_handler: FinishedHandler | None = None,
+    in_order: bool = True,
+) -> tuple[int, int]:
+    assert options.pipeline_threads is not None
+    read_threads, transform_threads, write_threads = options.pipeline_threads
+    processed = 0
+    failed = 0
+    with (
+        ThreadPoolExecutor(read_threads, thread_name_prefix="read") as readers,
+        ThreadPoolExecutor(transform_threads, thread_name_prefix="transform") as transformers,
+        ThreadPoolExecutor(write_threads, thread_name_prefix="write") as writers,
+    ):
+        # As for _run_batch_parallel(), results are handled in input order and the number of images in flight is
+        # bounded, which also bounds the number of decoded images held in memory.
+        pending: deque[tuple[Path, Future[Any], int]] = deque()
+
+        def handle_next_result() -> None:
+            nonlocal failed
+            input_path, future, memory = _pop_next_pending(pending, in_order)
+            if memory_budget is not None:
+                memory_budget.release(memory)
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                if finished_handler is not None:
+                    finished_handler(input_path, False)
+                _handle_image_error(input_path, str(e), options)
+            else:
+                if finished_handler is not None:
+                    finished_handler(input_path, True)
+                if result is not None and result_handler is not None:
+                    result_handler(result)
+
+        try:
+            for batch_paths in paths:
+                if batch_paths is _IDLE:
+                    while pending and pending[0][1].done():
+                        handle_next_result()
+                    continue
+                input_path, output_path = batch_paths
+                processed += 1
+                memory = 0
+                if memory_budget is not None:
+                    memory = memory_budget.estimate(input_path)
+                    while pending and not memory_budget.fits(memory):
+                        handle_next_result()
+                    memory_budget.acquire(memory)
+                image = _PipelinedImage(
+                    pipeline, cache, input_path, output_path, config, collect_stats, output_paths_func
+                )
+                future = readers.submit(image.read)
+                future = _submit_when_done(future, transformers, image.transform)
+                future = _submit_when_done(future, writers, image.write)
+                pending.append((input_path, future, memory))
+                if len(pending) >= 2 * sum(options.pipeline_threads):
+                    handle_next_result()
+            while pending:
+                handle_next_result()
+        except BaseException:
+            # Fail fast: don't start any more images. Images already in a later stage fail to be submitted.
+            for executor in (readers, transformers, writers):
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return processed, failed
+
+
+def _pop_next_pending(pending: deque[tuple[Path, Future[Any], int]], in_order: bool) -> tuple[Path, Future[Any], int]:
+    """Removes the next image to handle from the images in flight: the first one, or if not `in_order`, the first one
+    to finish."""
+
+    if not in_order:
+        wait([future for _, future, _ in pending], return_when=FIRST_COMPLETED)
+        for index, entry in enumerate(pending):
+            if entry[1].done():
+                del pending[index]
+                return entry
+    return pending.popleft()
+
+
+class _MemoryBudget:
+    """Tracks the estimated memory needed by the images being processed, against `BatchOptions.memory_budget`.
+    Only used from the main thread."""
+
+    def __init__(self, limit: int, estimator: MemoryEstimator, config: Any) -> None:
+        self.limit = limit
+        self.estimator = estimator
+        self.config = config
+        self.in_use = 0
+
+    def estimate(self, input_path: Path) -> int:
+        try:
+            memory = self.estimator(input_path, self.config)
+        except Exception as e:
+            # The image will most likely fail to be processed too, which is reported then.
+            logger.debug(f"Failed to estimate memory for '{input_path}': {e}")
+            return 0
+        if memory > self.limit:
+            logger.warning(
+                f"'{input_path}' is estimated to need {format_byte_size(memory)} of memory, more than the memory "
+                "budget, so will be processed on its own"
+            )
+        return memory
+
+    def fits(self, memory: int) -> bool:
+        return self.in_use + memory <= self.limit
+
+    def acquire(self, memory: int) -> None:
+        self.in_use += memory
+
+    def release(self, memory: int) -> None:
+        self.in_use -= memory
+
+
+# Passed through the pipeline in place of an image whose output was restored from the cache.
+_RESTORED = object()
+
+
+class _PipelinedImage:
+    """The stages of processing one image with an `ImagePipeline`."""
+
+    def __init__(
+        self,
+        pipeline: ImagePipeline,
+        cache: _CachedProcessImage | None,
+        input_path: Path,
+        output_path: Path,
+        config: Any,
+        collect_stats: bool,
+        output_paths_func: OutputPathsFunc | None = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.cache = cache
+        self.input_path = input_path
+        self.output_path = output_path
+        self.config = config
+        self.cache_key: str | None = None
+        if collect_stats:
+            output_paths = _get_output_paths(output_path, config, output_paths_func)
+            self.stats = ImageStatsCollector(input_path, output_path, output_paths[1:])
+        else:
+            self.stats = None
+
+    def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        return func(*args) if self.stats is None else self.stats.run(func, *args)
+
+    def read(self) -> Any:
+        if self.cache is not None:
+            self.cache_key = self._run(self.cache.restore, self.input_path, self.output_path, self.config)
+            if self.cache_key is None:
+                return _RESTORED
+        return self._run(self.pipeline.read, self.input_path, self.config)
+
+    def transform(self, source: Any) -> Any:
+        if source is _RESTORED:
+            return _RESTORED
+        return self._run(self.pipeline.transform, source, self.config)
+
+    def write(self, output: Any) -> "_StatsResult | None":
+        if output is not _RESTORED:
+            self._run(self.pipeline.write, output, self.output_path, self.config)
+            if self.cache is not None and self.cache_key is not None:
+                self._run(self.cache.store, self.cache_key, self.output_path, self.config)
+        return None if self.stats is None else _StatsResult(None, self.stats.finish())
+
+
+def _submit_when_done(future: Future[Any], executor: Executor, func: Callable[[Any], Any]) -> Future[Any]:
+    """Submits `func` to `executor` with the result of `future` once it's done.
+
+    :return: Future for the result of `func`, or the exception of either."""
+
+    chained: Future[Any] = Future()
+
+    def submit(done: Future[Any]) -> None:
+        if done.cancelled():
+            chained.cancel()
+        elif (error := done.exception()) is not None:
+            chained.set_exception(error)
+        else:
+            try:
+                submitted = executor.submit(func, done.result())
+            except RuntimeError as e:
+                # The executor was shut down after another image failed.
+                chained.set_exception(e)
+            else:
+                submitted.add_done_callback(partial(_copy_future_outcome, chained))
+
+    future.add_done_callback(submit)
+    return chained
+
+
+def _copy_future_outcome(destination: Future[Any], source: Future[Any]) -> None:
+    if source.cancelled():
+        destination.cancel()
+    elif (error := source.exception()) is not None:
+        destination.set_exception(error)
+    else:
+        destination.set_result(source.result())
+
+
+@dataclass(frozen=True)
+class _WorkerResult:
+    log_records: list[logging.LogRecord]
+    result: Any  # Return value of the process function
+    error: str | None  # Error message if processing failed
+
+
+class _CaptureLogHandler(logging.Handler):
+    """Collects log records so they can be sent back to the main process."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Arguments and exception info may not be picklable, so flatten them into the message now.
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+_worker_log_handler: _CaptureLogHandler | None = None
+
+
+def _init_worker_process(
+    log_level: int, ignore_interrupts: bool = False, output_listener: Callable[[Path], None] | None = None
+) -> None:
+    global _worker_log_handler
+    if ignore_interrupts:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if output_listener is not None:
+        from image_tools.common.image.imageio import set_output_listener
+
+        set_output_listener(output_listener)
+    _worker_log_handler = _CaptureLogHandler()
+    root_logger = logging.getLogger()
+    root_logger.handlers = [_worker_log_handler]
+    root_logger.setLevel(log_level)
+    suppress_external_logging()
+
+
+def _process_in_worker(
+    process_func: ProcessImageFunc, input_path: Path, output_path: Path, config: Any
+) -> _WorkerResult:
+    assert _worker_log_handler is not None
+    _worker_log_handler.records = []
+    result = None
+    error = None
+    try:
+        result = process_func(input_path, output_path, config)
+    except Exception as e:
+        error = str(e)
+    return _WorkerResult(_worker_log_handler.records, result, error)
+
+
+def _make_colour(hsl: tuple[float, float, float]) -> Color:
+    return Color(hsl=hsl)
 
 
-def validate_output_paths(output_paths: Iterable[Path], allow_overwrite: bool) -> None:
-    if not allow_overwrite:
-        existing = [path for path in output_paths if path.exists()]
-        if existing:
-            existing_str = ",".join(f"'{path}'" for path in existing)
-            raise AppError(f"Would overwrite existing files: {existing_str}")
+# Color stores a lambda internally and so can't be pickled by default, which would prevent configs from being sent to
+# worker processes.
+copyreg.pickle(Color, lambda colour: (_make_colour, (colour.hsl,)))
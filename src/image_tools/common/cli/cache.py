@@ -0,0 +1,179 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+# App config fields which don't affect the content of an output image.
+NON_OUTPUT_CONFIG_FIELDS = frozenset(
+    ("input_path", "output_directory", "output_file_name_suffix", "allow_overwrite", "dry_run", "verbose", "batch")
+)
+
+
+def get_tool_version() -> str:
+    try:
+        return version("image_tools")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def get_config_fingerprint(config: Any) -> dict[str, str]:
+    """Gets the app config fields which affect the output image, in a form suitable for hashing."""
+
+    assert dataclasses.is_dataclass(config)
+    return {
+        field.name: repr(getattr(config, field.name))
+        for field in dataclasses.fields(config)
+        if field.name not in NON_OUTPUT_CONFIG_FIELDS
+    }
+
+
+class ResultCache:
+    """On-disk cache of output images, keyed by the content of the input file and everything which affects the output.
+    Least recently used entries are evicted when the cache exceeds its size limit.
+    Safe to use from multiple processes and threads at once."""
+
+    def __init__(self, directory: Path, size_limit: int) -> None:
+        """:param size_limit: Maximum total size of cached outputs, in bytes."""
+
+        self.directory = directory
+        self.size_limit = size_limit
+        # Opened on first use in each thread, as SQLite connections can't be shared between threads, and so the cache
+        # can be pickled and sent to worker processes.
+        self._local = threading.local()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"directory": self.directory, "size_limit": self.size_limit}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.directory / "index.sqlite3", timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS inputs (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, last_access REAL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def get_key(self, input_path: Path, tool: str, config: Any) -> str:
+        """Gets the cache key for processing `input_path` with a tool and its app config."""
+
+        key_data = {
+            "tool": tool,
+            "version": get_tool_version(),
+            "config": get_config_fingerprint(config),
+            "input": self.get_input_digest(input_path),
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def get_input_digest(self, input_path: Path) -> str:
+        """Gets the hash of an input file's content.
+        The hash is remembered, and only recalculated if the file's size or modification time changes."""
+
+        path = str(input_path.resolve())
+        stat = input_path.stat()
+        row = self.connection.execute(
+            "SELECT digest FROM inputs WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        with open(input_path, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO inputs VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, digest)
+        )
+        return digest
+
+    def get_object_path(self, key: str) -> Path:
+        return self.directory / "objects" / key[:2] / key
+
+    def restore(self, key: str, output_path: Path) -> bool:
+        """Writes the cached output for `key` to `output_path`, replacing any existing file.
+        The output is hard linked to the cache where possible.
+
+        :return: True if the output was in the cache."""
+
+        object_path = self.get_object_path(key)
+        cursor = self.connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        if cursor.rowcount == 0 or not object_path.exists():
+            return False
+        # Imported here as it imports Pillow.
+        from image_tools.common.image.imageio import notify_output
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        notify_output(output_path)
+        output_path.unlink(missing_ok=True)
+        try:
+            os.link(object_path, output_path)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime.
+            return False
+        except OSError:
+            # E.g. output is on a different filesystem.
+            shutil.copyfile(object_path, output_path)
+        return True
+
+    def store(self, key: str, output_path: Path) -> None:
+        """Adds an output file to the cache, then evicts entries if the cache is too large."""
+
+        object_path = self.get_object_path(key)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        # Copy rather than link, so the cache can't be affected by whatever happens to the output later.
+        # Copy to a temporary file first so other processes never see a partial file.
+        with NamedTemporaryFile(dir=object_path.parent, delete=False) as temp_file:
+            with open(output_path, "rb") as output_file:
+                shutil.copyfileobj(output_file, temp_file)
+        # Temporary files are only readable by the owner, but outputs restored from the cache should look the same as
+        # any other output.
+        shutil.copymode(output_path, temp_file.name)
+        os.replace(temp_file.name, object_path)
+        size = object_path.stat().st_size
+        self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, size, time.time()))
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache is within its size limit."""
+
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                (total_size,) = cursor.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+                evicted = []
+                if total_size > self.size_limit:
+                    for key, size in cursor.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                        if total_size <= self.size_limit:
+                            break
+                        evicted.append(key)
+                        total_size -= size
+                    cursor.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        for key in evicted:
+            self.get_object_path(key).unlink(missing_ok=True)
+        if evicted:
+            logger.debug(f"Evicted {len(evicted)} entries from the result cache")
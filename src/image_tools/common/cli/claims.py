@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import secrets
+import socket
+import time
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class WorkClaims:
+    """Claim files in a directory shared by several processes, possibly on different machines, so that each image of a
+    batch is processed by only one of them.
+
+    Each image has a claim file while it's being processed, and a done file once it's processed. Files are created with
+    `O_EXCL`, and claims are moved away before they're removed, which are atomic even on NFS. A claim older than
+    `timeout` is assumed to be left by a process which crashed, and can be taken over."""
+
+    def __init__(self, directory: Path, timeout: float) -> None:
+        """:param timeout: Seconds after which a claim is stale. Must be longer than any image takes to process."""
+
+        self.directory = directory
+        self.timeout = timeout
+        # Unique even if a process on the same host later has the same PID.
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(4)}"
+        self._held: set[str] = set()
+
+    def __enter__(self) -> "WorkClaims":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        # Release claims for images which weren't finished, e.g. after a failure stopped the batch, so other processes
+        # don't have to wait for them to become stale.
+        for key in list(self._held):
+            self.release(key)
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.directory / (hashlib.sha256(key.encode()).hexdigest()[:32] + suffix)
+
+    def claim(self, key: str) -> bool:
+        """Claims an image, identified by `key`, which should be the same for every process.
+
+        :return: True if this process should process the image, false if it's done or claimed by another process."""
+
+        claim_path = self._path(key, ".claim")
+        done_path = self._path(key, ".done")
+        if done_path.exists():
+            return False
+        if not self._create_claim(claim_path, key):
+            if not self._remove_stale_claim(claim_path, key) or not self._create_claim(claim_path, key):
+                return False
+        # Another process may have finished the image between checking and claiming it.
+        if done_path.exists():
+            claim_path.unlink(missing_ok=True)
+            return False
+        self._held.add(key)
+        return True
+
+    def _create_claim(self, claim_path: Path, key: str) -> bool:
+        try:
+            fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as file:
+            # For anyone looking at the directory.
+            json.dump({"input": key, "owner": self.owner, "time": time.time()}, file)
+        return True
+
+    def _is_stale(self, claim_stat: os.stat_result, claim: dict[str, Any]) -> bool:
+        return time.time() - claim_stat.st_mtime >= self.timeout
+
+    def _is_own(self, claim_stat: os.stat_result, claim: dict[str, Any]) -> bool:
+        return claim.get("owner") == self.owner
+
+    def _remove_claim(self, claim_path: Path, should_remove: Callable[[os.stat_result, dict[str, Any]], bool]) -> bool:
+        """Removes a claim if `should_remove(stat, claim)` is true of it.
+
+        The claim is first moved to a name only this process uses and checked there, so the claim removed is the one
+        which was checked, even if other processes replace the claim at the same time. If the check fails, the claim is
+        put back.
+
+        :return: True if this process removed the claim."""
+
+        moved_path = claim_path.with_name(f"{claim_path.name}.{self.owner}.{secrets.token_hex(4)}")
+        try:
+            os.rename(claim_path, moved_path)
+        except FileNotFoundError:
+            return False
+        try:
+            claim = json.loads(moved_path.read_text())
+        except (OSError, ValueError):
+            # Still being written by the process which created it.
+            claim = {}
+        if should_remove(moved_path.stat(), claim if isinstance(claim, dict) else {}):
+            moved_path.unlink()
+            return True
+        try:
+            # Unlike renaming, linking fails rather than replacing a claim which another process created meanwhile.
+            os.link(moved_path, claim_path)
+        except FileExistsError:
+            logger.warning(f"Lost claim by {claim.get('owner')} for '{claim.get('input')}', it may be processed twice")
+        moved_path.unlink()
+        return False
+
+    def _remove_stale_claim(self, claim_path: Path, key: str) -> bool:
+        """:return: True if the claim was stale and this process removed it."""
+
+        try:
+            claim_stat = claim_path.stat()
+        except FileNotFoundError:
+            # Released in the meantime.
+            return True
+        # Checked before moving the claim too, so claims which are in use are usually left alone.
+        if not self._is_stale(claim_stat, {}):
+            return False
+        # Only one process can move the stale claim away, and another process may have replaced it with a new claim
+        # after this one saw it, which _remove_claim() checks for.
+        if not self._remove_claim(claim_path, self._is_stale):
+            return False
+        logger.warning(f"Taking over stale claim for '{key}', claimed {time.time() - claim_stat.st_mtime:.0f}s ago")
+        return True
+
+    def complete(self, key: str) -> None:
+        """Marks a claimed image as done, so no process will process it again."""
+
+        self._held.discard(key)
+        try:
+            fd = os.open(self._path(key, ".done"), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            # Finished by a process which took over the claim.
+            pass
+        else:
+            with os.fdopen(fd, "w") as file:
+                json.dump({"input": key, "owner": self.owner, "time": time.time()}, file)
+        # A process which took over the claim is still processing the image, so its claim is left for it to complete.
+        if not self._remove_claim(self._path(key, ".claim"), self._is_own):
+            logger.warning(f"Claim for '{key}' was taken over by another process, it may have been processed twice")
+
+    def release(self, key: str) -> None:
+        """Gives up a claimed image without processing it, so another process can claim it."""
+
+        self._held.discard(key)
+        if not self._remove_claim(self._path(key, ".claim"), self._is_own):
+            logger.debug(f"Claim for '{key}' was taken over by another process")
+
+    def iter_claimed(
+        self, paths: Iterable[tuple[Path, Path]], get_key: Callable[[Path], str]
+    ) -> Iterator[tuple[Path, Path]]:
+        """Filters batch paths to the images this process claims. Images are claimed lazily, as they're consumed.
+
+        :param get_key: Gets the key of an input path."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for input_path, output_path in paths:
+            if self.claim(get_key(input_path)):
+                yield input_path, output_path
+            else:
+                logger.debug(f"Skipping '{input_path}', claimed by another process")
@@ -0,0 +1,61 @@
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from collections.abc import Callable
+
+from image_tools.common.image.encoding import EncoderOptions, EncoderProfile, OutputFormat
+
+
+def int_in_range(minimum: int, maximum: int) -> Callable[[str], int]:
+    def parse(text: str) -> int:
+        try:
+            value = int(text)
+        except ValueError:
+            raise ArgumentTypeError(f"invalid integer '{text}'")
+        if not minimum <= value <= maximum:
+            raise ArgumentTypeError(f"must be from {minimum} to {maximum}")
+        return value
+
+    return parse
+
+
+def add_encoder_arguments(parser: ArgumentParser) -> None:
+    """Adds the arguments for `EncoderOptions` and the output format to a parser."""
+
+    parser.add_argument(
+        "--output-format",
+        type=OutputFormat,
+        choices=list(OutputFormat),
+        default=None,
+        help="Format to write output images in. The output file extension is changed to match. "
+        "Defaults to the same format as the input.",
+    )
+    parser.add_argument(
+        "--encoder-profile",
+        type=EncoderProfile,
+        choices=list(EncoderProfile),
+        default=EncoderProfile.ARCHIVAL,
+        help="Trade-off between output quality, file size and encoding time. "
+        f"{EncoderProfile.FAST}: Quickest to encode, smaller files with some quality loss. "
+        f"{EncoderProfile.BALANCED}: High quality, without the slowest encoder options. "
+        f"{EncoderProfile.ARCHIVAL}: Best quality, slowest to encode. WebP output uses quality 95 rather than Pillow's "
+        "default of 80.",
+    )
+    parser.add_argument(
+        "--png-compress-level",
+        type=int_in_range(0, 9),
+        default=None,
+        help="PNG compression level, from 0 (none) to 9 (smallest). Overrides the encoder profile.",
+    )
+    parser.add_argument(
+        "--webp-method",
+        type=int_in_range(0, 6),
+        default=None,
+        help="WebP compression method, from 0 (fastest) to 6 (smallest). Overrides the encoder profile.",
+    )
+
+
+def get_encoder_options(parsed: Namespace) -> EncoderOptions:
+    return EncoderOptions(
+        profile=parsed.encoder_profile,
+        png_compress_level=parsed.png_compress_level,
+        webp_method=parsed.webp_method,
+    )
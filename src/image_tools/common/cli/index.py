@@ -0,0 +1,238 @@
+import logging
+import sqlite3
+import threading
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import replace
+from functools import cache
+from numbers import Number
+from pathlib import Path
+from typing import Any
+
+from PIL.Image import Image
+
+from image_tools.common.cli.index_filter import INDEX_FIELDS, IndexFilter
+from image_tools.common.image.border import BorderSize, detect_border_multi_resolution
+from image_tools.common.image.metadata import ImageInfo, ImageMetadata, read_image_info
+
+logger = logging.getLogger(__name__)
+
+# Incremented when the table changes, so an index from an older version is rebuilt rather than misread.
+SCHEMA_VERSION = 2
+
+_COLUMNS = ("path", "size", "mtime_ns", *INDEX_FIELDS, "border_detector")
+
+_BORDER_FIELDS = ("border_top", "border_bottom", "border_left", "border_right")
+
+BorderDetector = Callable[[Image], BorderSize]
+
+# Detects borders for --where filters on border fields. The tools' own border detection options aren't known when
+# inputs are filtered.
+FILTER_BORDER_DETECTOR: BorderDetector = detect_border_multi_resolution
+
+# --where operator -> SQL for the condition on a column, with a parameter for the value.
+_TEXT_CONDITIONS = {
+    "=": "{} = ? COLLATE NOCASE",
+    "!=": "{} IS NOT ? COLLATE NOCASE",
+    "~": "instr(lower({}), lower(?)) > 0",
+}
+_NUMBER_CONDITIONS = {
+    "=": "{} = ?",
+    "!=": "{} IS NOT ?",
+    "<": "{} < ?",
+    "<=": "{} <= ?",
+    ">": "{} > ?",
+    ">=": "{} >= ?",
+}
+
+
+class ImageIndex:
+    """SQLite database of what's known about image files without decoding them: dimensions, mode and metadata, and the
+    detected border if it's been needed, along with the function which detected it. Entries are keyed by the file's
+    path, and read again if its size or modification time changes.
+    Safe to use from multiple processes and threads at once."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        # Opened on first use in each thread, as SQLite connections can't be shared between threads, and so the index
+        # can be pickled and sent to worker processes.
+        self._local = threading.local()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Entries can be read again from the files, so losing the last few in a power cut doesn't matter, and
+            # updating each entry doesn't wait for the disk.
+            connection.execute("PRAGMA synchronous=NORMAL")
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS images")
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                "format TEXT, mode TEXT, width INTEGER, height INTEGER, camera_model TEXT, lens_model TEXT, "
+                "focal_length REAL, f_number REAL, exposure_time REAL, iso INTEGER, "
+                "border_top INTEGER, border_bottom INTEGER, border_left INTEGER, border_right INTEGER, "
+                "border_detector TEXT)"
+            )
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _get_key(input_path: Path) -> str:
+        return str(input_path.resolve())
+
+    def lookup(self, input_path: Path, detect_border: BorderDetector | None = None) -> ImageInfo | None:
+        """Gets an image's entry, if the file hasn't changed since it was indexed. Its border is None unless it was
+        detected with `detect_border`."""
+
+        stat = input_path.stat()
+        row = self.connection.execute(
+            f"SELECT {', '.join(INDEX_FIELDS)}, border_detector FROM images "
+            "WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (self._get_key(input_path), stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        if row is None:
+            return None
+        info = _row_to_info(row[:-1])
+        if detect_border is None or row[-1] != _get_detector_name(detect_border):
+            info = replace(info, border=None)
+        return info
+
+    def get(self, input_path: Path, detect_border: BorderDetector | None = None) -> ImageInfo:
+        """Gets an image's entry, reading the file if it's new or changed since it was indexed.
+
+        :param detect_border: If given, the entry includes the image's border, detected with this function if it wasn't
+            already. Border detection functions may give different results, e.g. with different thresholds, so a border
+            detected with another function is detected again."""
+
+        info = self.lookup(input_path, detect_border)
+        if info is not None and (detect_border is None or info.border is not None):
+            return info
+        # Stat before reading, so the entry is read again if the file changes while it's read.
+        stat = input_path.stat()
+        info = read_image_info(input_path, detect_border)
+        logger.debug(f"Indexed '{input_path}'")
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO images ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            (
+                self._get_key(input_path),
+                stat.st_size,
+                stat.st_mtime_ns,
+                *_info_to_row(info),
+                _get_detector_name(detect_border) if detect_border is not None else None,
+            ),
+        )
+        return info
+
+    def matches(self, input_path: Path, filters: Sequence[IndexFilter]) -> bool:
+        """Checks if an indexed image meets all the filters. Images which aren't indexed don't, and nor do images whose
+        border wasn't detected with `FILTER_BORDER_DETECTOR` if any filter is on a border field."""
+
+        conditions = ["path = ?"]
+        values: list[Any] = [self._get_key(input_path)]
+        if any(index_filter.field in _BORDER_FIELDS for index_filter in filters):
+            conditions.append("border_detector = ?")
+            values.append(_get_detector_name(FILTER_BORDER_DETECTOR))
+        for index_filter in filters:
+            templates = _NUMBER_CONDITIONS if INDEX_FIELDS[index_filter.field] else _TEXT_CONDITIONS
+            conditions.append(templates[index_filter.operator].format(index_filter.field))
+            values.append(index_filter.value)
+        row = self.connection.execute(f"SELECT 1 FROM images WHERE {' AND '.join(conditions)}", values).fetchone()
+        return row is not None
+
+
+def _get_detector_name(detect_border: BorderDetector) -> str:
+    return f"{detect_border.__module__}.{detect_border.__qualname__}"
+
+
+def _to_number(value: Any) -> float | None:
+    # EXIF values may be rationals, or sequences of them.
+    if isinstance(value, tuple | list):
+        value = value[0] if value else None
+    return float(value) if isinstance(value, Number) else None
+
+
+def _info_to_row(info: ImageInfo) -> tuple[Any, ...]:
+    metadata = info.metadata
+    border = info.border
+    iso = _to_number(metadata.iso)
+    return (
+        info.format,
+        info.mode,
+        *info.size,
+        metadata.camera_model,
+        metadata.lens_model,
+        _to_number(metadata.focal_length),
+        _to_number(metadata.f_number),
+        _to_number(metadata.exposure_time),
+        int(iso) if iso is not None else None,
+        *((border.top, border.bottom, border.left, border.right) if border is not None else (None,) * 4),
+    )
+
+
+def _row_to_info(row: tuple[Any, ...]) -> ImageInfo:
+    fields = dict(zip(INDEX_FIELDS, row, strict=True))
+    metadata = ImageMetadata(
+        camera_model=fields["camera_model"],
+        lens_model=fields["lens_model"],
+        focal_length=fields["focal_length"],
+        f_number=fields["f_number"],
+        exposure_time=fields["exposure_time"],
+        iso=fields["iso"],
+    )
+    border_sides = [fields[field] for field in _BORDER_FIELDS]
+    border = BorderSize(*border_sides) if None not in border_sides else None
+    return ImageInfo(fields["format"], fields["mode"], (fields["width"], fields["height"]), metadata, border)
+
+
+@cache
+def get_image_index(path: Path) -> ImageIndex:
+    """Gets the index at `path`, shared by everything in this process which uses it."""
+
+    return ImageIndex(path)
+
+
+def get_image_info(input_path: Path, index_path: Path | None, detect_border: BorderDetector | None = None) -> ImageInfo:
+    """Gets an image's info from the index at `index_path` if given, otherwise from the file, as for
+    `read_image_info()`."""
+
+    if index_path is None:
+        return read_image_info(input_path, detect_border)
+    return get_image_index(index_path).get(input_path, detect_border)
+
+
+def iter_indexed_image_paths(
+    paths: Iterable[Path], index_path: Path, filters: Sequence[IndexFilter] = ()
+) -> Iterator[Path]:
+    """Updates the index at `index_path` for each input file, yielding the files which meet all the filters.
+    Only files which are new or changed since they were indexed are opened."""
+
+    index = get_image_index(index_path)
+    # Borders are only detected when they're needed, as that decodes the image.
+    detect_border = FILTER_BORDER_DETECTOR if any(f.field in _BORDER_FIELDS for f in filters) else None
+    for path in paths:
+        try:
+            index.get(path, detect_border)
+        except OSError as e:
+            if filters:
+                logger.warning(f"Skipping '{path}', cannot index it: {e}")
+                continue
+            # Without filters, it's left to fail when it's processed, as it would without an index.
+            logger.debug(f"Cannot index '{path}': {e}")
+            yield path
+            continue
+        if index.matches(path, filters):
+            yield path
+        else:
+            logger.debug(f"Skipping '{path}', doesn't match --where filters")
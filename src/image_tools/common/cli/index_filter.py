@@ -0,0 +1,56 @@
+import re
+from argparse import ArgumentTypeError
+from dataclasses import dataclass
+from fractions import Fraction
+
+# Fields of the image index which --where can filter on -> whether they're numbers (otherwise text).
+INDEX_FIELDS: dict[str, bool] = {
+    "format": False,
+    "mode": False,
+    "width": True,
+    "height": True,
+    "camera_model": False,
+    "lens_model": False,
+    "focal_length": True,
+    "f_number": True,
+    "exposure_time": True,
+    "iso": True,
+    "border_top": True,
+    "border_bottom": True,
+    "border_left": True,
+    "border_right": True,
+}
+
+_INDEX_FILTER = re.compile(r"\s*(\w+)\s*(<=|>=|!=|=|<|>|~)\s*(.*?)\s*")
+
+
+@dataclass(frozen=True)
+class IndexFilter:
+    """A condition on a field of the image index."""
+
+    field: str  # One of `INDEX_FIELDS`
+    operator: str  # =, !=, <, <=, >, >= or ~
+    value: str | float
+
+
+def parse_index_filter(text: str) -> IndexFilter:
+    """Parses an index filter, e.g. `width >= 3000`. For use as an argparse argument type."""
+
+    match = _INDEX_FILTER.fullmatch(text)
+    if match is None:
+        raise ArgumentTypeError(f"Expected FIELD OP VALUE: '{text}'")
+    field, operator, value = match.groups()
+    if field not in INDEX_FIELDS:
+        raise ArgumentTypeError(f"Unknown field '{field}', expected one of {', '.join(INDEX_FIELDS)}")
+    if not INDEX_FIELDS[field]:
+        if operator not in ("=", "!=", "~"):
+            raise ArgumentTypeError(f"{field} is text, so can only be compared with =, != or ~: '{text}'")
+        return IndexFilter(field, operator, value)
+    if operator == "~":
+        raise ArgumentTypeError(f"{field} is a number, so can't be compared with ~: '{text}'")
+    try:
+        # Fractions allow exposure times like 1/250.
+        number = float(Fraction(value))
+    except (ValueError, ZeroDivisionError):
+        raise ArgumentTypeError(f"{field} is a number: '{text}'")
+    return IndexFilter(field, operator, number)
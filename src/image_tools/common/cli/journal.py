@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from functools import partial
+from pathlib import Path
+from typing import IO, Any
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJournal:
+    """Append-only JSON lines file which records when each image of a batch is started and finished, so that a batch
+    which stopped part way through can be resumed without processing the finished images again. Each output is also
+    recorded before it's written, so only the batch's own outputs are replaced when it's resumed.
+
+    Only used from the main process, but images may be started from a different thread than they're finished. Outputs
+    are recorded by whichever process writes them, with `record_output()`."""
+
+    def __init__(self, path: Path, resume: bool) -> None:
+        """:param resume: Read the existing journal and append to it. Otherwise, a new journal replaces it."""
+
+        self.path = path
+        self.resume = resume
+        self.finished: set[str] = set()
+        # Started, but stopped before finishing or failing, so their outputs may be partly written by the batch.
+        # Failed images are treated as not started: they may have failed because their outputs already existed, and
+        # those must be kept.
+        self.unfinished: set[str] = set()
+        # Outputs written by the batch, which may be replaced if their image is unfinished.
+        self.outputs: set[str] = set()
+        self._ends_with_partial_line = False
+        if resume:
+            self._read()
+        self._file: IO[str] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def output_listener(self) -> Callable[[Path], None]:
+        """Records an output in the journal before it's written. Can be passed to worker processes."""
+
+        return partial(record_output, self.path)
+
+    def __enter__(self) -> "BatchJournal":
+        # Imported here as it imports Pillow.
+        from image_tools.common.image.imageio import set_output_listener
+
+        set_output_listener(self.output_listener)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        from image_tools.common.image.imageio import set_output_listener
+
+        set_output_listener(None)
+        if self._file is not None:
+            self._file.close()
+
+    def _read(self) -> None:
+        try:
+            file = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with file:
+            for line in file:
+                self._ends_with_partial_line = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be partly written if the batch was killed.
+                    continue
+                match entry.get("event"):
+                    case "start":
+                        self.unfinished.add(entry["input"])
+                    case "fail":
+                        self.unfinished.discard(entry["input"])
+                    case "finish":
+                        self.finished.add(entry["input"])
+                        self.unfinished.discard(entry["input"])
+                    case "output":
+                        self.outputs.add(entry["output"])
+        logger.info(f"Resuming batch: {len(self.finished)} images already finished")
+
+    def _append(self, event: str, input_path: Path) -> None:
+        line = json.dumps({"event": event, "input": _get_key(input_path), "time": time.time()}) + "\n"
+        with self._lock:
+            if self._file is None:
+                # Opened on first use, so nothing is written if there's nothing to process. Always appended to, as
+                # outputs are recorded by other processes too.
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+                if not self.resume:
+                    self._file.truncate(0)
+                elif self._ends_with_partial_line:
+                    self._file.write("\n")
+            self._file.write(line)
+            # Flushed for every entry, so the journal is up to date if the process is killed.
+            self._file.flush()
+
+    def iter_unfinished(
+        self, paths: Iterable[tuple[Path, Path]], get_output_paths: Callable[[Path], list[Path]]
+    ) -> Iterator[tuple[Path, Path]]:
+        """Filters batch paths to the images which aren't finished, and records each image as started as it's consumed.
+
+        :param get_output_paths: Gets every file written for an image from its output path."""
+
+        for input_path, output_path in paths:
+            key = _get_key(input_path)
+            if key in self.finished:
+                logger.debug(f"Skipping '{input_path}', already finished")
+                continue
+            if key in self.unfinished:
+                # Outputs are written atomically, but the batch may have stopped after writing some of an image's
+                # outputs, or before recording that it finished. Outputs it didn't write are kept.
+                for path in get_output_paths(output_path):
+                    if _get_key(path) in self.outputs and path.exists():
+                        logger.info(f"Replacing output of unfinished image: '{path}'")
+                        path.unlink()
+            self._append("start", input_path)
+            yield input_path, output_path
+
+    def finish(self, input_path: Path, succeeded: bool) -> None:
+        """Records that an image finished processing, or failed."""
+
+        self._append("finish" if succeeded else "fail", input_path)
+
+
+def record_output(journal_path: Path, output_path: Path) -> None:
+    """Records in a journal that an output is about to be written. Safe to use from any process, as each entry is
+    appended with a single write."""
+
+    line = json.dumps({"event": "output", "output": _get_key(output_path), "time": time.time()}) + "\n"
+    with open(journal_path, "a", encoding="utf-8") as file:
+        file.write(line)
+
+
+def _get_key(path: Path) -> str:
+    # Absolute, so the journal still applies if the batch is resumed from another directory.
+    return os.path.abspath(path)
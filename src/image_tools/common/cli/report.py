@@ -0,0 +1,27 @@
+import csv
+import json
+import logging
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# One row of a report. Values should be JSON-serialisable scalars, so the report can also be written as CSV.
+ReportRecord = dict[str, Any]
+
+
+def write_report(records: list[ReportRecord], path: Path) -> None:
+    """Writes records to a CSV file if `path` has a .csv extension, otherwise a JSON file."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() == ".csv":
+        # Records may not all have the same fields. Columns are ordered by first appearance.
+        field_names = list(dict.fromkeys(name for record in records for name in record))
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, field_names)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, "w") as file:
+            json.dump(records, file, indent=2)
+    logger.info(f"Wrote report to '{path}'")
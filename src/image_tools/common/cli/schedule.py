@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import secrets
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Estimates the cost of processing an image from its input path and the app config, reading only the image header.
+# Returns the image's cost class, which should identify its format and what processing applies to it, and its size in
+# megapixels. Images of the same class are assumed to take time in proportion to their size.
+CostEstimator = Callable[[Path, Any], tuple[str, float]]
+
+# Images of each class remembered by a cost model. Older runs are forgotten in proportion, so the model follows changes
+# in the machine or the tools.
+MAX_HISTORY_IMAGES = 1000
+
+
+class CostModel:
+    """Seconds per megapixel of processing each class of image, learned from the timings of earlier batches and saved
+    in a JSON file between them."""
+
+    def __init__(self, path: Path | None) -> None:
+        """:param path: File to load the model from and save it to. If None, nothing is learned."""
+
+        self.path = path
+        # Cost class -> totals of seconds, megapixels and images, for earlier batches and this one.
+        self._history: dict[str, dict[str, float]] = {}
+        self._batch: dict[str, dict[str, float]] = {}
+        if path is not None:
+            self._load()
+
+    def _load(self) -> None:
+        assert self.path is not None
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                self._history = json.load(file)["classes"]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring invalid cost model '{self.path}': {e}")
+            return
+        logger.debug(f"Loaded cost model for {len(self._history)} classes of image from '{self.path}'")
+
+    def predict(self, cost_class: str, megapixels: float) -> float:
+        """Predicts the seconds to process an image. Classes which haven't been timed yet are assumed to take the
+        average time per megapixel of all classes."""
+
+        totals = self._history.get(cost_class)
+        if totals is not None and totals["megapixels"] > 0:
+            return totals["seconds"] / totals["megapixels"] * megapixels
+        all_seconds = sum(other["seconds"] for other in self._history.values())
+        all_megapixels = sum(other["megapixels"] for other in self._history.values())
+        return (all_seconds / all_megapixels if all_seconds > 0 and all_megapixels > 0 else 1.0) * megapixels
+
+    def record(self, cost_class: str, megapixels: float, seconds: float) -> None:
+        """Records the time an image of this batch took to process."""
+
+        if megapixels <= 0:
+            return
+        totals = self._batch.setdefault(cost_class, {"seconds": 0.0, "megapixels": 0.0, "images": 0})
+        totals["seconds"] += seconds
+        totals["megapixels"] += megapixels
+        totals["images"] += 1
+
+    def save(self) -> None:
+        """Adds the timings of this batch to the model and saves it, replacing the file atomically."""
+
+        if self.path is None or not self._batch:
+            return
+        for cost_class, batch_totals in self._batch.items():
+            history = self._history.get(cost_class)
+            if history is None or history["images"] <= 0:
+                self._history[cost_class] = batch_totals
+                continue
+            keep = min(1.0, max(0.0, MAX_HISTORY_IMAGES - batch_totals["images"]) / history["images"])
+            self._history[cost_class] = {name: history[name] * keep + batch_totals[name] for name in batch_totals}
+        self._batch = {}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f".{self.path.name}.{secrets.token_hex(4)}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"classes": self._history}, file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+        logger.debug(f"Saved cost model to '{self.path}'")
+
+
+class LargestFirstScheduler:
+    """Orders a batch so the images predicted to take longest are started first, so the batch doesn't end with a few
+    large images processing while the other workers are idle, and learns from the time each image takes.
+    Only used from the main process."""
+
+    def __init__(self, estimator: CostEstimator, config: Any, model: CostModel) -> None:
+        self.estimator = estimator
+        self.config = config
+        self.model = model
+        # Input path -> cost class and megapixels, for the images being processed.
+        self._costs: dict[str, tuple[str, float]] = {}
+
+    def __enter__(self) -> "LargestFirstScheduler":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        # Saved even if the batch failed, as the images which were processed were still timed.
+        self.model.save()
+
+    def _estimate(self, input_path: Path) -> tuple[str, float]:
+        try:
+            return self.estimator(input_path, self.config)
+        except Exception as e:
+            # The image will most likely fail to be processed too, which is reported then.
+            logger.debug(f"Failed to estimate cost of '{input_path}': {e}")
+            return "unknown", 0.0
+
+    def order(self, paths: Iterable[tuple[Path, Path]]) -> list[tuple[Path, Path]]:
+        """Reads every input's header, and sorts the inputs by predicted processing time, longest first.
+        Images with the same predicted time stay in input order."""
+
+        predicted: list[tuple[float, tuple[Path, Path]]] = []
+        for batch_paths in paths:
+            cost = self._estimate(batch_paths[0])
+            self._costs[str(batch_paths[0])] = cost
+            predicted.append((self.model.predict(*cost), batch_paths))
+        predicted.sort(key=lambda item: item[0], reverse=True)
+        if predicted:
+            logger.info(f"Processing {len(predicted)} images, largest first")
+        return [batch_paths for _, batch_paths in predicted]
+
+    def learn(self, record: dict[str, Any]) -> None:
+        """Learns from the stats record of a processed image."""
+
+        cost = self._costs.get(record["input"])
+        # Outputs restored from the cache say nothing about the time to process an image.
+        if cost is None or record.get("cached"):
+            return
+        # The time spent in processing stages is the same whether or not the image was waiting between them in a
+        # pipeline.
+        seconds = sum(record["stages"].values()) or record["seconds"]
+        self.model.record(*cost, seconds)
@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, TextIO, TypeVar
+
+from image_tools.common.image.types import IntSize
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class ImageStats:
+    """Measurements for processing a single image."""
+
+    stages: dict[str, float] = field(default_factory=dict)  # Stage name -> seconds
+    values: dict[str, Any] = field(default_factory=dict)  # E.g. image dimensions
+
+
+# The stats of the image currently being processed, if stats are enabled.
+_current_stats: ContextVar[ImageStats | None] = ContextVar("image_stats", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times a stage of processing an image. Does nothing if stats aren't being collected.
+    If the same stage runs more than once for an image, the times are added."""
+
+    stats = _current_stats.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.stages[name] = stats.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def record_value(name: str, value: Any) -> None:
+    """Records a value for the image currently being processed. Does nothing if stats aren't being collected."""
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.values[name] = value
+
+
+def record_size(prefix: str, size: IntSize) -> None:
+    record_value(f"{prefix}_width", size[0])
+    record_value(f"{prefix}_height", size[1])
+
+
+_PROC_SELF = Path("/proc/self")
+
+
+def reset_peak_memory() -> None:
+    """Resets the process peak resident set size, so `get_peak_memory()` measures from here. Only works on Linux."""
+
+    try:
+        (_PROC_SELF / "clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def get_peak_memory() -> int:
+    """Gets the process peak resident set size, in bytes."""
+
+    try:
+        for line in (_PROC_SELF / "status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Fall back to the peak since the process started. ru_maxrss is in KiB on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _get_file_size(path: Path) -> int | None:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def _get_bytes_written(output_paths: Sequence[Path]) -> int | None:
+    sizes = [_get_file_size(path) for path in output_paths]
+    return None if None in sizes else sum(sizes)  # type: ignore
+
+
+def _make_record(
+    input_path: Path,
+    output_path: Path,
+    other_output_paths: Sequence[Path],
+    writes_output: bool,
+    stats: ImageStats,
+    seconds: float,
+    peak_memory_delta: int | None,
+) -> dict[str, Any]:
+    return {
+        "type": "image",
+        "input": str(input_path),
+        "output": str(output_path),
+        "seconds": seconds,
+        "stages": stats.stages,
+        **stats.values,
+        "bytes_read": _get_file_size(input_path),
+        "bytes_written": _get_bytes_written([output_path, *other_output_paths]) if writes_output else 0,
+        "peak_memory_delta": peak_memory_delta,
+    }
+
+
+@contextmanager
+def collect_image_stats(
+    input_path: Path, output_path: Path, writes_output: bool = True, other_output_paths: Sequence[Path] = ()
+) -> Iterator[dict[str, Any]]:
+    """Collects stats for processing one image. The yielded record is filled in if processing succeeds.
+
+    :param writes_output: If false (e.g. for a dry run), no bytes written are recorded.
+    :param other_output_paths: Any further files written for the image, which count towards bytes written."""
+
+    record: dict[str, Any] = {}
+    stats = ImageStats()
+    reset_peak_memory()
+    start_memory = get_peak_memory()
+    start = time.perf_counter()
+    token = _current_stats.set(stats)
+    try:
+        yield record
+    finally:
+        _current_stats.reset(token)
+    seconds = time.perf_counter() - start
+    record |= _make_record(
+        input_path, output_path, other_output_paths, writes_output, stats, seconds, get_peak_memory() - start_memory
+    )
+
+
+class ImageStatsCollector:
+    """Collects stats for processing one image in steps, which may run on different threads.
+    Only one step may run at a time. Peak memory isn't measured, as other images are processed at the same time."""
+
+    def __init__(self, input_path: Path, output_path: Path, other_output_paths: Sequence[Path] = ()) -> None:
+        self.input_path = input_path
+        self.output_path = output_path
+        self.other_output_paths = other_output_paths
+        self.stats = ImageStats()
+        self.context = copy_context()
+        self.context.run(_current_stats.set, self.stats)
+        self.start = time.perf_counter()
+
+    def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Calls `func` with stats collected for this image."""
+
+        return self.context.run(func, *args)
+
+    def finish(self) -> dict[str, Any]:
+        """:return: The stats record for the image."""
+
+        seconds = time.perf_counter() - self.start
+        return _make_record(self.input_path, self.output_path, self.other_output_paths, True, self.stats, seconds, None)
+
+
+class StatsWriter:
+    """Writes image stats records as JSON lines, and a summary of the batch at the end."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.file: TextIO | None = None
+        self.start = time.perf_counter()
+        self.images = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.stages: dict[str, float] = {}
+
+    def __enter__(self) -> "StatsWriter":
+        self.file = sys.stdout if str(self.path) == "-" else open(self.path, "w")
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.write(self.get_summary())
+        if self.file is not sys.stdout:
+            assert self.file is not None
+            self.file.close()
+            logger.info(f"Wrote stats to '{self.path}'")
+
+    def add(self, record: dict[str, Any]) -> None:
+        self.images += 1
+        self.bytes_read += record["bytes_read"] or 0
+        self.bytes_written += record["bytes_written"] or 0
+        for name, seconds in record["stages"].items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.write(record)
+
+    def write(self, record: dict[str, Any]) -> None:
+        assert self.file is not None
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def get_summary(self) -> dict[str, Any]:
+        seconds = time.perf_counter() - self.start
+        return {
+            "type": "summary",
+            "images": self.images,
+            "seconds": seconds,
+            "images_per_second": self.images / seconds if seconds else None,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "read_mb_per_second": self.bytes_read / 1e6 / seconds if seconds else None,
+            "written_mb_per_second": self.bytes_written / 1e6 / seconds if seconds else None,
+            "stages": self.stages,  # Total seconds, across all worker processes
+        }
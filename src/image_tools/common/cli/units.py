@@ -0,0 +1,25 @@
+import re
+from argparse import ArgumentTypeError
+
+_BYTE_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+_BYTE_SIZE_PATTERN = re.compile(r"(\d+(?:\.\d*)?)\s*([KMGT]?)(?:i?B)?", re.IGNORECASE)
+
+
+def parse_byte_size(text: str) -> int:
+    """Parses a size in bytes, with an optional binary unit suffix, e.g. `1048576`, `500M`, `8G`, `1.5GiB`.
+    For use as an argparse argument type."""
+
+    match = _BYTE_SIZE_PATTERN.fullmatch(text.strip())
+    if not match:
+        raise ArgumentTypeError(f"Invalid size: '{text}'")
+    number, unit = match.groups()
+    return int(float(number) * _BYTE_SIZE_UNITS[unit.upper()])
+
+
+def format_byte_size(size: int) -> str:
+    """Formats a size in bytes with a binary unit suffix, e.g. `1.5G`. The inverse of `parse_byte_size()`."""
+
+    for unit, factor in reversed(_BYTE_SIZE_UNITS.items()):
+        if size >= factor:
+            return f"{size / factor:.1f}{unit}" if unit else f"{size}"
+    return f"{size}"
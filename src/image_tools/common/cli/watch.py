@@ -0,0 +1,257 @@
+"""Watching an input directory for new and changed image files, for `--watch`."""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from collections.abc import Callable, Iterator, Sequence
+from pathlib import Path, PurePath
+
+from image_tools.common.cli.batch import is_image_file_supported, is_in_shard, path_matches_filters
+from image_tools.common.cli.exception import AppError
+
+logger = logging.getLogger(__name__)
+
+# Polling interval in seconds if inotify isn't available and no interval is given.
+DEFAULT_POLL_INTERVAL = 5.0
+
+# inotify event flags, from <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+# struct inotify_event, followed by a null padded name of `len` bytes.
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyWatcher:
+    """Reports changed files in a directory with Linux inotify, called through libc."""
+
+    def __init__(self, directory: str, recursive: bool, is_excluded_directory: Callable[[str], bool]) -> None:
+        """:raise OSError: If inotify isn't available."""
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._inotify_add_watch = libc.inotify_add_watch
+        except (AttributeError, TypeError):
+            raise OSError("inotify isn't supported on this platform")
+        self._inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directory = directory
+        self.recursive = recursive
+        self.is_excluded_directory = is_excluded_directory
+        # Watch descriptor -> directory path relative to `directory`, ending with a separator unless it's the top.
+        self._directories: dict[int, str] = {}
+        self._add_directory("")
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+    def _add_directory(self, relative_directory: str) -> list[str]:
+        """Watches a directory, and its subdirectories if recursive.
+
+        :return: Paths of the files already in them, relative to the watched directory."""
+
+        path = os.path.join(self.directory, relative_directory)
+        descriptor = self._inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Cannot watch '{path}': {os.strerror(error)}")
+        self._directories[descriptor] = relative_directory
+        files = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                relative_path = relative_directory + entry.name
+                if entry.is_file():
+                    files.append(relative_path)
+                elif self.recursive and entry.is_dir(follow_symlinks=False):
+                    if not self.is_excluded_directory(relative_path):
+                        files.extend(self._add_directory(relative_path + os.sep))
+        return files
+
+    def changes(self, timeout: float | None) -> list[str]:
+        """Waits up to `timeout` seconds (forever if None) for files to change.
+
+        :return: Paths of changed files, relative to the watched directory."""
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        changed = []
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + name_length].rstrip(b"\0"))
+            offset += name_length
+            if mask & _IN_Q_OVERFLOW:
+                logger.warning("Too many file changes at once, some new files may be missed")
+                continue
+            if mask & _IN_IGNORED:
+                # The directory was removed.
+                self._directories.pop(descriptor, None)
+                continue
+            relative_directory = self._directories.get(descriptor)
+            if relative_directory is None or not name:
+                continue
+            relative_path = relative_directory + name
+            if mask & _IN_ISDIR:
+                if (
+                    self.recursive
+                    and mask & (_IN_CREATE | _IN_MOVED_TO)
+                    and not self.is_excluded_directory(relative_path)
+                ):
+                    # Files may have been added before the directory was watched, or moved in along with it.
+                    try:
+                        changed.extend(self._add_directory(relative_path + os.sep))
+                    except OSError as e:
+                        logger.warning(str(e))
+            else:
+                changed.append(relative_path)
+        return changed
+
+
+class _PollingWatcher:
+    """Reports changed files in a directory by listing it periodically and comparing the files' sizes and modification
+    times. Unlike inotify, this also notices files written by other machines to a network filesystem."""
+
+    def __init__(
+        self,
+        directory: str,
+        recursive: bool,
+        is_excluded_directory: Callable[[str], bool],
+        is_watched_file: Callable[[str], bool],
+        interval: float,
+    ) -> None:
+        self.directory = directory
+        self.recursive = recursive
+        self.is_excluded_directory = is_excluded_directory
+        self.is_watched_file = is_watched_file
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def close(self) -> None:
+        pass
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        """:return: Relative path -> (size, modification time) of each watched file."""
+
+        snapshot = {}
+        directories = [(self.directory, "")]
+        while directories:
+            directory, relative_directory = directories.pop()
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                # Removed since it was listed.
+                continue
+            with entries:
+                for entry in entries:
+                    relative_path = relative_directory + entry.name
+                    try:
+                        if entry.is_file() and self.is_watched_file(relative_path):
+                            stat = entry.stat()
+                            snapshot[relative_path] = (stat.st_size, stat.st_mtime_ns)
+                        elif self.recursive and entry.is_dir(follow_symlinks=False):
+                            if not self.is_excluded_directory(relative_path):
+                                directories.append((entry.path, relative_path + os.sep))
+                    except FileNotFoundError:
+                        continue
+        return snapshot
+
+    def changes(self, timeout: float | None) -> list[str]:
+        """Waits for the next scan, regardless of `timeout`, so that a file is only settled once a scan after
+        it changed found it unchanged.
+
+        :return: Paths of new and changed files, relative to the watched directory."""
+
+        time.sleep(self.interval)
+        snapshot = self._scan()
+        changed = [path for path, state in snapshot.items() if self._snapshot.get(path) != state]
+        self._snapshot = snapshot
+        return changed
+
+
+def iter_watched_image_paths(
+    directory: str,
+    recursive: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    shard: tuple[int, int] | None = None,
+    settle_time: float = 2.0,
+    poll_interval: float | None = None,
+) -> Iterator[Path]:
+    """Watches a directory for supported image files which are added or changed, never stopping. Files already in the
+    directory aren't used. Filters are the same as for `iter_image_input_file_paths()`.
+    Watching starts before this returns, so no files are missed before iterating.
+
+    :param settle_time: Seconds a file must go unchanged for before it's used, so files which are still being written
+        aren't used.
+    :param poll_interval: If set, poll for changes at this interval instead of using inotify. Inotify doesn't notice
+        files written by other machines to a network filesystem."""
+
+    if not os.path.isdir(directory):
+        raise AppError(f"--watch requires an input directory: '{directory}'")
+
+    def is_watched_file(relative_path: str) -> bool:
+        return (
+            is_image_file_supported(relative_path)
+            and path_matches_filters(relative_path, include, exclude)
+            and (shard is None or is_in_shard(relative_path.replace(os.sep, "/"), shard))
+        )
+
+    def is_excluded_directory(relative_path: str) -> bool:
+        return any(PurePath(relative_path).match(pattern) for pattern in exclude)
+
+    watcher: _InotifyWatcher | _PollingWatcher
+    if poll_interval is None:
+        try:
+            watcher = _InotifyWatcher(directory, recursive, is_excluded_directory)
+        except OSError as e:
+            logger.info(f"Can't use inotify ({e}), polling for changes every {DEFAULT_POLL_INTERVAL:g}s instead")
+            watcher = _PollingWatcher(
+                directory, recursive, is_excluded_directory, is_watched_file, DEFAULT_POLL_INTERVAL
+            )
+    else:
+        watcher = _PollingWatcher(directory, recursive, is_excluded_directory, is_watched_file, poll_interval)
+    logger.info(f"Watching '{directory}' for new and changed images")
+    return _iter_settled_paths(directory, watcher, is_watched_file, settle_time)
+
+
+def _iter_settled_paths(
+    directory: str,
+    watcher: _InotifyWatcher | _PollingWatcher,
+    is_watched_file: Callable[[str], bool],
+    settle_time: float,
+) -> Iterator[Path]:
+    # Relative path -> monotonic time the file last changed, for changed files which haven't settled yet.
+    pending: dict[str, float] = {}
+    try:
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, min(pending.values()) + settle_time - time.monotonic())
+            for relative_path in watcher.changes(timeout):
+                if is_watched_file(relative_path):
+                    pending[relative_path] = time.monotonic()
+            now = time.monotonic()
+            for relative_path, changed_time in list(pending.items()):
+                if now - changed_time >= settle_time:
+                    del pending[relative_path]
+                    path = os.path.join(directory, relative_path)
+                    # It may have been removed or replaced with a directory in the meantime.
+                    if os.path.isfile(path):
+                        yield Path(path)
+    finally:
+        watcher.close()
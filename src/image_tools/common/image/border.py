@@ -1,9 +1,14 @@
 import logging
+from collections.abc import Callable
 from dataclasses import dataclass
+from math import floor
 
 import numpy as np
+from PIL import ImageMode
 from PIL.Image import Image
 
+from image_tools.common.image.tiff import MappedTiff, map_tiff
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,6 +38,16 @@ class BorderSize:
 
         return any(b > 0 for b in (self.top, self.bottom, self.left, self.right))
 
+    def scale(self, factor: float) -> "BorderSize":
+        """Gets the equivalent border size for the image scaled by `factor`."""
+
+        return BorderSize(
+            top=round(self.top * factor),
+            bottom=round(self.bottom * factor),
+            left=round(self.left * factor),
+            right=round(self.right * factor),
+        )
+
 
 # Relative diff above which pixels are considered to be different colours for the purpose of border detection.
 BORDER_DIFF_COLOUR_THRESHOLD = 0.05
@@ -47,43 +62,244 @@ def detect_border(
     pixel_count_threshold: float = BORDER_DIFF_PROPORTION_THRESHOLD,
 ) -> BorderSize:
     """Infers the size of an image's border from pixel values.
-    The border must be uniform colour on all sides. However, the border can be differing sizes on each side."""
+    The border must be uniform colour on all sides. However, the border can be differing sizes on each side.
+
+    A row or column is part of the border if the proportion of its pixel channels which differ from the top left pixel
+    is within `pixel_count_threshold`. The border on each side extends up to the first row or column which isn't."""
 
-    data = np.array(image)
-    # Shape is (height, width, channels)
+    # Uncompressed TIFFs can be read straight from the file, without decoding the image.
+    mapped = map_tiff(image)
+    data = image_pixel_array(image) if mapped is None else mapped.read_region((0, 0, *image.size))
+    height, width, channels = data.shape
 
     # Reference top left pixel, to which colours are compared
-    ref_colour = data[0, 0].astype(float)
+    ref_colour = data[0, 0]
     # Relative differences are a proportion of the max pixel value.
-    diff_ref = np.max(data, axis=(0, 1))
-
-    def is_same_colour(pixels: np.ndarray) -> bool:
-        # Cast to avoid clipping on unsigned pixel types.
-        pixels = pixels.astype(float)
-        diffs = pixels - ref_colour
-        # Each channel must be within the threshold.
-        different = np.abs(diffs) > channel_diff_threshold * diff_ref
-        total_pixels = pixels.shape[0] * pixels.shape[1]
-        different_proportion = np.count_nonzero(different) / total_pixels
-        overall_same = different_proportion <= pixel_count_threshold
-        return overall_same
-
-    def find_border(axis: int, reverse: bool) -> int:
-        depth = 1
-        while True:
-            index = -depth if reverse else depth - 1
-            side = data[index, :] if axis == 0 else data[:, index]
-            if not is_same_colour(side):
-                return depth - 1
-            depth += 1
+    # (Reducing each channel separately is much faster than reducing over both axes at once.)
+    diff_ref = np.array([data[:, :, channel].max() for channel in range(channels)])
+
+    channel_limits = get_channel_limits(ref_colour, diff_ref, channel_diff_threshold)
+    row_diff_counts, column_diff_counts = count_different_pixels(data, channel_limits)
+
+    row_is_border = row_diff_counts / (width * channels) <= pixel_count_threshold
+    column_is_border = column_diff_counts / (height * channels) <= pixel_count_threshold
 
     border_size = BorderSize(
-        top=find_border(0, False), bottom=find_border(0, True), left=find_border(1, False), right=find_border(1, True)
+        top=find_border_depth(row_is_border),
+        bottom=find_border_depth(row_is_border[::-1]),
+        left=find_border_depth(column_is_border),
+        right=find_border_depth(column_is_border[::-1]),
+    )
+    logger.debug(f"Detected border: {border_size}")
+    return border_size
+
+
+def image_pixel_array(image: Image) -> np.ndarray:
+    """Gets an image's pixel data with shape (height, width, channels), even for single channel images."""
+
+    data = np.asarray(image)
+    if data.ndim == 2:
+        data = data[:, :, np.newaxis]
+    return data
+
+
+# Inclusive (low, high) range of values for each channel which are considered the same colour as the reference.
+ChannelLimits = list[tuple[float, float]]
+
+
+def get_channel_limits(ref_colour: np.ndarray, diff_ref: np.ndarray, channel_diff_threshold: float) -> ChannelLimits:
+    """Calculates the range of values for each channel that are within `channel_diff_threshold` of `ref_colour`."""
+
+    limits: ChannelLimits = []
+    for ref, max_value in zip(ref_colour.tolist(), diff_ref.tolist()):
+        max_diff = channel_diff_threshold * max_value
+        if isinstance(ref, int):
+            # For integer pixels, |value - ref| > max_diff is equivalent to |value - ref| > floor(max_diff), so the
+            # comparison can be done on the original pixel type without casting.
+            max_diff = floor(max_diff)
+        limits.append((ref - max_diff, ref + max_diff))
+    return limits
+
+
+def count_different_pixels(data: np.ndarray, channel_limits: ChannelLimits) -> tuple[np.ndarray, np.ndarray]:
+    """Counts pixel channels which are outside of `channel_limits`.
+
+    :param data: Pixel data with shape (height, width, channels).
+    :return: Count for each row, count for each column."""
+
+    height, width, channels = data.shape
+    row_counts = np.zeros(height, dtype=np.int64)
+    column_counts = np.zeros(width, dtype=np.int64)
+    for channel, (low, high) in enumerate(channel_limits):
+        # Comparisons are much faster on contiguous data, and a copy of one channel is relatively small.
+        values = np.ascontiguousarray(data[:, :, channel])
+        different = (values < low) | (values > high)
+        row_counts += different.sum(axis=1)
+        column_counts += different.sum(axis=0)
+    return row_counts, column_counts
+
+
+def find_border_depth(is_border: np.ndarray) -> int:
+    """Finds the number of consecutive border rows/columns from the start of a side's profile."""
+
+    not_border = np.flatnonzero(~is_border)
+    return int(not_border[0]) if not_border.size else len(is_border)
+
+
+# Downscaling factor of the proxy image used to estimate the border for multi-resolution detection.
+BORDER_PROXY_SCALE_FACTOR = 8
+
+# Modes for which the values from Pillow's getpixel(), histogram() and getextrema() are the same as the pixel array's,
+# so multi-resolution detection can use them. In other modes they differ, e.g. "1" pixels are bools in the array but
+# 0 or 255 from Pillow, and the "LAB" a and b channels are signed in the array but offset from Pillow.
+MULTI_RESOLUTION_MODES = {"L", "P", "LA", "PA", "RGB", "RGBA", "RGBX", "CMYK", "YCbCr", "I", "I;16", "F"}
+
+
+def detect_border_multi_resolution(
+    image: Image,
+    channel_diff_threshold: float = BORDER_DIFF_COLOUR_THRESHOLD,
+    pixel_count_threshold: float = BORDER_DIFF_PROPORTION_THRESHOLD,
+    proxy_scale_factor: int = BORDER_PROXY_SCALE_FACTOR,
+) -> BorderSize:
+    """Infers the size of an image's border, with the same result as `detect_border()`.
+
+    The border is first estimated on a downscaled proxy of the image. Full resolution rows and columns are then only
+    compared from each edge to a little past the estimate, so the interior of the image is never compared.
+    Images in modes other than `MULTI_RESOLUTION_MODES` which can't be read from the file are passed to
+    `detect_border()`."""
+
+    mapped = map_tiff(image)
+    if mapped is not None:
+        # Uncompressed TIFFs are read straight from the file, so the image is never decoded. Only the sampled proxy
+        # pixels and the regions near the edges are read.
+        ref_colour = mapped.read_region((0, 0, 1, 1))[0, 0]
+        proxy_data = mapped.sample(proxy_scale_factor)
+        diff_ref = get_mapped_channel_maxima(mapped, proxy_data)
+        channel_limits = get_channel_limits(ref_colour, diff_ref, channel_diff_threshold)
+        estimate = estimate_border(proxy_data, channel_limits, pixel_count_threshold, proxy_scale_factor)
+        read_region: RegionReader = mapped.read_region
+    elif image.mode not in MULTI_RESOLUTION_MODES:
+        return detect_border(image, channel_diff_threshold, pixel_count_threshold)
+    else:
+        ref_colour = np.atleast_1d(np.asarray(image.getpixel((0, 0))))
+        diff_ref = get_channel_maxima(image)
+        channel_limits = get_channel_limits(ref_colour, diff_ref, channel_diff_threshold)
+
+        try:
+            proxy = image.reduce(proxy_scale_factor)
+        except ValueError:
+            # Some modes can't be reduced. The estimate is only an optimisation, so search from the edges instead.
+            estimate = BorderSize(0, 0, 0, 0)
+        else:
+            estimate = estimate_border(
+                image_pixel_array(proxy), channel_limits, pixel_count_threshold, proxy_scale_factor
+            )
+
+        def read_image_region(box: tuple[int, int, int, int]) -> np.ndarray:
+            return image_pixel_array(image.crop(box))
+
+        read_region = read_image_region
+
+    border_size = refine_border(
+        read_region, image.size, estimate, channel_limits, pixel_count_threshold, margin=2 * proxy_scale_factor
     )
     logger.debug(f"Detected border: {border_size}")
     return border_size
 
 
+def estimate_border(
+    proxy_data: np.ndarray, channel_limits: ChannelLimits, pixel_count_threshold: float, scale_factor: int
+) -> BorderSize:
+    """Estimates the border size from the pixel data of a proxy image, downscaled by `scale_factor`."""
+
+    proxy_height, proxy_width, channels = proxy_data.shape
+    row_diff_counts, column_diff_counts = count_different_pixels(proxy_data, channel_limits)
+    row_is_border = row_diff_counts / (proxy_width * channels) <= pixel_count_threshold
+    column_is_border = column_diff_counts / (proxy_height * channels) <= pixel_count_threshold
+    estimate = BorderSize(
+        top=find_border_depth(row_is_border) * scale_factor,
+        bottom=find_border_depth(row_is_border[::-1]) * scale_factor,
+        left=find_border_depth(column_is_border) * scale_factor,
+        right=find_border_depth(column_is_border[::-1]) * scale_factor,
+    )
+    logger.debug(f"Estimated border from proxy image: {estimate}")
+    return estimate
+
+
+def get_channel_maxima(image: Image) -> np.ndarray:
+    """Gets the maximum value of each channel of an image, without copying its pixel data."""
+
+    if ImageMode.getmode(image.mode).typestr.endswith("u1"):
+        # For 8 bit images, the histogram is about twice as fast as getextrema().
+        histogram = np.array(image.histogram()).reshape(-1, 256)
+        return np.array(255 - np.argmax(histogram[:, ::-1] > 0, axis=1), dtype=np.uint8)
+    else:
+        extrema = image.getextrema()
+        if not isinstance(extrema[0], tuple):
+            # Single channel image.
+            extrema = (extrema,)
+        return np.array([maximum for _, maximum in extrema])
+
+
+def get_mapped_channel_maxima(mapped: MappedTiff, proxy_data: np.ndarray) -> np.ndarray:
+    """Gets the maximum value of each channel of a mapped TIFF. Photos almost always reach the maximum value of the
+    pixel type in every channel somewhere, and if the sampled proxy does too, the rest of the file needn't be read."""
+
+    maxima = np.array([proxy_data[:, :, channel].max() for channel in range(proxy_data.shape[2])])
+    if np.all(maxima == np.iinfo(mapped.dtype).max):
+        return maxima
+    return mapped.channel_maxima()
+
+
+# Gets pixel data with shape (height, width, channels) for a (left, top, right, bottom) box of an image.
+RegionReader = Callable[[tuple[int, int, int, int]], np.ndarray]
+
+
+def refine_border(
+    read_region: RegionReader,
+    image_size: tuple[int, int],
+    estimate: BorderSize,
+    channel_limits: ChannelLimits,
+    pixel_count_threshold: float,
+    margin: int,
+) -> BorderSize:
+    """Finds the exact border size by comparing full resolution pixels from each edge up to `margin` past an estimated
+    border size. If the estimate was too small, the compared region keeps growing until the border's end is found."""
+
+    width, height = image_size
+    channels = len(channel_limits)
+
+    def top(start: int, stop: int) -> np.ndarray:
+        return count_different_pixels(read_region((0, start, width, stop)), channel_limits)[0]
+
+    def bottom(start: int, stop: int) -> np.ndarray:
+        return count_different_pixels(read_region((0, height - stop, width, height - start)), channel_limits)[0][::-1]
+
+    def left(start: int, stop: int) -> np.ndarray:
+        return count_different_pixels(read_region((start, 0, stop, height)), channel_limits)[1]
+
+    def right(start: int, stop: int) -> np.ndarray:
+        return count_different_pixels(read_region((width - stop, 0, width - start, height)), channel_limits)[1][::-1]
+
+    def find_depth(count_band: Callable[[int, int], np.ndarray], length: int, line_size: int, estimate: int) -> int:
+        # count_band(start, stop) gives difference counts for lines [start, stop), ordered from the edge inwards.
+        start = 0
+        stop = min(length, estimate + margin)
+        while True:
+            is_border = count_band(start, stop) / (line_size * channels) <= pixel_count_threshold
+            depth = find_border_depth(is_border)
+            if depth < len(is_border) or stop == length:
+                return start + depth
+            start, stop = stop, min(length, 2 * stop)
+
+    return BorderSize(
+        top=find_depth(top, height, width, estimate.top),
+        bottom=find_depth(bottom, height, width, estimate.bottom),
+        left=find_depth(left, width, height, estimate.left),
+        right=find_depth(right, width, height, estimate.right),
+    )
+
+
 def remove_border(image: Image, border: BorderSize | None = None) -> Image:
     """Crop an image to remove its border.
 
@@ -0,0 +1,100 @@
+"""Settings for encoding output images. Doesn't import Pillow, so it can be used while parsing arguments."""
+
+import os
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any
+
+
+class EncoderProfile(Enum):
+    FAST = "fast"  # Quickest to encode, with smaller files and some loss of quality
+    BALANCED = "balanced"  # High quality, without the slowest encoder options
+    ARCHIVAL = "archival"  # Preserve quality as much as possible, regardless of encoding time and file size
+
+    # For argparse help output.
+    def __str__(self):
+        return self.value
+
+
+class OutputFormat(Enum):
+    # Names are the Pillow format names.
+    JPEG = "jpeg"
+    PNG = "png"
+    WEBP = "webp"
+    TIFF = "tiff"
+
+    # For argparse help output.
+    def __str__(self):
+        return self.value
+
+    @property
+    def extension(self) -> str:
+        return _OUTPUT_FORMAT_EXTENSIONS[self]
+
+
+_OUTPUT_FORMAT_EXTENSIONS = {
+    OutputFormat.JPEG: ".jpg",
+    OutputFormat.PNG: ".png",
+    OutputFormat.WEBP: ".webp",
+    OutputFormat.TIFF: ".tif",
+}
+
+# File extension -> Pillow format name, for the formats which can be written.
+FORMAT_EXTENSIONS = {
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".png": "PNG",
+    ".webp": "WEBP",
+    ".tif": "TIFF",
+    ".tiff": "TIFF",
+}
+
+
+@dataclass(frozen=True)
+class EncoderOptions:
+    profile: EncoderProfile = EncoderProfile.ARCHIVAL
+    png_compress_level: int | None = None  # 0 (none) to 9 (smallest). Overrides the profile if set
+    webp_method: int | None = None  # 0 (fastest) to 6 (smallest). Overrides the profile if set
+
+
+# Pillow format name -> profile -> params to pass to `Image.save()`.
+# The JPEG optimize pass takes about 3x as long as encoding without it, for a 5-10% smaller file.
+_PROFILE_PARAMS: dict[str, dict[EncoderProfile, dict[str, Any]]] = {
+    "JPEG": {
+        EncoderProfile.FAST: {"quality": 85, "subsampling": "4:2:0", "optimize": False},
+        EncoderProfile.BALANCED: {"quality": 92, "subsampling": "4:4:4", "optimize": False},
+        # Default JPG writing settings are garbage. Aim to preserve quality as much as possible.
+        EncoderProfile.ARCHIVAL: {"quality": 95, "subsampling": "4:4:4", "optimize": True},
+    },
+    "PNG": {
+        EncoderProfile.FAST: {"compress_level": 1},
+        EncoderProfile.BALANCED: {"compress_level": 6},
+        # PNG is lossless, so higher levels only make files slightly smaller, and take several times as long. Pillow's
+        # default compression level.
+        EncoderProfile.ARCHIVAL: {"compress_level": 6},
+    },
+    "WEBP": {
+        EncoderProfile.FAST: {"quality": 80, "method": 0},
+        EncoderProfile.BALANCED: {"quality": 90, "method": 4},
+        EncoderProfile.ARCHIVAL: {"quality": 95, "method": 6},
+    },
+}
+
+
+def get_format_from_path(path: str | os.PathLike[str]) -> str | None:
+    """Gets the Pillow format name to write a file as from its extension, if it's a supported output format."""
+
+    return FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def get_encoder_params(format: str, options: EncoderOptions) -> dict[str, Any]:
+    """Gets params to pass to `Image.save()` to encode an image with the given options.
+
+    :param format: Pillow format name."""
+
+    params = dict(_PROFILE_PARAMS.get(format.upper(), {}).get(options.profile, {}))
+    if format.upper() == "PNG" and options.png_compress_level is not None:
+        params["compress_level"] = options.png_compress_level
+    if format.upper() == "WEBP" and options.webp_method is not None:
+        params["method"] = options.webp_method
+    return params
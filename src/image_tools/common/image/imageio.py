@@ -1,18 +1,178 @@
-from typing import Any
+import os
+import secrets
+from collections.abc import Callable
+from io import BytesIO
+from pathlib import Path
+from typing import Any, BinaryIO
 
-from PIL.Image import Image
+from PIL.Image import Image, registered_extensions
+
+from image_tools.common.image.encoding import EncoderOptions, get_encoder_params
+from image_tools.common.image.types import IntSize
+
+# TIFF tags which describe how the image data is stored. For TIFF files, `Image.getexif()` includes these, but they
+# don't apply to the output image and the TIFF encoder fails if they're given.
+TIFF_STRUCTURE_TAGS = frozenset(
+    (
+        254,  # NewSubfileType
+        256,  # ImageWidth
+        257,  # ImageLength
+        258,  # BitsPerSample
+        259,  # Compression
+        262,  # PhotometricInterpretation
+        266,  # FillOrder
+        273,  # StripOffsets
+        277,  # SamplesPerPixel
+        278,  # RowsPerStrip
+        279,  # StripByteCounts
+        284,  # PlanarConfiguration
+        317,  # Predictor
+        320,  # ColorMap
+        322,  # TileWidth
+        323,  # TileLength
+        324,  # TileOffsets
+        325,  # TileByteCounts
+        338,  # ExtraSamples
+        339,  # SampleFormat
+        530,  # YCbCrSubSampling
+    )
+)
 
 
 def get_pil_image_write_params(image: Image) -> dict[str, Any]:
-    """Get params to pass to `Image.save()` in order to preserve maximum information.
-    (By default, PIL doesn't preserve all information when saving images)."""
+    """Get params to pass to `Image.save()` in order to preserve the image's metadata.
+    (By default, PIL doesn't preserve all information when saving images).
+    Encoder settings depend on the output format, see `get_encoder_params()`."""
 
-    write_params: dict[str, Any] = {
-        # Preserve metadata
+    exif = image.getexif()
+    if image.format == "TIFF":
+        for tag in TIFF_STRUCTURE_TAGS & exif.keys():
+            del exif[tag]
+    return {
         "icc_profile": image.info.get("icc_profile"),  # Colour profile
-        "exif": image.getexif(),  # Camera info and such
+        "exif": exif,  # Camera info and such
     }
-    if image.format == "JPEG":
-        # Default JPG writing settings are garbage. Aim to preserve quality as much as possible.
-        write_params |= {"quality": 95, "subsampling": 0, "optimize": True}
-    return write_params
+
+
+def draft_image(image: Image, requested_size: IntSize) -> float:
+    """Configures an image to be decoded at a reduced size, if its format supports that. Only JPEG does, which can scale
+    by 1/2, 1/4 or 1/8 while decoding. The decoded size is no smaller than `requested_size`.
+    Must be called before the image is loaded.
+
+    :return: Scale of the decoded image relative to the full image size."""
+
+    full_width = image.width
+    result = image.draft(None, requested_size)
+    if result is None:
+        return 1.0
+    _, box = result
+    return box[2] / full_width
+
+
+def get_decoded_image_size(image: Image) -> int:
+    """Gets the memory used by the pixel data of an image once it's decoded, in bytes, without decoding it."""
+
+    if image.mode in ("1", "L", "P"):
+        pixel_size = 1
+    elif image.mode.startswith("I;16"):
+        pixel_size = 2
+    else:
+        # PIL stores all other modes with 4 bytes per pixel, including RGB.
+        pixel_size = 4
+    return image.width * image.height * pixel_size
+
+
+# Image data accepted by the library APIs: encoded image file bytes, a binary file object, or an already decoded image.
+ImageSource = bytes | BinaryIO | Image
+
+
+def convert_for_format(image: Image, format: str) -> Image:
+    """Converts an image to a mode which can be written in a format, if it isn't already.
+
+    :param format: Pillow format name."""
+
+    format = format.upper()
+    if format in ("JPEG", "WEBP") and image.mode.startswith("I"):
+        # Only 8 bits per channel are supported. Scale 16 bit greyscale down, rather than letting Pillow clip it.
+        return image.point(lambda value: value / 256).convert("L")
+    match format:
+        case "JPEG" if image.mode not in ("L", "RGB", "CMYK"):
+            return image.convert("L" if image.mode in ("1", "LA") else "RGB")
+        case "PNG" if image.mode == "CMYK":
+            return image.convert("RGB")
+        case _:
+            # Pillow converts other modes for WebP itself, and TIFF supports every mode.
+            return image
+
+
+# Called with each output file path before it's written, e.g. so a batch journal can record which files it wrote.
+_output_listener: Callable[[Path], None] | None = None
+
+
+def set_output_listener(listener: Callable[[Path], None] | None) -> None:
+    """Sets the function to call with each output file path before it's written, for this process."""
+
+    global _output_listener
+    _output_listener = listener
+
+
+def notify_output(path: Path) -> None:
+    """Tells the output listener that a file is about to be written, if there is one."""
+
+    if _output_listener is not None:
+        _output_listener(path)
+
+
+def save_image(
+    image: Image,
+    file: str | os.PathLike[str] | BinaryIO,
+    format: str | None,
+    write_params: dict[str, Any],
+    encoder: EncoderOptions,
+) -> None:
+    """Saves an image in a format, converting it if required.
+    A file path is written atomically, so it's never left partly written, and hard links to an existing file at the
+    path keep the previous content.
+
+    :param format: Pillow format name. If none, Pillow picks the format from the file name, with its default settings.
+    :param write_params: Params to preserve metadata, from `get_pil_image_write_params()`."""
+
+    if format is not None:
+        image = convert_for_format(image, format)
+        write_params = write_params | get_encoder_params(format, encoder)
+    if isinstance(file, (str, os.PathLike)):
+        save_image_file_atomically(image, Path(file), format, write_params)
+    else:
+        image.save(file, format=format, **write_params)
+
+
+def save_image_file_atomically(image: Image, path: Path, format: str | None, write_params: dict[str, Any]) -> None:
+    """Saves an image to a temporary file in the same directory, then renames it over `path` once it's complete."""
+
+    if format is None:
+        # Pillow would pick the format from the extension, which the temporary file doesn't have.
+        format = registered_extensions().get(path.suffix.lower())
+        if format is None:
+            raise ValueError(f"Unknown file extension: '{path.suffix}'")
+    # Hidden, and without an image extension, so a batch scanning the directory doesn't pick it up as an input.
+    temp_path = path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(temp_path, "xb") as file:
+            image.save(file, format=format, **write_params)
+            # Make sure the data is on disk before the file appears complete.
+            file.flush()
+            os.fsync(file.fileno())
+        # Only once the output is complete, but before it appears, so it's never written without being recorded.
+        notify_output(path)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def encode_image(image: Image, format: str, write_params: dict[str, Any], encoder: EncoderOptions) -> bytes:
+    """Saves an image to bytes rather than a file."""
+
+    buffer = BytesIO()
+    save_image(image, buffer, format, write_params, encoder)
+    return buffer.getvalue()
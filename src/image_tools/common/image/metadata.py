@@ -1,9 +1,15 @@
 import logging
+from collections.abc import Callable
 from dataclasses import dataclass
+from pathlib import Path
 
 from PIL import ExifTags
+from PIL import Image as PILImage
 from PIL.Image import Image
 
+from image_tools.common.image.border import BorderSize
+from image_tools.common.image.types import IntSize
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,3 +37,23 @@ def get_image_metadata(img: Image) -> ImageMetadata:
     )
     logger.debug(f"Read image metadata: {metadata}")
     return metadata
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    """What's known about an image file without decoding it, and optionally its detected border."""
+
+    format: str | None
+    mode: str
+    size: IntSize
+    metadata: ImageMetadata
+    border: BorderSize | None  # None if not detected
+
+
+def read_image_info(input_path: Path, detect_border: Callable[[Image], BorderSize] | None = None) -> ImageInfo:
+    """Reads an image file's header and metadata. The image is only decoded if `detect_border` is given."""
+
+    with PILImage.open(input_path) as image:
+        metadata = get_image_metadata(image)
+        border = detect_border(image) if detect_border is not None else None
+        return ImageInfo(image.format, image.mode, image.size, metadata, border)
@@ -0,0 +1,169 @@
+"""Reads the pixel data of uncompressed TIFF files directly from the file, without decoding the whole image."""
+
+import logging
+
+import numpy as np
+from PIL.Image import Image
+
+logger = logging.getLogger(__name__)
+
+# Pillow raw mode -> numpy type and number of channels, for the raw modes where the pixel data in the file is the same
+# as the decoded image's pixel data.
+_RAW_MODE_TYPES: dict[str, tuple[str, int]] = {
+    "L": ("u1", 1),
+    "P": ("u1", 1),
+    "LA": ("u1", 2),
+    "RGB": ("u1", 3),
+    "RGBA": ("u1", 4),
+    "CMYK": ("u1", 4),
+    "I;16": ("<u2", 1),
+    "I;16B": (">u2", 1),
+}
+
+
+class MappedTiff:
+    """The pixel data of an uncompressed TIFF file, memory mapped as numpy views of each strip or tile.
+
+    Only the strips or tiles which are read are loaded from disk, so reading near the edges of a large image touches a
+    small fraction of the file."""
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        size: tuple[int, int],
+        dtype: np.dtype,
+        channels: int,
+        boxes: np.ndarray,
+        offsets: list[int],
+        row_strides: list[int],
+    ):
+        """
+        :param data: The whole file, as bytes.
+        :param boxes: (left, top, right, bottom) of each strip or tile, with shape (blocks, 4).
+        :param offsets: Offset of each strip or tile's data in the file.
+        :param row_strides: Bytes between rows of each strip or tile."""
+
+        self._data = data
+        self.size = size
+        self.dtype = dtype
+        self.channels = channels
+        self._boxes = boxes
+        self._offsets = offsets
+        self._row_strides = row_strides
+
+    def _block(self, index: int) -> np.ndarray:
+        """View of a strip or tile's pixel data, with shape (height, width, channels)."""
+
+        left, top, right, bottom = self._boxes[index].tolist()
+        return np.ndarray(
+            (bottom - top, right - left, self.channels),
+            self.dtype,
+            self._data,
+            self._offsets[index],
+            (self._row_strides[index], self.dtype.itemsize * self.channels, self.dtype.itemsize),
+        )
+
+    def _blocks_in(self, box: tuple[int, int, int, int]) -> np.ndarray:
+        """Indices of the strips or tiles which intersect a (left, top, right, bottom) box."""
+
+        left, top, right, bottom = box
+        boxes = self._boxes
+        return np.flatnonzero(
+            (boxes[:, 0] < right) & (boxes[:, 2] > left) & (boxes[:, 1] < bottom) & (boxes[:, 3] > top)
+        )
+
+    def read_region(self, box: tuple[int, int, int, int]) -> np.ndarray:
+        """Gets pixel data with shape (height, width, channels) for a (left, top, right, bottom) box of the image.
+
+        If the box is within one strip or tile, the result is a read-only view of the file rather than a copy."""
+
+        left, top, right, bottom = box
+        indices = self._blocks_in(box)
+        if len(indices) == 1:
+            block_left, block_top, block_right, block_bottom = self._boxes[indices[0]].tolist()
+            if block_left <= left and block_top <= top and right <= block_right and bottom <= block_bottom:
+                return self._block(indices[0])[
+                    top - block_top : bottom - block_top, left - block_left : right - block_left
+                ]
+
+        region = np.empty((bottom - top, right - left, self.channels), self.dtype)
+        for index in indices.tolist():
+            block_left, block_top, block_right, block_bottom = self._boxes[index].tolist()
+            # Intersection of the box and the block.
+            x0, y0 = max(left, block_left), max(top, block_top)
+            x1, y1 = min(right, block_right), min(bottom, block_bottom)
+            region[y0 - top : y1 - top, x0 - left : x1 - left] = self._block(index)[
+                y0 - block_top : y1 - block_top, x0 - block_left : x1 - block_left
+            ]
+        return region
+
+    def sample(self, step: int) -> np.ndarray:
+        """Gets every `step`th pixel in each direction, as a small proxy of the image. Unlike a reduced image, the
+        pixels aren't averaged, so only the rows of the file which are sampled are read."""
+
+        width, height = self.size
+        proxy = np.empty((-(-height // step), -(-width // step), self.channels), self.dtype)
+        for index in range(len(self._boxes)):
+            block_left, block_top, block_right, block_bottom = self._boxes[index].tolist()
+            # First sampled row and column in the block.
+            x0 = -(-block_left // step) * step
+            y0 = -(-block_top // step) * step
+            if x0 >= block_right or y0 >= block_bottom:
+                continue
+            samples = self._block(index)[y0 - block_top :: step, x0 - block_left :: step]
+            proxy[y0 // step : y0 // step + samples.shape[0], x0 // step : x0 // step + samples.shape[1]] = samples
+        return proxy
+
+    def channel_maxima(self) -> np.ndarray:
+        """Gets the maximum value of each channel of the image. This reads the whole file."""
+
+        maxima = np.zeros(self.channels, self.dtype)
+        for index in range(len(self._boxes)):
+            block = self._block(index)
+            for channel in range(self.channels):
+                maxima[channel] = max(maxima[channel], block[:, :, channel].max())
+        return maxima
+
+
+def can_map_tiff(image: Image) -> bool:
+    """Checks if `map_tiff()` supports an image, from its header only."""
+
+    tiles = getattr(image, "tile", None)
+    if image.format != "TIFF" or not tiles or not getattr(image, "filename", None) or image.mode not in _RAW_MODE_TYPES:
+        return False
+    # Pillow describes uncompressed strips and tiles as "raw" tiles at an offset in the file. Compressed data is decoded
+    # by libtiff as a single tile, so there's nothing to map.
+    return all(codec == "raw" and args[0] == image.mode and args[2] == 1 for codec, _, _, args in tiles)
+
+
+def map_tiff(image: Image) -> MappedTiff | None:
+    """Memory maps the pixel data of an uncompressed TIFF file which hasn't been decoded yet.
+
+    :return: `None` if the image isn't an undecoded TIFF file, is compressed, or its pixel layout isn't supported."""
+
+    if not can_map_tiff(image):
+        return None
+
+    tiles = image.tile  # type: ignore
+    filename = image.filename  # type: ignore
+    type_name, channels = _RAW_MODE_TYPES[image.mode]
+    dtype = np.dtype(type_name)
+    pixel_bytes = dtype.itemsize * channels
+    try:
+        data = np.memmap(filename, mode="r")
+    except (OSError, ValueError):
+        return None
+    boxes = np.array([box for _, box, _, _ in tiles], dtype=np.int64).reshape(-1, 4)
+    offsets: list[int] = []
+    row_strides: list[int] = []
+    for _, (left, top, right, bottom), offset, (_, stride, _) in tiles:
+        # A stride of 0 means rows are the width of the tile.
+        row_stride = stride or (right - left) * pixel_bytes
+        if offset + (bottom - top - 1) * row_stride + (right - left) * pixel_bytes > data.size:
+            # Truncated file. Let Pillow report it.
+            return None
+        offsets.append(offset)
+        row_strides.append(row_stride)
+
+    logger.debug(f"Mapped {len(tiles)} uncompressed TIFF strips/tiles from '{filename}'")
+    return MappedTiff(data, image.size, dtype, channels, boxes, offsets, row_strides)
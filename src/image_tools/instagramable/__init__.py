@@ -0,0 +1,17 @@
+from typing import TYPE_CHECKING
+
+from image_tools.instagramable.options import ExistingBorderHandling, OutputVariant, ProcessingOptions
+
+if TYPE_CHECKING:
+    from image_tools.instagramable.api import process, process_variants
+
+__all__ = ["ExistingBorderHandling", "OutputVariant", "ProcessingOptions", "process", "process_variants"]
+
+
+def __getattr__(name: str):
+    # Imported on first use, so the command line tool doesn't load the image libraries before it needs them.
+    if name in ("process", "process_variants"):
+        from image_tools.instagramable import api
+
+        return getattr(api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,52 @@
+"""Library API: processes images in memory, without files or command line arguments.
+Safe to call from multiple threads at once."""
+
+from collections.abc import Sequence
+from io import BytesIO
+
+from PIL import Image
+
+from image_tools.common.image.imageio import ImageSource, encode_image
+from image_tools.instagramable.processing import (
+    OutputVariant,
+    ProcessingOptions,
+    SourceImage,
+    read_image,
+    transform_image_variants,
+    use_decoded_image,
+)
+
+
+def process(data: ImageSource, options: ProcessingOptions = ProcessingOptions(), format: str | None = None) -> bytes:
+    """Creates the Instagram-ready version of an image, the same as the command line tool.
+
+    :param data: Image file content, or an already decoded image. A decoded image isn't modified, but shouldn't be
+        modified by another thread during the call.
+    :param format: Output image format, e.g. "JPEG". Defaults to the input format, or PNG if that's not known.
+    :return: Output image file content."""
+
+    return process_variants(data, (), options, format)[0]
+
+
+def process_variants(
+    data: ImageSource,
+    variants: Sequence[OutputVariant],
+    options: ProcessingOptions = ProcessingOptions(),
+    format: str | None = None,
+) -> list[bytes]:
+    """Creates several Instagram-ready versions of an image, decoding it and detecting its border only once.
+
+    :param variants: Size and border of each output image. `OutputVariant.suffix` isn't used. If empty, creates the
+        single image from `options`.
+    :return: Output image file content, in the same order as `variants`."""
+
+    source = _read_source(data, options, variants)
+    images, write_params = transform_image_variants(source, options, variants)
+    format = format or source.image.format or "PNG"
+    return [encode_image(image, format, write_params, options.encoder) for image in images]
+
+
+def _read_source(data: ImageSource, options: ProcessingOptions, variants: Sequence[OutputVariant]) -> SourceImage:
+    if isinstance(data, Image.Image):
+        return use_decoded_image(data)
+    return read_image(BytesIO(data) if isinstance(data, bytes) else data, options, variants)
@@ -1,58 +1,95 @@
 import logging
 import sys
-from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, ArgumentTypeError
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
-from enum import Enum
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
 from colour import Color
-from PIL import Image
 
 from image_tools.common.cli.batch import (
-    get_image_input_file_paths,
-    get_output_image_path,
-    validate_output_paths,
+    BatchOptions,
+    ImagePipeline,
+    add_batch_arguments,
+    check_output_path,
+    get_batch_options,
+    iter_batch_input_paths,
+    iter_batch_paths,
+    run_batch,
 )
+from image_tools.common.cli.encoding import add_encoder_arguments, get_encoder_options
 from image_tools.common.cli.exception import AppError
 from image_tools.common.cli.logging import log_config, suppress_external_logging
+from image_tools.common.cli.report import ReportRecord, write_report
+from image_tools.common.cli.stats import record_size, stage
 from image_tools.common.image.aspect_ratio import aspect_ratio
-from image_tools.common.image.border import detect_border, remove_border
-from image_tools.common.image.imageio import get_pil_image_write_params
+from image_tools.common.image.encoding import OutputFormat, get_format_from_path
 from image_tools.common.image.types import size_to_str
-from image_tools.instagramable.border import apply_new_border
-from image_tools.instagramable.sizing import adjust_image_size
-
-logger = logging.getLogger()
-logging.basicConfig(style="{", format="{levelname}: {message}")
+from image_tools.instagramable.options import (
+    BorderDetectionMode,
+    ExistingBorderHandling,
+    OutputVariant,
+    ProcessingOptions,
+    ScalingMode,
+)
 
+# The image processing modules are imported where they're needed, so that argument parsing and runs with no images to
+# process don't wait for numpy and Pillow to load.
+if TYPE_CHECKING:
+    from PIL import Image
 
-class ExistingBorderHandling(Enum):
-    ADD = "add"  # Add a border anyway
-    REPLACE = "replace"  # Remove old border and add new one
+    from image_tools.common.image.border import BorderSize
+    from image_tools.instagramable.processing import SourceImage
 
-    # For argparse help output.
-    def __str__(self):
-        return self.value
+logger = logging.getLogger()
 
 
-@dataclass(frozen=True)
-class AppConfig:
+@dataclass(frozen=True, kw_only=True)
+class AppConfig(ProcessingOptions):
     input_path: str  # File name or glob
-    existing_border_handling: ExistingBorderHandling
-    border_colour: Color
-    border_baseline_size: float  # Proportional to image size
-    max_dimension: int
     output_directory: Path | None  # If none, output to input directory
     output_file_name_suffix: str
+    variants: tuple[OutputVariant, ...]  # If empty, one output is created from the other options
     allow_overwrite: bool
+    output_format: OutputFormat | None  # If none, same as the input
     dry_run: bool
+    detect_border: bool  # Detect existing borders when planning a dry run
     verbose: bool
+    batch: BatchOptions
+
+
+# --variant keys -> OutputVariant field name, and type.
+_VARIANT_KEYS: dict[str, tuple[str, type]] = {
+    "suffix": ("suffix", str),
+    "max-dimension": ("max_dimension", int),
+    "border-size": ("border_baseline_size", float),
+}
+
+
+def parse_variant(text: str) -> dict[str, Any]:
+    """Parses a --variant value. Fields which aren't given are filled in from the other arguments afterwards."""
+
+    fields: dict[str, Any] = {}
+    for item in text.split(","):
+        key, separator, value = item.partition("=")
+        if not separator or key.strip() not in _VARIANT_KEYS:
+            raise ArgumentTypeError(
+                f"Expected comma separated KEY=VALUE with keys {', '.join(_VARIANT_KEYS)}: '{text}'"
+            )
+        name, value_type = _VARIANT_KEYS[key.strip()]
+        try:
+            fields[name] = value_type(value.strip())
+        except ValueError:
+            raise ArgumentTypeError(f"Invalid {key.strip()}: '{value}'")
+    if "suffix" not in fields:
+        raise ArgumentTypeError(f"A suffix is required: '{text}'")
+    return fields
 
 
 def get_config(args: list[str]) -> AppConfig:
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument("files", type=str, help="File path, directory path, or path glob to process.")
-    # TODO? allow excluding files
     parser.add_argument(
         "--existing-border",
         type=ExistingBorderHandling,
@@ -62,6 +99,15 @@ def get_config(args: list[str]) -> AppConfig:
         f"{ExistingBorderHandling.ADD}: Add the new border anyway. "
         f"{ExistingBorderHandling.REPLACE}: Replace the existing border.",
     )
+    parser.add_argument(
+        "--border-detection",
+        type=BorderDetectionMode,
+        choices=list(BorderDetectionMode),
+        default=BorderDetectionMode.MULTI_RESOLUTION,
+        help="How to detect existing borders. Both give the same result. "
+        f"{BorderDetectionMode.FULL}: Compare every pixel. "
+        f"{BorderDetectionMode.MULTI_RESOLUTION}: Estimate on a downscaled image, then compare only near the edges.",
+    )
     parser.add_argument("--border-colour", type=Color, default="white", help="Border colour, as a W3C colour name.")
     parser.add_argument(
         "--border-size",
@@ -72,6 +118,15 @@ def get_config(args: list[str]) -> AppConfig:
     parser.add_argument(
         "--max-dimension", type=int, default=2000, help="Maximum image width/height. Larger images are rescaled."
     )
+    parser.add_argument(
+        "--scaling",
+        type=ScalingMode,
+        choices=list(ScalingMode),
+        default=ScalingMode.QUALITY,
+        help="Trade-off for downscaling large images. "
+        f"{ScalingMode.QUALITY}: Decode at full size and resample directly. "
+        f"{ScalingMode.FAST}: Decode JPEGs at reduced size and reduce before resampling.",
+    )
     parser.add_argument(
         "--output-dir",
         type=Path,
@@ -79,78 +134,225 @@ def get_config(args: list[str]) -> AppConfig:
         help="Output directory path. Defaults to output in the same directory as the input.",
     )
     parser.add_argument("--output-suffix", type=str, default="-instagram", help="Output file name suffix.")
+    parser.add_argument(
+        "--variant",
+        type=parse_variant,
+        action="append",
+        default=None,
+        help="Create another output image from each input, e.g. 'suffix=-thumb,max-dimension=400,border-size=0.05'. "
+        "May be repeated. Keys are suffix (required), max-dimension and border-size, which default to the options "
+        "above. If given, only the variants are written, and --output-suffix isn't used. Each image is decoded and "
+        "its existing border detected only once for all variants.",
+    )
     parser.add_argument(
         "--overwrite", action="store_true", default=False, help="Allow overwriting files which already exist."
     )
     parser.add_argument(
-        "--dry-run", action="store_true", default=False, help="Simulate the operation without writing any files."
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="Plan the operation without writing any files. Only image headers are read.",
+    )
+    parser.add_argument(
+        "--detect-border",
+        action="store_true",
+        default=False,
+        help=f"With --dry-run and --existing-border {ExistingBorderHandling.REPLACE}, detect existing borders from the "
+        "pixel data so the planned output is exact. Otherwise existing borders are ignored when planning.",
     )
     parser.add_argument(
         "--verbose", action="store_true", default=False, help="Print more information about the operation"
     )
+    add_encoder_arguments(parser)
+    add_batch_arguments(parser)
 
     parsed = parser.parse_args(args)
 
+    variant_defaults = {"max_dimension": parsed.max_dimension, "border_baseline_size": parsed.border_size}
+    variants = tuple(OutputVariant(**(variant_defaults | fields)) for fields in parsed.variant or ())
+    if len({variant.suffix for variant in variants}) < len(variants):
+        parser.error("--variant suffixes must be unique")
+
     return AppConfig(
         input_path=parsed.files,
         existing_border_handling=parsed.existing_border,
+        border_detection=parsed.border_detection,
         border_colour=parsed.border_colour,
         border_baseline_size=parsed.border_size,
         max_dimension=parsed.max_dimension,
+        scaling=parsed.scaling,
         output_directory=parsed.output_dir,
         output_file_name_suffix=parsed.output_suffix,
+        variants=variants,
         allow_overwrite=parsed.overwrite,
+        output_format=parsed.output_format,
         dry_run=parsed.dry_run,
+        detect_border=parsed.detect_border,
         verbose=parsed.verbose,
+        encoder=get_encoder_options(parsed),
+        batch=get_batch_options(parser, parsed),
     )
 
 
-def log_final_image_info(image: Image.Image) -> None:
+def log_final_image_info(image: "Image.Image") -> None:
     logger.info(f"New image dimensions: {size_to_str(image.size)}, aspect ratio {aspect_ratio(image.size):.2f}")
 
 
-def process_image(input_path: Path, output_path: Path, config: AppConfig) -> None:
+def get_output_paths(output_path: Path, config: AppConfig) -> list[Path]:
+    """Gets the path of each output image, from the path of the first one."""
+
+    if not config.variants:
+        return [output_path]
+    first_suffix = config.variants[0].suffix
+    output_paths = []
+    for variant in config.variants:
+        # Same as the batch output naming, with the variant's suffix instead of the first one.
+        parts = output_path.name.split(".")
+        parts[0] = parts[0].removesuffix(first_suffix) + variant.suffix
+        output_paths.append(output_path.with_name(".".join(parts)))
+    return output_paths
+
+
+def iter_variant_paths(paths: Iterable[tuple[Path, Path]], config: AppConfig) -> Iterator[tuple[Path, Path]]:
+    """Checks the output paths of the variants after the first, which the batch doesn't know about, if the batch checks
+    outputs early."""
+
+    for input_path, output_path in paths:
+        if config.batch.check_outputs_early:
+            for path in get_output_paths(output_path, config)[1:]:
+                check_output_path(path, config.allow_overwrite)
+        yield input_path, output_path
+
+
+def read_image(input_path: Path, config: AppConfig) -> "SourceImage":
+    from image_tools.instagramable import processing
+
     logger.info(f"Processing '{input_path}'")
+    return processing.read_image(input_path, config, config.variants)
+
+
+def transform_image(source: "SourceImage", config: AppConfig) -> tuple[list["Image.Image"], dict[str, Any]]:
+    from image_tools.instagramable import processing
+
+    return processing.transform_image_variants(source, config, config.variants)
 
-    # Note if the file is not a valid image, we fail everything. User probably needs to take action.
-    image = Image.open(input_path)
 
-    # We're trying to preserve as much as possible from the original image, so save the info now in case it's changed.
-    write_params = get_pil_image_write_params(image)
+# Peak memory needed to process an image, relative to its decoded size. Measured on 24 MP images; full border detection
+# makes several whole-image working copies.
+PEAK_MEMORY_FACTOR = 1.5
+FULL_BORDER_DETECTION_PEAK_MEMORY_FACTOR = 4.0
 
-    def apply_border_func(image: Image.Image) -> Image.Image:
-        return apply_new_border(image, config.border_colour, config.border_baseline_size)
 
-    match config.existing_border_handling:
-        case ExistingBorderHandling.ADD:
-            image = apply_border_func(image)
-        case ExistingBorderHandling.REPLACE:
-            border = detect_border(image)
-            # Only remove the existing border if it's a real border on all sides.
-            # Sometimes images (particularly greyscale) have content which is uniform across one side, which shouldn't
-            # be considered a border for the purposes of this program.
-            if border.all_sides:
-                image = remove_border(image, border)
-            image = apply_border_func(image)
-        case v:  # type: ignore
-            raise AssertionError(f"Unhandled ExistingBorderHandling {v}")
+def estimate_peak_memory(input_path: Path, config: AppConfig) -> int:
+    """Estimates the peak memory needed by `process_image()`, in bytes, reading only the image header."""
 
-    image = adjust_image_size(image, config.max_dimension)
+    from PIL import Image
 
-    log_final_image_info(image)
+    from image_tools.common.image.imageio import get_decoded_image_size
 
-    if config.dry_run:
-        logger.info(f"Dry run: Would save image to '{output_path}'")
+    with Image.open(input_path) as image:
+        decoded_size = get_decoded_image_size(image)
+    if (
+        config.existing_border_handling == ExistingBorderHandling.REPLACE
+        and config.border_detection == BorderDetectionMode.FULL
+    ):
+        return int(decoded_size * FULL_BORDER_DETECTION_PEAK_MEMORY_FACTOR)
     else:
+        return int(decoded_size * PEAK_MEMORY_FACTOR)
+
+
+def estimate_cost(input_path: Path, config: AppConfig) -> tuple[str, float]:
+    """Gets the cost class and megapixels of an image to order a batch by, reading only the image header.
+    The class includes which of the slow parts of processing apply to the image."""
+
+    from PIL import Image
+
+    with Image.open(input_path) as image:
+        format, size = image.format, image.size
+    cost_class = [format or "unknown"]
+    if config.existing_border_handling == ExistingBorderHandling.REPLACE:
+        cost_class.append(f"detect-{config.border_detection}")
+    max_dimensions = [variant.max_dimension for variant in config.variants] or [config.max_dimension]
+    if max(size) > min(max_dimensions):
+        cost_class.append(f"resize-{config.scaling}")
+    if len(config.variants) > 1:
+        cost_class.append(f"{len(config.variants)}-variants")
+    return ",".join(cost_class), size[0] * size[1] / 1e6
+
+
+def plan_image(input_path: Path, output_path: Path, config: AppConfig) -> list[ReportRecord]:
+    """Works out what `process_image()` would do, without decoding the image unless border detection is requested.
+
+    :return: A record for each output image."""
+
+    from image_tools.common.cli.index import get_image_info
+    from image_tools.instagramable.geometry import plan_output_geometry
+    from image_tools.instagramable.processing import get_border_detector, get_output_variants, is_border_to_remove
+
+    logger.info(f"Planning '{input_path}'")
+
+    # Only reads the header, and only decodes the image to detect its border, if it isn't in the index already.
+    detect_border = config.detect_border and config.existing_border_handling == ExistingBorderHandling.REPLACE
+    info = get_image_info(input_path, config.batch.index_path, get_border_detector(config) if detect_border else None)
+    existing_border = info.border if info.border is not None and is_border_to_remove(info.border) else None
+
+    def border_fields(prefix: str, border: "BorderSize | None") -> ReportRecord:
+        return {f"{prefix}_{side}": getattr(border, side, None) for side in ("top", "bottom", "left", "right")}
+
+    records = []
+    variants = get_output_variants(config, config.variants)
+    for variant, path in zip(variants, get_output_paths(output_path, config), strict=True):
+        geometry = plan_output_geometry(info.size, existing_border, variant.border_baseline_size, variant.max_dimension)
+        output_size = geometry.output_size
+        logger.info(
+            f"Dry run: Would save {size_to_str(output_size)} image (aspect ratio {aspect_ratio(output_size):.2f}) to "
+            f"'{path}'"
+        )
+        records.append(
+            {
+                "input": str(input_path),
+                "output": str(path),
+                "format": info.format,
+                "mode": info.mode,
+                "input_width": info.size[0],
+                "input_height": info.size[1],
+                "border_detected": detect_border,
+                **border_fields("existing_border", existing_border),
+                **border_fields("new_border", geometry.border),
+                "output_width": output_size[0],
+                "output_height": output_size[1],
+                "aspect_ratio": round(aspect_ratio(output_size), 4),
+            }
+        )
+    return records
+
+
+def write_image(output: tuple[list["Image.Image"], dict[str, Any]], output_path: Path, config: AppConfig) -> None:
+    from image_tools.common.image.imageio import save_image
+
+    images, write_params = output
+    for image, path in zip(images, get_output_paths(output_path, config), strict=True):
+        log_final_image_info(image)
+        record_size("output", image.size)
+
         # Create the output directory if required.
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        if not config.allow_overwrite and output_path.exists():
-            raise AppError(f"Would overwrite existing file: '{output_path}'")
-        image.save(output_path, **write_params)
-        logger.info(f"Saved image to '{output_path}'")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and not config.allow_overwrite:
+            raise AppError(f"Would overwrite existing file: '{path}'")
+        with stage("save"):
+            save_image(image, path, get_format_from_path(path), write_params, config.encoder)
+        logger.info(f"Saved image to '{path}'")
+
+
+def process_image(input_path: Path, output_path: Path, config: AppConfig) -> None:
+    write_image(transform_image(read_image(input_path, config), config), output_path, config)
+
+
+PIPELINE = ImagePipeline(read_image, transform_image, write_image)
 
 
 def main():
+    logging.basicConfig(style="{", format="{levelname}: {message}")
     try:
         config = get_config(sys.argv[1:])
 
@@ -162,19 +364,35 @@ def main():
 
         log_config(config)
 
-        input_file_paths = get_image_input_file_paths(config.input_path)
-        if not input_file_paths:
+        input_paths = iter_batch_input_paths(config.input_path, config.batch)
+        paths = iter_batch_paths(
+            input_paths,
+            config.output_directory,
+            config.variants[0].suffix if config.variants else config.output_file_name_suffix,
+            config.allow_overwrite,
+            config.output_format,
+            check_outputs=config.batch.check_outputs_early,
+        )
+        if config.variants:
+            paths = iter_variant_paths(paths, config)
+        records: list[ReportRecord] = []
+        process_func = plan_image if config.dry_run else process_image
+        processed = run_batch(
+            process_func,
+            paths,
+            config,
+            config.batch,
+            records.extend,
+            PIPELINE,
+            estimate_peak_memory,
+            get_output_paths,
+            estimate_cost,
+        )
+        if processed == 0:
             logger.info("No files to process")
             return
-
-        output_file_paths = [
-            get_output_image_path(p, config.output_directory, config.output_file_name_suffix) for p in input_file_paths
-        ]
-
-        validate_output_paths(output_file_paths, config.allow_overwrite)
-
-        for input_path, output_path in zip(input_file_paths, output_file_paths):
-            process_image(input_path, output_path, config)
+        if config.batch.report_path is not None:
+            write_report(records, config.batch.report_path)
 
         logger.info("Success")
     except Exception as e:
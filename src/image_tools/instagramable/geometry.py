@@ -0,0 +1,184 @@
+import dataclasses
+import logging
+from dataclasses import dataclass
+from math import ceil
+
+from colour import Color
+from PIL import ImageOps
+from PIL.Image import Image, Resampling
+
+from image_tools.common.cli.stats import stage
+from image_tools.common.image.aspect_ratio import aspect_ratio
+from image_tools.common.image.border import BorderSize
+from image_tools.common.image.sizing import clamp_max_dimension
+from image_tools.common.image.types import IntSize, size_to_str
+from image_tools.instagramable.border import calculate_new_border_size
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OutputGeometry:
+    # Region of the source image which is resampled into the content of the output: left, top, right, bottom.
+    # This is the source image excluding any existing border, adjusted by fractions of a pixel so the output pixel grid
+    # is the same as resizing the whole image with its new border.
+    content_box: tuple[float, float, float, float]
+    # Size of the content in the output image.
+    content_size: IntSize
+    # New border around the content in the output image.
+    border: BorderSize
+
+    @property
+    def output_size(self) -> IntSize:
+        return (
+            self.content_size[0] + self.border.left + self.border.right,
+            self.content_size[1] + self.border.top + self.border.bottom,
+        )
+
+    @property
+    def content_scale(self) -> float:
+        """Scale from the source image to the output image."""
+
+        left, top, right, bottom = self.content_box
+        return max(self.content_size[0] / (right - left), self.content_size[1] / (bottom - top))
+
+    def scale_source(self, scale: float) -> "OutputGeometry":
+        """Gets the equivalent geometry for the source image decoded at a different scale."""
+
+        content_box = tuple(b * scale for b in self.content_box)
+        return dataclasses.replace(self, content_box=content_box)
+
+    def from_content_of(self, other: "OutputGeometry") -> "OutputGeometry":
+        """Gets the equivalent geometry for rendering from the content rendered for `other`, rather than from the
+        source image. The content box may extend past the edges of `other`'s content by a fraction of a pixel, as each
+        geometry's content box is adjusted to its own output pixel grid."""
+
+        left, top, right, bottom = other.content_box
+        scale_x = other.content_size[0] / (right - left)
+        scale_y = other.content_size[1] / (bottom - top)
+        content_box = (
+            (self.content_box[0] - left) * scale_x,
+            (self.content_box[1] - top) * scale_y,
+            (self.content_box[2] - left) * scale_x,
+            (self.content_box[3] - top) * scale_y,
+        )
+        return dataclasses.replace(self, content_box=content_box)
+
+
+def plan_output_geometry(
+    image_size: IntSize, existing_border: BorderSize | None, baseline_border_size: float, maximum_dimension: int
+) -> OutputGeometry:
+    """Calculates the final output geometry of removing an existing border, adding a new border, then clamping the
+    image size.
+
+    :param existing_border: Border to remove from the source image, if any."""
+
+    if existing_border is None:
+        existing_border = BorderSize(0, 0, 0, 0)
+    content_width = image_size[0] - existing_border.left - existing_border.right
+    content_height = image_size[1] - existing_border.top - existing_border.bottom
+
+    border = calculate_new_border_size((content_width, content_height), baseline_border_size)
+    size_with_border = (content_width + border.left + border.right, content_height + border.top + border.bottom)
+    output_size = clamp_max_dimension(size_with_border, maximum_dimension)
+
+    # Place the content edges on the output pixel grid the same way as if the whole image with its new border was
+    # resized, so the output is the same apart from where the border used to be blended into the content edges.
+    scale_x = output_size[0] / size_with_border[0]
+    scale_y = output_size[1] / size_with_border[1]
+    left = round(border.left * scale_x)
+    right = output_size[0] - round((border.left + content_width) * scale_x)
+    top = round(border.top * scale_y)
+    bottom = output_size[1] - round((border.top + content_height) * scale_y)
+
+    def to_source_x(output_x: int) -> float:
+        x = output_x / scale_x - border.left + existing_border.left
+        return min(max(x, 0), image_size[0])
+
+    def to_source_y(output_y: int) -> float:
+        y = output_y / scale_y - border.top + existing_border.top
+        return min(max(y, 0), image_size[1])
+
+    geometry = OutputGeometry(
+        content_box=(
+            to_source_x(left),
+            to_source_y(top),
+            to_source_x(output_size[0] - right),
+            to_source_y(output_size[1] - bottom),
+        ),
+        content_size=(output_size[0] - left - right, output_size[1] - top - bottom),
+        border=BorderSize(top=top, bottom=bottom, left=left, right=right),
+    )
+    logger.debug(f"Planned output geometry: {geometry}")
+    return geometry
+
+
+def render_output_image(
+    image: Image, geometry: OutputGeometry, border_colour: Color, reducing_gap: float | None = None
+) -> Image:
+    """Creates the output image from the source image according to `geometry`.
+    Only the content region is resampled, and the border is filled in afterwards.
+
+    :param reducing_gap: Passed to `Image.resize()`. If set, the image is first reduced by an integer factor with a box
+        filter, which is faster but lower quality."""
+
+    return add_border(render_content(image, geometry, reducing_gap), geometry, border_colour)
+
+
+def render_content(image: Image, geometry: OutputGeometry, reducing_gap: float | None = None) -> Image:
+    """Creates the content of the output image (without the new border) from the source image."""
+
+    box = geometry.content_box
+    box_size = (box[2] - box[0], box[3] - box[1])
+    if geometry.content_size == box_size and all(float(b).is_integer() for b in box):
+        with stage("crop"):
+            content = image.crop(tuple(int(b) for b in box))
+    else:
+        with stage("resize"):
+            content = image.resize(
+                geometry.content_size, resample=Resampling.LANCZOS, box=box, reducing_gap=reducing_gap
+            )
+        logger.debug(f"Resized image content: {box_size[0]:.1f}x{box_size[1]:.1f} -> {size_to_str(content.size)}")
+    return content
+
+
+def render_content_from_larger(
+    larger_content: Image, larger_geometry: OutputGeometry, geometry: OutputGeometry, reducing_gap: float | None = None
+) -> Image:
+    """Creates the content of the output image from the content rendered for a larger output image, which is much
+    faster than resampling the source image again.
+    Where the content box extends past the larger content, the larger content's edge pixels are repeated."""
+
+    geometry = geometry.from_content_of(larger_geometry)
+    width, height = larger_content.size
+    left, top, right, bottom = geometry.content_box
+    margin = ceil(max(-left, -top, right - width, bottom - height, 0))
+    if margin > 0:
+        larger_content = _extend_edges(larger_content, margin)
+        geometry = dataclasses.replace(geometry, content_box=tuple(b + margin for b in geometry.content_box))
+    return render_content(larger_content, geometry, reducing_gap)
+
+
+def _extend_edges(image: Image, margin: int) -> Image:
+    """Adds `margin` pixels to each side of an image, repeating its edge pixels."""
+
+    width, height = image.size
+    extended = ImageOps.expand(image, margin)
+    extended.paste(image.crop((0, 0, 1, height)).resize((margin, height)), (0, margin))
+    extended.paste(image.crop((width - 1, 0, width, height)).resize((margin, height)), (width + margin, margin))
+    full_width = width + 2 * margin
+    extended.paste(extended.crop((0, margin, full_width, margin + 1)).resize((full_width, margin)), (0, 0))
+    extended.paste(
+        extended.crop((0, height + margin - 1, full_width, height + margin)).resize((full_width, margin)),
+        (0, height + margin),
+    )
+    return extended
+
+
+def add_border(content: Image, geometry: OutputGeometry, border_colour: Color) -> Image:
+    with stage("expand"):
+        new_image = ImageOps.expand(content, border=geometry.border.pil_tuple, fill=border_colour.get_hex_l())
+    logger.debug(
+        f"Dimensions after border {size_to_str(new_image.size)} (aspect ratio {aspect_ratio(new_image.size):.2f})"
+    )
+    return new_image
@@ -0,0 +1,55 @@
+from dataclasses import dataclass, field
+from enum import Enum
+
+from colour import Color
+
+from image_tools.common.image.encoding import EncoderOptions
+
+
+class ExistingBorderHandling(Enum):
+    ADD = "add"  # Add a border anyway
+    REPLACE = "replace"  # Remove old border and add new one
+
+    # For argparse help output.
+    def __str__(self):
+        return self.value
+
+
+class BorderDetectionMode(Enum):
+    FULL = "full"  # Compare every pixel at full resolution
+    MULTI_RESOLUTION = "multi-resolution"  # Estimate on a downscaled image, then compare only near the edges
+
+    # For argparse help output.
+    def __str__(self):
+        return self.value
+
+
+class ScalingMode(Enum):
+    QUALITY = "quality"  # Decode at full size and resample directly to the output size
+    FAST = "fast"  # Decode at reduced size if possible, and reduce with a box filter before resampling
+
+    # For argparse help output.
+    def __str__(self):
+        return self.value
+
+
+@dataclass(frozen=True, kw_only=True)
+class ProcessingOptions:
+    """Options which affect the output image. Defaults are the same as the command line defaults."""
+
+    existing_border_handling: ExistingBorderHandling = ExistingBorderHandling.REPLACE
+    border_detection: BorderDetectionMode = BorderDetectionMode.MULTI_RESOLUTION
+    border_colour: Color = field(default_factory=lambda: Color("white"))
+    border_baseline_size: float = 0.1  # Proportional to image size
+    max_dimension: int = 2000
+    scaling: ScalingMode = ScalingMode.QUALITY
+    encoder: EncoderOptions = EncoderOptions()
+
+
+@dataclass(frozen=True)
+class OutputVariant:
+    """One of several output images created from the same input. Overrides the corresponding `ProcessingOptions`."""
+
+    max_dimension: int
+    border_baseline_size: float  # Proportional to image size
+    suffix: str = ""  # Appended to output file names by the command line tool
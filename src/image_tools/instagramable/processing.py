@@ -0,0 +1,206 @@
+import logging
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from math import ceil
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from PIL import Image
+
+from image_tools.common.cli.stats import record_size, stage
+from image_tools.common.image.border import BorderSize, detect_border, detect_border_multi_resolution
+from image_tools.common.image.imageio import draft_image, get_pil_image_write_params
+from image_tools.common.image.tiff import can_map_tiff
+from image_tools.common.image.types import IntSize, size_to_str
+from image_tools.instagramable.geometry import (
+    OutputGeometry,
+    add_border,
+    plan_output_geometry,
+    render_content,
+    render_content_from_larger,
+)
+from image_tools.instagramable.options import (
+    BorderDetectionMode,
+    ExistingBorderHandling,
+    OutputVariant,
+    ProcessingOptions,
+    ScalingMode,
+)
+from image_tools.instagramable.sizing import FAST_SCALING_REDUCING_GAP, MIN_INTERMEDIATE_SCALE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SourceImage:
+    """An input image, decoded and ready to transform. Uncompressed TIFFs aren't decoded until their border is
+    detected."""
+
+    file: Path | BinaryIO | None  # Where the image was read from, if it can be read again
+    image: Image.Image  # Possibly decoded at a reduced size
+    scale: float  # Of `image`, relative to the full image size
+    full_size: IntSize
+    write_params: dict[str, Any]  # To pass to `Image.save()`
+
+
+def get_border_detector(options: ProcessingOptions) -> Callable[[Image.Image], BorderSize]:
+    match options.border_detection:
+        case BorderDetectionMode.FULL:
+            return detect_border
+        case BorderDetectionMode.MULTI_RESOLUTION:
+            return detect_border_multi_resolution
+        case v:  # type: ignore
+            raise AssertionError(f"Unhandled BorderDetectionMode {v}")
+
+
+def is_border_to_remove(border: BorderSize) -> bool:
+    # Only remove the existing border if it's a real border on all sides.
+    # Sometimes images (particularly greyscale) have content which is uniform across one side, which shouldn't be
+    # considered a border for the purposes of this program.
+    return border.all_sides
+
+
+def get_border_to_remove(image: Image.Image, options: ProcessingOptions) -> BorderSize | None:
+    match options.existing_border_handling:
+        case ExistingBorderHandling.ADD:
+            return None
+        case ExistingBorderHandling.REPLACE:
+            border = get_border_detector(options)(image)
+            return border if is_border_to_remove(border) else None
+        case v:  # type: ignore
+            raise AssertionError(f"Unhandled ExistingBorderHandling {v}")
+
+
+def get_output_variants(options: ProcessingOptions, variants: Sequence[OutputVariant] = ()) -> list[OutputVariant]:
+    """Gets the output images to create: `variants` if there are any, otherwise the single image from `options`."""
+
+    return list(variants) or [OutputVariant(options.max_dimension, options.border_baseline_size)]
+
+
+def read_image(
+    file: Path | BinaryIO, options: ProcessingOptions, variants: Sequence[OutputVariant] = ()
+) -> SourceImage:
+    """Loads an image, at a reduced size if the options allow.
+
+    :param variants: Output images which will be created, if not the single image from `options`."""
+
+    # Note if the file is not a valid image, we fail everything. User probably needs to take action.
+    image = Image.open(file)
+
+    # We're trying to preserve as much as possible from the original image, so save the info now in case it's changed.
+    with stage("metadata"):
+        write_params = get_pil_image_write_params(image)
+
+    full_size = image.size
+    record_size("input", full_size)
+    source_scale = 1.0
+    if options.scaling == ScalingMode.FAST:
+        # The content is at most the whole image, so plan as if it is to pick the decoding size.
+        whole_image_geometries = [
+            plan_output_geometry(full_size, None, variant.border_baseline_size, variant.max_dimension)
+            for variant in get_output_variants(options, variants)
+        ]
+        largest = max(whole_image_geometries, key=lambda geometry: geometry.content_scale)
+        source_scale = draft_image(image, largest.content_size)
+        if source_scale != 1:
+            logger.debug(f"Decoding at {source_scale:.3f} scale: {size_to_str(image.size)}")
+    # The border of an uncompressed TIFF is detected from the file's pixel data directly, so it's only decoded after
+    # that, by `transform_image_variants()`.
+    if options.existing_border_handling != ExistingBorderHandling.REPLACE or not can_map_tiff(image):
+        with stage("decode"):
+            image.load()
+
+    return SourceImage(file, image, source_scale, full_size, write_params)
+
+
+def use_decoded_image(image: Image.Image) -> SourceImage:
+    """Uses an already decoded image as the input. The image isn't modified."""
+
+    record_size("input", image.size)
+    return SourceImage(None, image, 1.0, image.size, get_pil_image_write_params(image))
+
+
+def transform_image(source: SourceImage, options: ProcessingOptions) -> tuple[Image.Image, dict[str, Any]]:
+    """Creates the new image from a loaded image. `source` isn't modified.
+
+    :return: New image, and params to pass to `Image.save()`."""
+
+    images, write_params = transform_image_variants(source, options)
+    return images[0], write_params
+
+
+def transform_image_variants(
+    source: SourceImage, options: ProcessingOptions, variants: Sequence[OutputVariant] = ()
+) -> tuple[list[Image.Image], dict[str, Any]]:
+    """Creates several new images from a loaded image, detecting the existing border only once. `source` isn't
+    modified.
+
+    :param variants: Output images to create. Defaults to the single image from `options`.
+    :return: New images, in the same order as `variants`, and params to pass to `Image.save()`."""
+
+    variants = get_output_variants(options, variants)
+    image = source.image
+    source_scale = source.scale
+    full_size = source.full_size
+
+    with stage("detect_border"):
+        existing_border = get_border_to_remove(image, options)
+    if getattr(image, "tile", None):
+        # Not decoded by `read_image()`.
+        with stage("decode"):
+            image.load()
+    if existing_border is not None:
+        existing_border = existing_border.scale(1 / source_scale)
+
+    # Work out the final geometry first, so the image only needs to be resampled and copied once.
+    geometries = [
+        plan_output_geometry(full_size, existing_border, variant.border_baseline_size, variant.max_dimension)
+        for variant in variants
+    ]
+    content_scale = max(geometry.content_scale for geometry in geometries)
+
+    if source_scale < 1 and content_scale > source_scale:
+        # Removing a large border means the content is scaled up more than the whole image would have been, so the
+        # reduced size image is too small.
+        assert source.file is not None
+        if not isinstance(source.file, Path):
+            source.file.seek(0)
+        image = Image.open(source.file)
+        required_size = (ceil(full_size[0] * content_scale), ceil(full_size[1] * content_scale))
+        source_scale = draft_image(image, required_size)
+        logger.debug(f"Decoding again at {source_scale:.3f} scale: {size_to_str(image.size)}")
+        with stage("decode"):
+            image.load()
+
+    reducing_gap = FAST_SCALING_REDUCING_GAP if options.scaling == ScalingMode.FAST else None
+    outputs: list[Image.Image | None] = [None] * len(variants)
+    # Largest first, so smaller variants can be resampled from the content of a larger one instead of the source.
+    rendered: list[tuple[OutputGeometry, Image.Image]] = []
+    for index in sorted(range(len(variants)), key=lambda i: geometries[i].content_scale, reverse=True):
+        geometry = geometries[index]
+        # The smallest rendered content which is still large enough.
+        intermediate = next(
+            (
+                (larger_geometry, content)
+                for larger_geometry, content in reversed(rendered)
+                if larger_geometry.content_scale >= geometry.content_scale * MIN_INTERMEDIATE_SCALE
+            ),
+            None,
+        )
+        if intermediate is None:
+            content = render_content(image, geometry.scale_source(source_scale), reducing_gap)
+        else:
+            larger_geometry, larger_content = intermediate
+            logger.debug(f"Resampling from {size_to_str(larger_content.size)} intermediate")
+            content = render_content_from_larger(larger_content, larger_geometry, geometry, reducing_gap)
+        rendered.append((geometry, content))
+        outputs[index] = add_border(content, geometry, options.border_colour)
+    return outputs, source.write_params  # type: ignore
+
+
+def create_output_image(input_path: Path, options: ProcessingOptions) -> tuple[Image.Image, dict[str, Any]]:
+    """Loads an image and creates the new image from it.
+
+    :return: New image, and params to pass to `Image.save()`."""
+
+    return transform_image(read_image(input_path, options), options)
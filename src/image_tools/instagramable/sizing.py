@@ -8,6 +8,15 @@ from image_tools.common.image.types import size_to_str
 logger = logging.getLogger(__name__)
 
 
+# Passed to Image.resize() for ScalingMode.FAST. Per the PIL docs, 2 is "fair" quality and faster.
+FAST_SCALING_REDUCING_GAP = 2.0
+
+# Smaller output variants are resampled from the content of a larger variant rather than from the source image if the
+# larger content is at least this many times the size. With a ratio this large, resampling twice differs from resampling
+# once by well under 1 level on average (away from the content edges), and is much faster for large source images.
+MIN_INTERMEDIATE_SCALE = 2.0
+
+
 def adjust_image_size(image: Image, maximum_dimension: int) -> Image:
     """Clamps the image size such that the largest dimension is <= `maximum_dimension`, while maintaining aspect ratio."""
 
@@ -0,0 +1,157 @@
+"""Client for the image processing server. Only uses the standard library, so it starts quickly."""
+
+import http.client
+import json
+import os
+import socket
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import quote, urlencode
+
+ADDRESS_ENVIRONMENT_VARIABLE = "IMAGE_TOOLS_SERVER"
+# Shared secret which clients must send to a server listening on TCP. Not a command line option, so it isn't visible to
+# other users in the process list.
+TOKEN_ENVIRONMENT_VARIABLE = "IMAGE_TOOLS_SERVER_TOKEN"
+UNIX_ADDRESS_PREFIX = "unix:"
+DEFAULT_SOCKET_NAME = "image-tools.sock"
+
+# Command line tool name -> package name
+TOOLS = {
+    "instagramable": "image_tools.instagramable",
+    "annotate-image-info": "image_tools.annotate_info",
+}
+
+Address = str | tuple[str, int]  # Unix socket path, or TCP host and port
+
+
+class ServerError(Exception):
+    """The server couldn't run a request."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"Server error {status}: {message}")
+        self.status = status
+
+
+@dataclass(frozen=True)
+class JobResult:
+    """The outcome of running a command line tool on the server."""
+
+    exit_code: int
+    stdout: str
+    stderr: str  # Includes the log output
+
+
+def parse_address(text: str) -> Address:
+    """Parses a server address, either "HOST:PORT" or "unix:PATH"."""
+
+    if text.startswith(UNIX_ADDRESS_PREFIX):
+        path = text.removeprefix(UNIX_ADDRESS_PREFIX)
+        if not path:
+            raise ValueError(f"Invalid server address '{text}', Unix socket path is empty")
+        return path
+    host, separator, port = text.rpartition(":")
+    if not separator or not host or not port.isdigit():
+        raise ValueError(f"Invalid server address '{text}', expected HOST:PORT or {UNIX_ADDRESS_PREFIX}PATH")
+    return host, int(port)
+
+
+def format_address(address: Address) -> str:
+    if isinstance(address, str):
+        return f"{UNIX_ADDRESS_PREFIX}{address}"
+    return f"{address[0]}:{address[1]}"
+
+
+def get_default_socket_path() -> str:
+    """Path of the Unix socket used by default, in a directory only the current user can access."""
+
+    runtime_directory = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_directory:
+        return os.path.join(runtime_directory, DEFAULT_SOCKET_NAME)
+    # Only the standard library's temporary directory lookup is needed, so this is imported here to keep startup quick.
+    import tempfile
+
+    return os.path.join(tempfile.gettempdir(), f"image-tools-{os.getuid()}", DEFAULT_SOCKET_NAME)
+
+
+def get_default_address() -> str:
+    return os.environ.get(ADDRESS_ENVIRONMENT_VARIABLE) or f"{UNIX_ADDRESS_PREFIX}{get_default_socket_path()}"
+
+
+def get_default_token() -> str | None:
+    return os.environ.get(TOKEN_ENVIRONMENT_VARIABLE) or None
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str) -> None:
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def _request(
+    address: Address,
+    method: str,
+    path: str,
+    body: bytes | None = None,
+    content_type: str | None = None,
+    token: str | None = None,
+) -> bytes:
+    """Sends a request to the server and waits for the response, which may take as long as the job does.
+
+    :param token: Token the server requires, if any. Defaults to $IMAGE_TOOLS_SERVER_TOKEN.
+    :return: Response body."""
+
+    if isinstance(address, str):
+        connection: http.client.HTTPConnection = _UnixHTTPConnection(address)
+    else:
+        connection = http.client.HTTPConnection(*address)
+    if token is None:
+        token = get_default_token()
+    try:
+        headers = {} if content_type is None else {"Content-Type": content_type}
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        data = response.read()
+    finally:
+        connection.close()
+    if response.status != http.HTTPStatus.OK:
+        raise ServerError(response.status, data.decode(errors="replace").strip() or response.reason)
+    return data
+
+
+def get_health(address: Address, token: str | None = None) -> dict[str, Any]:
+    return json.loads(_request(address, "GET", "/health", token=token))
+
+
+def get_metrics(address: Address, token: str | None = None) -> dict[str, Any]:
+    return json.loads(_request(address, "GET", "/metrics", token=token))
+
+
+def run_tool(
+    address: Address, tool: str, args: list[str], cwd: str | None = None, token: str | None = None
+) -> JobResult:
+    """Runs a command line tool on the server, as if it was run locally with `args`.
+
+    :param cwd: Directory relative paths in `args` are relative to. Defaults to the current directory."""
+
+    body = json.dumps({"args": args, "cwd": os.path.abspath(cwd or os.getcwd())}).encode()
+    response = _request(address, "POST", f"/run/{quote(tool)}", body, "application/json", token)
+    return JobResult(**json.loads(response))
+
+
+def process_image(
+    address: Address, tool: str, data: bytes, args: list[str], format: str | None = None, token: str | None = None
+) -> bytes:
+    """Processes an image in memory on the server, like the tool's library `process()` function.
+
+    :param args: The tool's command line options which affect the output image, e.g. ["--border-size", "0.05"].
+    :param format: Output image format. Defaults to the input format.
+    :return: Output image file content."""
+
+    query = urlencode([("arg", arg) for arg in args] + ([("format", format)] if format else []))
+    return _request(address, "POST", f"/process/{quote(tool)}?{query}", data, "application/octet-stream", token)
@@ -0,0 +1,388 @@
+"""Long-running server which runs the image tools in a pool of warm worker processes, so each job doesn't pay for
+interpreter startup and imports.
+
+Endpoints:
+- `GET /health`: Whether the server is up.
+- `GET /metrics`: Job counts and timings, as JSON.
+- `POST /run/TOOL`: Runs a command line tool. The body is JSON `{"args": [...], "cwd": "..."}`. Responds with the exit
+  code and output, as JSON.
+- `POST /process/TOOL?arg=...&format=...`: Processes the image in the body in memory, and responds with the output
+  image. `arg` is repeated for each command line option to use.
+
+Jobs can read and write any file the server's user can, so the server only accepts requests from that user: by default
+it listens on a Unix socket which only that user can connect to. On TCP, which any local user (or a web page, through
+the browser) can connect to, every request must have the token in an `Authorization: Bearer TOKEN` header, and the
+`Host` header must be the server's address.
+"""
+
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, TypeVar
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from image_tools.server import worker
+from image_tools.server.client import (
+    TOKEN_ENVIRONMENT_VARIABLE,
+    TOOLS,
+    Address,
+    JobResult,
+    format_address,
+    get_default_socket_path,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class ServerOptions:
+    address: Address
+    workers: int  # Number of jobs run at once
+    max_queued: int  # Jobs waiting for a worker before new jobs are rejected
+    token: str | None = None  # Required in every request if given. Must be given to listen on TCP.
+
+
+class WorkerPool:
+    """Worker processes which stay running between jobs."""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Spawn rather than fork, since the server has other threads running.
+        return ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=worker.init_worker
+        )
+
+    def start(self) -> None:
+        """Starts all the workers, and waits until they're ready."""
+
+        for future in [self._executor.submit(worker.ping) for _ in range(self.workers)]:
+            future.result()
+
+    def run(self, on_start: Callable[[], None], func: Callable[..., T], *args: Any) -> T:
+        """Runs a job, waiting for a worker to be free first.
+
+        :param on_start: Called once the job has a worker."""
+
+        with self._slots:
+            on_start()
+            executor = self._executor
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory). Replace the pool so later jobs can still run.
+                with self._lock:
+                    if self._executor is executor:
+                        logger.warning("Worker process died, restarting workers")
+                        self._executor = self._create_executor()
+                raise
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.start = time.monotonic()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.job_seconds = 0.0
+
+    def try_admit(self, limit: int) -> bool:
+        """Adds a queued job, unless there are already `limit` jobs queued or running."""
+
+        with self._lock:
+            if self.queued + self.running >= limit:
+                self.rejected += 1
+                return False
+            self.queued += 1
+            return True
+
+    def start_job(self) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+
+    def finish_job(self, started: bool, succeeded: bool, seconds: float) -> None:
+        with self._lock:
+            if started:
+                self.running -= 1
+            else:
+                self.queued -= 1
+            if succeeded:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.job_seconds += seconds
+
+    def to_json(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "uptime_seconds": time.monotonic() - self.start,
+                "jobs_queued": self.queued,
+                "jobs_running": self.running,
+                "jobs_completed": self.completed,
+                "jobs_failed": self.failed,
+                "jobs_rejected": self.rejected,
+                "job_seconds_total": self.job_seconds,
+            }
+
+
+class _RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server: "ImageToolsServer"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self._handle(self._get)
+
+    def do_POST(self) -> None:
+        self._handle(self._post)
+
+    def _handle(self, route: Callable[[str, dict[str, list[str]]], tuple[bytes, str]]) -> None:
+        url = urlsplit(self.path)
+        try:
+            self._check_authorized()
+            body, content_type = route(url.path, parse_qs(url.query))
+        except _RequestError as e:
+            self._respond(e.status, str(e).encode() + b"\n", "text/plain")
+        except Exception as e:
+            logger.exception(f"Request failed: {self.command} {self.path}")
+            self._respond(HTTPStatus.INTERNAL_SERVER_ERROR, f"{e}\n".encode(), "text/plain")
+        else:
+            self._respond(HTTPStatus.OK, body, content_type)
+
+    def _check_authorized(self) -> None:
+        server = self.server
+        # A web page can make the browser send requests to a local address, or to its own host name after resolving it
+        # to one (DNS rebinding). The browser's Host header is then the page's host rather than the server's address.
+        if server.allowed_host is not None and self.headers.get("Host") != server.allowed_host:
+            raise _RequestError(HTTPStatus.FORBIDDEN, f"Host must be {server.allowed_host}")
+        if server.options.token is not None:
+            expected = f"Bearer {server.options.token}".encode()
+            if not hmac.compare_digest(self.headers.get("Authorization", "").encode(), expected):
+                raise _RequestError(HTTPStatus.UNAUTHORIZED, "Missing or invalid token")
+
+    def _get(self, path: str, query: dict[str, list[str]]) -> tuple[bytes, str]:
+        match path:
+            case "/health":
+                return self._json({"status": "ok", "workers": self.server.pool.workers})
+            case "/metrics":
+                metrics = self.server.metrics.to_json()
+                metrics |= {"workers": self.server.pool.workers, "max_queued": self.server.options.max_queued}
+                return self._json(metrics)
+            case _:
+                raise _RequestError(HTTPStatus.NOT_FOUND, f"Not found: {path}")
+
+    def _post(self, path: str, query: dict[str, list[str]]) -> tuple[bytes, str]:
+        # Always read the body, so the connection is left ready for the next request.
+        body = self._read_body()
+        endpoint, _, tool = path.removeprefix("/").partition("/")
+        tool = unquote(tool)
+        if endpoint not in ("run", "process"):
+            raise _RequestError(HTTPStatus.NOT_FOUND, f"Not found: {path}")
+        if tool not in TOOLS:
+            raise _RequestError(HTTPStatus.NOT_FOUND, f"Unknown tool '{tool}', expected one of: {', '.join(TOOLS)}")
+        # Web pages can only send other content types after the browser checks that the server allows it (which it
+        # doesn't), so this stops requests from pages which reach the server despite the Host check.
+        expected_type = "application/json" if endpoint == "run" else "application/octet-stream"
+        if self.headers.get_content_type() != expected_type:
+            raise _RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, f"Content-Type must be {expected_type}")
+
+        if endpoint == "run":
+            try:
+                request = json.loads(body)
+                args = [str(arg) for arg in request["args"]]
+                cwd = str(request["cwd"])
+            except (ValueError, TypeError, KeyError) as e:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, f"Invalid job: {e}")
+            if not os.path.isabs(cwd) or not os.path.isdir(cwd):
+                raise _RequestError(HTTPStatus.BAD_REQUEST, f"Invalid job: cwd '{cwd}' isn't an existing directory")
+            result: JobResult = self._run_job(f"{tool} {args}", worker.run_tool, tool, args, cwd)
+            return self._json(asdict(result))
+        else:
+            args = query.get("arg", [])
+            format = query.get("format", [None])[0]
+            output = self._run_job(f"{tool} in memory", worker.process_image, tool, body, args, format)
+            return output, "application/octet-stream"
+
+    def _run_job(self, description: str, func: Callable[..., T], *args: Any) -> T:
+        server = self.server
+        if not server.metrics.try_admit(server.pool.workers + server.options.max_queued):
+            raise _RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many jobs queued, try again later")
+        started = False
+        succeeded = False
+        start = time.perf_counter()
+
+        def on_start() -> None:
+            nonlocal started
+            started = True
+            server.metrics.start_job()
+
+        try:
+            result = server.pool.run(on_start, func, *args)
+            succeeded = not isinstance(result, JobResult) or result.exit_code == 0
+            return result
+        except ValueError as e:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, str(e))
+        finally:
+            seconds = time.perf_counter() - start
+            server.metrics.finish_job(started, succeeded, seconds)
+            logger.info(f"Job {description} {'succeeded' if succeeded else 'failed'} in {seconds:.3f}s")
+
+    def _read_body(self) -> bytes:
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            raise _RequestError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        return self.rfile.read(int(length))
+
+    @staticmethod
+    def _json(data: Any) -> tuple[bytes, str]:
+        return json.dumps(data).encode(), "application/json"
+
+    def _respond(self, status: HTTPStatus, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        if status != HTTPStatus.OK:
+            # The request body may not have been read.
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address.
+        return str(self.client_address[0]) if self.client_address else "local"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+class ImageToolsServer(ThreadingHTTPServer):
+    def __init__(self, options: ServerOptions, pool: WorkerPool) -> None:
+        self.options = options
+        self.pool = pool
+        self.metrics = Metrics()
+        # Host header requests must have, or None if any is allowed.
+        self.allowed_host: str | None = None
+        if isinstance(options.address, str):
+            self.address_family = socket.AF_UNIX
+            _prepare_socket_path(options.address)
+        super().__init__(options.address, _RequestHandler)  # type: ignore
+
+    def server_bind(self) -> None:
+        if self.address_family == socket.AF_UNIX:
+            # Only the server's user may connect. Set while binding, so the socket is never accessible to others.
+            previous_umask = os.umask(0o177)
+            try:
+                # HTTPServer expects a host and port.
+                socketserver.TCPServer.server_bind(self)
+            finally:
+                os.umask(previous_umask)
+            self.server_name = "localhost"
+            self.server_port = 0
+        else:
+            super().server_bind()
+            host = self.server_address[0]
+            # The actual port, in case port 0 was requested.
+            self.allowed_host = f"[{host}]:{self.server_port}" if ":" in host else f"{host}:{self.server_port}"
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.address_family == socket.AF_UNIX:
+            Path(self.options.address).unlink(missing_ok=True)  # type: ignore
+
+
+def check_server_options(options: ServerOptions) -> None:
+    """:raise ValueError: If the server wouldn't be safe to run with these options."""
+
+    if not isinstance(options.address, str) and options.token is None:
+        raise ValueError(
+            f"A token is required to listen on TCP address {format_address(options.address)}, set "
+            f"${TOKEN_ENVIRONMENT_VARIABLE}, or use a Unix socket"
+        )
+
+
+def _prepare_socket_path(path: str) -> None:
+    if path == get_default_socket_path():
+        # The default is in a directory which only this user may access, which is created if needed. It may be in a
+        # shared temporary directory, where another user could have created it first.
+        directory = Path(path).parent
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        directory_stat = directory.stat()
+        if directory_stat.st_uid != os.getuid() or directory_stat.st_mode & 0o077:
+            raise ValueError(f"Socket directory '{directory}' must be owned by and only accessible to this user")
+    # Replace a socket left behind by a server which didn't shut down cleanly, but nothing else. Binding fails if it's
+    # another kind of file.
+    try:
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            # Nothing is listening.
+            os.unlink(path)
+            return
+    raise ValueError(f"Another server is already listening on '{path}'")
+
+
+def create_server(options: ServerOptions) -> ImageToolsServer:
+    """Starts the worker processes and binds the server's address. Call `serve_forever()` to handle requests.
+
+    :raise ValueError: If the server wouldn't be safe to run with these options."""
+
+    check_server_options(options)
+    pool = WorkerPool(options.workers)
+    try:
+        pool.start()
+        return ImageToolsServer(options, pool)
+    except BaseException:
+        pool.shutdown()
+        raise
+
+
+def serve(options: ServerOptions) -> None:
+    """Runs the server until interrupted."""
+
+    logger.info(f"Starting {options.workers} workers")
+    server = create_server(options)
+    logger.info(f"Listening on {format_address(options.address)} (process {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.pool.shutdown()
+        logger.info("Stopped")
@@ -0,0 +1,83 @@
+"""Jobs which run in the server's worker processes. Each worker runs one job at a time."""
+
+import importlib
+import logging
+import os
+import signal
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from types import ModuleType
+
+from PIL import UnidentifiedImageError
+
+from image_tools.server.client import TOOLS, JobResult
+
+
+def _import_tool(tool: str, module: str = "") -> ModuleType:
+    return importlib.import_module(TOOLS[tool] + module)
+
+
+def init_worker() -> None:
+    # The server handles interrupts and shuts the workers down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Import everything up front, so the first job doesn't pay for it.
+    for tool in TOOLS:
+        _import_tool(tool, ".api")
+        _import_tool(tool, ".cli")
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def ping() -> None:
+    pass
+
+
+def run_tool(tool: str, args: list[str], cwd: str) -> JobResult:
+    """Runs a command line tool, capturing its output."""
+
+    cli = _import_tool(tool, ".cli")
+    stdout = StringIO()
+    stderr = StringIO()
+    log_handler = logging.StreamHandler(stderr)
+    log_handler.setFormatter(logging.Formatter("{levelname}: {message}", style="{"))
+    root_logger = logging.getLogger()
+    previous_handlers = root_logger.handlers
+    previous_level = root_logger.level
+    root_logger.handlers = [log_handler]
+    # The worker pool already processes jobs in parallel, so by default each job uses one process. Later arguments take
+    # precedence, so the tool's arguments can still override this.
+    sys.argv = [tool, "--jobs", "1", *args]
+    exit_code = 0
+    try:
+        os.chdir(cwd)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            cli.main()
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except OSError as e:
+        stderr.write(f"ERROR: Cannot change to directory '{cwd}': {e}\n")
+        exit_code = 1
+    finally:
+        root_logger.handlers = previous_handlers
+        root_logger.setLevel(previous_level)
+    return JobResult(exit_code, stdout.getvalue(), stderr.getvalue())
+
+
+def process_image(tool: str, data: bytes, args: list[str], format: str | None) -> bytes:
+    """Processes an image in memory with the tool's library API.
+
+    :param args: Command line options for the image processing.
+    :raise ValueError: If `args` are invalid, or `data` isn't a supported image."""
+
+    cli = _import_tool(tool, ".cli")
+    errors = StringIO()
+    sys.argv = [tool]
+    try:
+        with redirect_stderr(errors):
+            config = cli.get_config(["-", *args])
+    except SystemExit:
+        raise ValueError(errors.getvalue().strip()) from None
+    try:
+        return _import_tool(tool).process(data, config, format)
+    except UnidentifiedImageError as e:
+        raise ValueError(str(e)) from None
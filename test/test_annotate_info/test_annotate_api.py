@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from colour import Color
+from PIL import Image
+
+from image_tools.annotate_info import ProcessingOptions, process
+from image_tools.annotate_info.text import TextPosition
+
+
+def make_png(size: tuple[int, int]) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_process_inputs_match() -> None:
+    data = make_png((1000, 800))
+    output = process(data)
+    assert process(BytesIO(data)) == output
+    output_image = Image.open(BytesIO(output))
+    assert output_image.format == "PNG"
+    assert output_image.getbbox() is not None
+
+    decoded = Image.open(BytesIO(data))
+    decoded.load()
+    assert process(decoded) == output
+    # The input image isn't drawn on.
+    assert decoded.getextrema() == ((255, 255), (255, 255), (255, 255))
+
+
+def test_process_threads() -> None:
+    inputs = [make_png((400 + 100 * i, 300)) for i in range(6)]
+    options = ProcessingOptions(text_position=TextPosition.MIDDLE, text_colour=Color("blue"))
+    expected = [process(data, options) for data in inputs]
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(lambda data: process(data, options), inputs * 3)) == expected * 3
@@ -0,0 +1,20 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from image_tools.annotate_info.cli import get_config, plan_image, process_image
+from test.helpers import get_test_data
+
+
+@pytest.mark.parametrize("file", ["border_white.jpg", "border_black.jpg"])
+@pytest.mark.parametrize("args", [["--all-info"], ["--camera", "--text-position", "bottom-right"]])
+def test_process_matches_plan(tmp_path: Path, file: str, args: list[str]) -> None:
+    input_path = get_test_data(file)
+    output_path = tmp_path / "output.jpg"
+    args = [str(input_path), *args]
+    process_image(input_path, output_path, get_config(args))
+    record = plan_image(input_path, output_path, get_config([*args, "--dry-run"]))
+    output = Image.open(output_path)
+    assert (output.format, output.mode) == (record["format"], record["mode"])
+    assert output.size == (record["width"], record["height"])
@@ -0,0 +1,36 @@
+import pytest
+from colour import Color
+from PIL import Image, ImageChops, ImageDraw
+
+from image_tools.annotate_info.text import (
+    TextPosition,
+    calculate_font_size,
+    calculate_text_position_and_anchor,
+    draw_annotation_text,
+    render_text_mask,
+)
+
+TEXT = "Camera\nLens  @ 50mm\nf/2.8  1/250s  ISO100"
+
+
+@pytest.mark.parametrize("position", list(TextPosition))
+@pytest.mark.parametrize("mode", ["RGB", "L", "1"])
+def test_draw_annotation_text_matches_direct_drawing(position: TextPosition, mode: str) -> None:
+    image = Image.new(mode, (1200, 800), "white")
+    colour = Color("red")
+
+    expected = image.copy()
+    font_size = calculate_font_size(expected.size)
+    xy, anchor = calculate_text_position_and_anchor(expected.size, position)
+    ImageDraw.Draw(expected).text(xy=xy, anchor=anchor, text=TEXT, fill=colour.get_hex_l(), font_size=font_size)
+
+    actual = draw_annotation_text(image.copy(), TEXT, position, colour)
+    assert ImageChops.difference(actual.convert("RGB"), expected.convert("RGB")).getbbox() is None
+
+
+def test_text_mask_is_reused() -> None:
+    render_text_mask.cache_clear()
+    for _ in range(3):
+        draw_annotation_text(Image.new("RGB", (1000, 600)), TEXT, TextPosition.BOTTOM_RIGHT, Color("white"))
+    info = render_text_mask.cache_info()
+    assert (info.hits, info.misses) == (2, 1)
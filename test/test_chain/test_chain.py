@@ -0,0 +1,59 @@
+from argparse import ArgumentTypeError
+from pathlib import Path
+
+import numpy as np
+import pytest
+from colour import Color
+from PIL import Image
+
+from image_tools.annotate_info import processing as annotate_processing
+from image_tools.annotate_info.options import AnnotationOptions, TextPosition
+from image_tools.annotate_info.options import ProcessingOptions as AnnotateOptions
+from image_tools.chain import processing
+from image_tools.chain.cli import get_config, parse_operation, plan_image, run
+from image_tools.chain.options import AnnotateOperation, BorderOperation, ProcessingOptions, ResizeOperation
+from image_tools.instagramable import processing as instagramable_processing
+from image_tools.instagramable.options import ExistingBorderHandling, ScalingMode
+from image_tools.instagramable.options import ProcessingOptions as InstagramableOptions
+from test.helpers import get_test_data
+
+
+def test_parse_operation() -> None:
+    assert parse_operation("resize") == ResizeOperation()
+    assert parse_operation("resize:max-dimension=1080") == ResizeOperation(max_dimension=1080)
+    assert parse_operation("border:existing-border=add, border-colour=black") == BorderOperation(
+        existing_border_handling=ExistingBorderHandling.ADD, border_colour=Color("black")
+    )
+    assert parse_operation("annotate:info=camera+lens,text-position=bottom-right") == AnnotateOperation(
+        annotate=AnnotationOptions(camera=True, lens=True, exposure=False), text_position=TextPosition.BOTTOM_RIGHT
+    )
+    for text in ["crop", "resize:1080", "resize:max-dimension=big", "border:size=0.1", "annotate:info=lens+iso"]:
+        with pytest.raises(ArgumentTypeError):
+            parse_operation(text)
+
+
+def test_transform_matches_separate_tools() -> None:
+    path = get_test_data("border_black.jpg")
+    options = ProcessingOptions(operations=(AnnotateOperation(), BorderOperation(), ResizeOperation(max_dimension=800)))
+    actual, _ = processing.transform_image(processing.read_image(path, options), options)
+
+    annotated, _ = annotate_processing.transform_image(
+        annotate_processing.read_image(path, AnnotateOptions()), AnnotateOptions()
+    )
+    instagramable_options = InstagramableOptions(max_dimension=800, scaling=ScalingMode.QUALITY)
+    expected, _ = instagramable_processing.transform_image(
+        instagramable_processing.use_decoded_image(annotated), instagramable_options
+    )
+
+    assert actual.size == expected.size
+    diff = np.abs(np.asarray(actual, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+    assert np.mean(diff) < 1
+
+
+def test_run_matches_plan(tmp_path: Path) -> None:
+    args = [str(get_test_data("border_white.jpg")), "--output-dir", str(tmp_path)]
+    args += ["--op", "border:existing-border=add", "--op", "resize:max-dimension=500", "--op", "annotate"]
+    run(args)
+    output_path = tmp_path / "border_white-edited.jpg"
+    record = plan_image(get_test_data("border_white.jpg"), output_path, get_config([*args, "--dry-run"]))
+    assert Image.open(output_path).size == (record["output_width"], record["output_height"])
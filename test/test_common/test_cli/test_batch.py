@@ -0,0 +1,481 @@
+import json
+import os
+import threading
+import time
+from argparse import ArgumentParser, ArgumentTypeError
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+
+from image_tools.common.cli import batch as batch_module
+from image_tools.common.cli.batch import (
+    ImagePipeline,
+    add_batch_arguments,
+    check_output_path,
+    get_batch_options,
+    get_output_image_path,
+    iter_batch_paths,
+    iter_image_input_file_paths,
+    parse_shard,
+    run_batch,
+)
+from image_tools.common.cli.claims import WorkClaims
+from image_tools.common.cli.exception import AppError
+from image_tools.common.image.encoding import OutputFormat
+from image_tools.common.image.imageio import notify_output
+
+
+@pytest.fixture
+def input_tree(tmp_path: Path) -> Path:
+    for name in ["a.jpg", "b.PNG", "notes.txt", "sub/c.jpg", "sub/d.tif", "sub/deeper/e.jpeg", "raw/f.jpg"]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    return tmp_path
+
+
+def relative_names(paths, root: Path) -> set[str]:
+    return {p.relative_to(root).as_posix() for p in paths}
+
+
+def test_iter_image_input_file_paths_directory(input_tree: Path) -> None:
+    paths = iter_image_input_file_paths(str(input_tree))
+    assert relative_names(paths, input_tree) == {"a.jpg", "b.PNG"}
+
+
+def test_iter_image_input_file_paths_recursive(input_tree: Path) -> None:
+    paths = iter_image_input_file_paths(str(input_tree), recursive=True)
+    assert relative_names(paths, input_tree) == {
+        "a.jpg",
+        "b.PNG",
+        "sub/c.jpg",
+        "sub/d.tif",
+        "sub/deeper/e.jpeg",
+        "raw/f.jpg",
+    }
+
+
+def test_iter_image_input_file_paths_filters(input_tree: Path) -> None:
+    paths = iter_image_input_file_paths(str(input_tree), recursive=True, include=["*.jpg"], exclude=["raw", "c.*"])
+    assert relative_names(paths, input_tree) == {"a.jpg"}
+
+    paths = iter_image_input_file_paths(str(input_tree), recursive=True, include=["sub/*"])
+    assert relative_names(paths, input_tree) == {"sub/c.jpg", "sub/d.tif"}
+
+
+def test_iter_image_input_file_paths_glob(input_tree: Path) -> None:
+    # Unsupported files are skipped even if they match.
+    paths = iter_image_input_file_paths(str(input_tree / "*"))
+    assert relative_names(paths, input_tree) == {"a.jpg", "b.PNG"}
+
+    paths = iter_image_input_file_paths(str(input_tree / "**" / "*.jpg"), recursive=True)
+    assert relative_names(paths, input_tree) == {"a.jpg", "sub/c.jpg", "raw/f.jpg"}
+
+
+def test_iter_image_input_file_paths_file(input_tree: Path) -> None:
+    paths = iter_image_input_file_paths(str(input_tree / "notes.txt"))
+    assert relative_names(paths, input_tree) == {"notes.txt"}
+
+
+def test_iter_image_input_file_paths_shard(input_tree: Path) -> None:
+    all_names = relative_names(iter_image_input_file_paths(str(input_tree), recursive=True), input_tree)
+    shards = [
+        relative_names(iter_image_input_file_paths(str(input_tree), recursive=True, shard=(i, 3)), input_tree)
+        for i in range(1, 4)
+    ]
+    assert sum(len(shard) for shard in shards) == len(all_names)
+    assert set().union(*shards) == all_names
+
+    # Globs shard files by the same relative paths.
+    for i, shard in enumerate(shards, 1):
+        paths = iter_image_input_file_paths(str(input_tree / "**" / "*"), recursive=True, shard=(i, 3))
+        assert relative_names(paths, input_tree) == shard
+
+
+def test_parse_shard() -> None:
+    assert parse_shard("2/4") == (2, 4)
+    for text in ["0/4", "5/4", "1", "a/b"]:
+        with pytest.raises(ArgumentTypeError):
+            parse_shard(text)
+
+
+def test_iter_batch_paths_is_lazy(input_tree: Path) -> None:
+    (input_tree / "a-out.jpg").touch()
+    paths = iter_batch_paths([input_tree / "b.PNG", input_tree / "a.jpg"], None, "-out", allow_overwrite=False)
+    assert next(paths) == (input_tree / "b.PNG", input_tree / "b-out.PNG")
+    with pytest.raises(AppError):
+        next(paths)
+
+
+def test_get_output_image_path_format() -> None:
+    input_path = Path("in/photo.v2.jpeg")
+    assert get_output_image_path(input_path, None, "-out") == Path("in/photo-out.v2.jpeg")
+    assert get_output_image_path(input_path, Path("out"), "", OutputFormat.JPEG) == Path("out/photo.v2.jpeg")
+    assert get_output_image_path(input_path, None, "-out", OutputFormat.WEBP) == Path("in/photo-out.v2.webp")
+    assert get_output_image_path(Path("a.TIF"), None, "", OutputFormat.PNG) == Path("a.png")
+
+
+@dataclass(frozen=True)
+class FakeConfig:
+    dry_run: bool = False
+    allow_overwrite: bool = False
+    input_path: str = ""
+
+
+def read_text(input_path: Path, config: FakeConfig) -> str:
+    text = input_path.read_text()
+    if text == "bad":
+        raise ValueError(f"Bad input: {input_path.name}")
+    return text
+
+
+def transform_text(text: str, config: FakeConfig) -> str:
+    return text.upper()
+
+
+def write_text(text: str, output_path: Path, config: FakeConfig) -> None:
+    output_path.write_text(text)
+
+
+def process_text(input_path: Path, output_path: Path, config: FakeConfig) -> None:
+    write_text(transform_text(read_text(input_path, config), config), output_path, config)
+
+
+TEXT_PIPELINE = ImagePipeline(read_text, transform_text, write_text)
+
+
+def make_batch_paths(tmp_path: Path, texts: list[str]) -> list[tuple[Path, Path]]:
+    paths = []
+    for i, text in enumerate(texts):
+        input_path = tmp_path / f"{i}.txt"
+        input_path.write_text(text)
+        paths.append((input_path, tmp_path / f"{i}-out.txt"))
+    return paths
+
+
+def parse_batch_options(args: list[str]):
+    parser = ArgumentParser()
+    add_batch_arguments(parser)
+    parser.add_argument("--dry-run", action="store_true")
+    return get_batch_options(parser, parser.parse_args(args))
+
+
+@pytest.mark.parametrize("threads", ["1,1,1", "2,3,2"])
+def test_run_batch_pipelined(tmp_path: Path, threads: str) -> None:
+    paths = make_batch_paths(tmp_path, [f"image {i}" for i in range(20)])
+    stats_path = tmp_path / "stats.jsonl"
+    options = parse_batch_options(["--pipeline-threads", threads, "--stats", str(stats_path)])
+    assert run_batch(process_text, paths, FakeConfig(), options, pipeline=TEXT_PIPELINE) == 20
+    assert [output_path.read_text() for _, output_path in paths] == [f"IMAGE {i}" for i in range(20)]
+    records = [json.loads(line) for line in stats_path.read_text().splitlines()]
+    assert [r["input"] for r in records[:-1]] == [str(input_path) for input_path, _ in paths]
+    assert records[-1]["images"] == 20
+
+
+def test_run_batch_pipelined_errors(tmp_path: Path) -> None:
+    paths = make_batch_paths(tmp_path, ["a", "bad", "c"])
+    options = parse_batch_options(["--pipeline-threads", "1,1,1", "--continue-on-error"])
+    with pytest.raises(AppError, match="Failed to process 1 of 3 images"):
+        run_batch(process_text, paths, FakeConfig(), options, pipeline=TEXT_PIPELINE)
+    assert paths[2][1].read_text() == "C"
+
+    options = parse_batch_options(["--pipeline-threads", "1,1,1"])
+    with pytest.raises(AppError, match="Bad input: 1.txt"):
+        run_batch(
+            process_text, make_batch_paths(tmp_path, ["a", "bad", "c"]), FakeConfig(), options, pipeline=TEXT_PIPELINE
+        )
+
+
+class ConcurrencyTracker:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.current = 0
+        self.maximum = 0
+
+    def start(self, input_path: Path, config: FakeConfig) -> str:
+        with self.lock:
+            self.current += 1
+            self.maximum = max(self.maximum, self.current)
+        time.sleep(0.01)
+        return read_text(input_path, config)
+
+    def finish(self, text: str, output_path: Path, config: FakeConfig) -> None:
+        write_text(text, output_path, config)
+        with self.lock:
+            self.current -= 1
+
+
+@pytest.mark.parametrize("budget, expected_maximum", [("100", 1), ("130", 2)])
+def test_run_batch_memory_budget(tmp_path: Path, budget: str, expected_maximum: int) -> None:
+    paths = make_batch_paths(tmp_path, ["image"] * 12)
+    tracker = ConcurrencyTracker()
+    pipeline = ImagePipeline(tracker.start, transform_text, tracker.finish)
+    options = parse_batch_options(["--pipeline-threads", "4,4,4", "--memory-budget", budget])
+    run_batch(process_text, paths, FakeConfig(), options, pipeline=pipeline, memory_estimator=lambda path, config: 60)
+    assert tracker.maximum == expected_maximum
+
+
+def get_text_output_paths(output_path: Path, config: FakeConfig) -> list[Path]:
+    return [output_path, output_path.with_suffix(".lower.txt")]
+
+
+def transform_text_variants(text: str, config: FakeConfig) -> list[str]:
+    return [text.upper(), text.lower()]
+
+
+def write_text_variants(texts: list[str], output_path: Path, config: FakeConfig) -> None:
+    for text, path in zip(texts, get_text_output_paths(output_path, config)):
+        path.write_text(text)
+
+
+def process_text_variants(input_path: Path, output_path: Path, config: FakeConfig) -> None:
+    write_text_variants(transform_text_variants(read_text(input_path, config), config), output_path, config)
+
+
+@pytest.mark.parametrize("pipeline_args", [[], ["--pipeline-threads", "1,1,1"]])
+def test_run_batch_multiple_outputs(tmp_path: Path, pipeline_args: list[str]) -> None:
+    paths = make_batch_paths(tmp_path, ["Image 0", "Image 1"])
+    output_paths = [path for _, output_path in paths for path in get_text_output_paths(output_path, FakeConfig())]
+    stats_path = tmp_path / "stats.jsonl"
+    options = parse_batch_options(["--cache-dir", str(tmp_path / "cache"), "--stats", str(stats_path), *pipeline_args])
+    pipeline = ImagePipeline(read_text, transform_text_variants, write_text_variants)
+
+    def run() -> list[dict]:
+        run_batch(
+            process_text_variants,
+            paths,
+            FakeConfig(),
+            options,
+            pipeline=pipeline,
+            output_paths_func=get_text_output_paths,
+        )
+        return [json.loads(line) for line in stats_path.read_text().splitlines()][:-1]
+
+    records = run()
+    assert [(r["cached"], r["bytes_written"]) for r in records] == [(False, 14), (False, 14)]
+
+    # All the outputs are restored from the cache.
+    for path in output_paths:
+        path.unlink()
+    records = run()
+    assert [(r["cached"], r["bytes_written"]) for r in records] == [(True, 14), (True, 14)]
+    assert [path.read_text() for path in output_paths] == ["IMAGE 0", "image 0", "IMAGE 1", "image 1"]
+
+
+@pytest.mark.parametrize("mode_args", [["--jobs", "1"], ["--jobs", "2"], ["--pipeline-threads", "1,1,1"]])
+def test_run_batch_claims(tmp_path: Path, mode_args: list[str]) -> None:
+    paths = make_batch_paths(tmp_path, ["done", "claimed", "stale", "new", "bad"])
+    claim_dir = tmp_path / "claims"
+    config = FakeConfig(input_path=str(tmp_path))
+    # Another process finished the first image, is working on the second, and crashed while working on the third.
+    other = WorkClaims(claim_dir, timeout=60)
+    assert list(other.iter_claimed(paths[:3], lambda path: path.name)) == paths[:3]
+    other.complete("0.txt")
+    stale_claim = next(
+        path for path in claim_dir.iterdir() if json.loads(path.read_text() or "{}").get("input") == "2.txt"
+    )
+    os.utime(stale_claim, (time.time() - 120, time.time() - 120))
+
+    options = parse_batch_options(
+        ["--claim-dir", str(claim_dir), "--claim-timeout", "60", "--continue-on-error", *mode_args]
+    )
+    with pytest.raises(AppError, match="Failed to process 1 of 3 images"):
+        run_batch(process_text, paths, config, options, pipeline=TEXT_PIPELINE)
+    assert [output_path.exists() for _, output_path in paths] == [False, False, True, True, False]
+
+    # Done images are skipped by later runs, and the failed image's claim was released so it can be tried again.
+    paths[4][0].write_text("fixed")
+    assert run_batch(process_text, paths, config, options, pipeline=TEXT_PIPELINE) == 1
+    assert paths[4][1].read_text() == "FIXED"
+    assert sorted(path.suffix for path in claim_dir.iterdir()) == [".claim", ".done", ".done", ".done", ".done"]
+
+
+def test_work_claims_takeover(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    crashed, slow, late = (WorkClaims(tmp_path, timeout=60) for _ in range(3))
+    assert crashed.claim("a")
+    (claim_path,) = tmp_path.iterdir()
+    os.utime(claim_path, (time.time() - 120, time.time() - 120))
+    assert slow.claim("a")
+    assert json.loads(claim_path.read_text())["owner"] == slow.owner
+
+    # As if the late process saw the crashed process's stale claim before the slow one took it over. The claim it then
+    # moves away isn't stale, so it's put back.
+    stale_checks = iter([True])
+    is_stale = late._is_stale
+    monkeypatch.setattr(late, "_is_stale", lambda *args: next(stale_checks, False) or is_stale(*args))
+    assert not late.claim("a")
+    assert json.loads(claim_path.read_text())["owner"] == slow.owner
+
+    # The crashed process's claim was taken over, so it doesn't remove the slow process's claim.
+    crashed.complete("a")
+    assert json.loads(claim_path.read_text())["owner"] == slow.owner
+    slow.complete("a")
+    assert [path.suffix for path in tmp_path.iterdir()] == [".done"]
+
+
+@pytest.mark.parametrize("mode_args", [["--jobs", "1"], ["--jobs", "2"], ["--pipeline-threads", "1,1,1"]])
+def test_run_batch_resume(tmp_path: Path, mode_args: list[str]) -> None:
+    paths = make_batch_paths(tmp_path, ["a", "bad", "c", "d"])
+    journal_path = tmp_path / "journal.jsonl"
+    options = parse_batch_options(["--journal", str(journal_path), "--continue-on-error", *mode_args])
+    with pytest.raises(AppError, match="Failed to process 1 of 4 images"):
+        run_batch(process_text, paths, FakeConfig(), options, pipeline=TEXT_PIPELINE)
+
+    # As if the run was killed after writing the last image, but before recording it as finished.
+    lines = journal_path.read_text().splitlines()
+    journal_path.write_text("\n".join(line for line in lines if not ("finish" in line and "3.txt" in line)) + "\n{")
+    paths[1][0].write_text("fixed")
+    paths[3][0].write_text("new d")
+
+    # Finished images are skipped even though their outputs exist, and the others are processed again.
+    options = parse_batch_options(["--journal", str(journal_path), "--resume", *mode_args])
+    assert run_batch(process_text, paths, FakeConfig(), options, pipeline=TEXT_PIPELINE) == 2
+    assert [output_path.read_text() for _, output_path in paths] == ["A", "FIXED", "C", "NEW D"]
+    # The partly written line doesn't affect the entries after it.
+    assert journal_path.read_text().splitlines().count("{") == 1
+
+    assert run_batch(process_text, paths, FakeConfig(), options, pipeline=TEXT_PIPELINE) == 0
+
+
+def write_new_text(text: str, output_path: Path, config: FakeConfig) -> None:
+    # As the tools do, checked when written in case outputs weren't checked before the batch.
+    check_output_path(output_path, config.allow_overwrite)
+    write_text(text, output_path, config)
+
+
+def process_new_text(input_path: Path, output_path: Path, config: FakeConfig) -> None:
+    write_new_text(transform_text(read_text(input_path, config), config), output_path, config)
+
+
+@pytest.mark.parametrize("mode_args", [["--jobs", "1"], ["--pipeline-threads", "1,1,1"]])
+def test_run_batch_resume_keeps_existing_outputs(tmp_path: Path, mode_args: list[str]) -> None:
+    pipeline = ImagePipeline(read_text, transform_text, write_new_text)
+    paths = make_batch_paths(tmp_path, ["a", "b"])
+    paths[1][1].write_text("existing")
+    journal_path = tmp_path / "journal.jsonl"
+    options = parse_batch_options(["--journal", str(journal_path), "--continue-on-error", *mode_args])
+    with pytest.raises(AppError, match="Failed to process 1 of 2 images"):
+        run_batch(process_new_text, paths, FakeConfig(), options, pipeline=pipeline)
+
+    # The output which existed before the batch isn't the batch's to replace, so the image fails again.
+    options = parse_batch_options(["--journal", str(journal_path), "--resume", "--continue-on-error", *mode_args])
+    with pytest.raises(AppError, match="Failed to process 1 of 1 images"):
+        run_batch(process_new_text, paths, FakeConfig(), options, pipeline=pipeline)
+    assert [output_path.read_text() for _, output_path in paths] == ["A", "existing"]
+
+
+def write_recorded_text(text: str, output_path: Path, config: FakeConfig) -> None:
+    # As save_image() does, so the journal records the output.
+    check_output_path(output_path, config.allow_overwrite)
+    notify_output(output_path)
+    write_text(text, output_path, config)
+
+
+def process_recorded_text(input_path: Path, output_path: Path, config: FakeConfig) -> None:
+    write_recorded_text(transform_text(read_text(input_path, config), config), output_path, config)
+
+
+@pytest.mark.parametrize("mode_args", [["--jobs", "1"], ["--jobs", "2"], ["--pipeline-threads", "1,1,1"]])
+def test_run_batch_resume_replaces_recorded_outputs(tmp_path: Path, mode_args: list[str]) -> None:
+    pipeline = ImagePipeline(read_text, transform_text, write_recorded_text)
+    paths = make_batch_paths(tmp_path, ["a", "b", "c"])
+    journal_path = tmp_path / "journal.jsonl"
+    options = parse_batch_options(["--journal", str(journal_path), *mode_args])
+    assert run_batch(process_recorded_text, paths[:2], FakeConfig(), options, pipeline=pipeline) == 2
+    lines = journal_path.read_text().splitlines()
+    assert sum('"output"' in line for line in lines) == 2
+
+    # As if the run was killed before recording that the images finished, and the last image had only been started.
+    # Its output was then written by something else.
+    lines = [line for line in lines if '"finish"' not in line]
+    lines.append(json.dumps({"event": "start", "input": os.path.abspath(paths[2][0]), "time": time.time()}))
+    journal_path.write_text("\n".join(lines) + "\n")
+    paths[2][1].write_text("existing")
+
+    # The outputs the batch wrote are replaced, but not the other one.
+    options = parse_batch_options(["--journal", str(journal_path), "--resume", "--continue-on-error", *mode_args])
+    with pytest.raises(AppError, match="Failed to process 1 of 3 images"):
+        run_batch(process_recorded_text, paths, FakeConfig(), options, pipeline=pipeline)
+    assert [output_path.read_text() for _, output_path in paths] == ["A", "B", "existing"]
+
+
+def test_run_batch_watch_skips_outputs(tmp_path: Path) -> None:
+    # As if the watch noticed an image, then its output, which is written to the same directory.
+    input_path = tmp_path / "a.txt"
+    input_path.write_text("a")
+    output_path = tmp_path / "a-out.txt"
+    paths = [(input_path, output_path), (output_path, tmp_path / "a-out-out.txt")]
+    options = parse_batch_options(["--watch", "--watch-settle", "0"])
+    assert options.continue_on_error
+    assert run_batch(process_text, paths, FakeConfig(input_path=str(tmp_path)), options) == 1
+    assert output_path.read_text() == "A"
+    assert not (tmp_path / "a-out-out.txt").exists()
+
+
+@pytest.mark.parametrize("spelling", ["relative", "dot", "symlink"])
+def test_run_batch_watch_skips_outputs_spelled_differently(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, spelling: str
+) -> None:
+    # As if the output directory was given as the watched directory, but spelled another way.
+    monkeypatch.chdir(tmp_path)
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    match spelling:
+        case "relative":
+            output_dir = Path("input")
+        case "dot":
+            output_dir = Path(f"./input/../{input_dir.name}/.")
+        case "symlink":
+            output_dir = tmp_path / "link"
+            output_dir.symlink_to(input_dir)
+        case v:  # type: ignore
+            raise AssertionError(v)
+    input_path = input_dir / "a.txt"
+    input_path.write_text("a")
+    output_path = output_dir / "a-out.txt"
+    paths = [(input_path, output_path), (input_dir / "a-out.txt", output_dir / "a-out-out.txt")]
+    options = parse_batch_options(["--watch", "--watch-settle", "0"])
+    assert run_batch(process_text, paths, FakeConfig(input_path=str(input_dir)), options) == 1
+    assert (input_dir / "a-out.txt").read_text() == "A"
+    assert not (input_dir / "a-out-out.txt").exists()
+
+
+def test_run_batch_watch_forgets_old_outputs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(batch_module, "MAX_REMEMBERED_OUTPUTS", 2)
+    paths = make_batch_paths(tmp_path, ["a", "b", "c"])
+    # The first output is forgotten by the time it's seen, but the last is still remembered.
+    paths += [(paths[0][1], tmp_path / "0-out-out.txt"), (paths[2][1], tmp_path / "2-out-out.txt")]
+    options = parse_batch_options(["--watch", "--watch-settle", "0"])
+    assert run_batch(process_text, paths, FakeConfig(input_path=str(tmp_path)), options) == 4
+    assert (tmp_path / "0-out-out.txt").exists()
+    assert not (tmp_path / "2-out-out.txt").exists()
+
+
+def estimate_text_cost(input_path: Path, config: FakeConfig) -> tuple[str, float]:
+    return "text", float(len(input_path.read_text()))
+
+
+@pytest.mark.parametrize("mode_args", [["--jobs", "1"], ["--jobs", "2"], ["--pipeline-threads", "1,1,1"]])
+def test_run_batch_largest_first(tmp_path: Path, mode_args: list[str]) -> None:
+    paths = make_batch_paths(tmp_path, ["a", "ccc", "bad", "dddd", "bb"])
+    stats_path = tmp_path / "stats.jsonl"
+    model_path = tmp_path / "cost.json"
+    options = parse_batch_options(
+        ["--largest-first", "--cost-model", str(model_path), "--stats", str(stats_path), "--continue-on-error"]
+        + mode_args
+    )
+    with pytest.raises(AppError, match="Failed to process 1 of 5 images"):
+        run_batch(process_text, paths, FakeConfig(), options, pipeline=TEXT_PIPELINE, cost_estimator=estimate_text_cost)
+    assert [output_path.exists() for _, output_path in paths] == [True, True, False, True, True]
+
+    processed = [json.loads(line)["input"] for line in stats_path.read_text().splitlines()[:-1]]
+    expected = [str(paths[i][0]) for i in (3, 1, 4, 0)]
+    if mode_args == ["--jobs", "1"]:
+        assert processed == expected
+    else:
+        # Handled as they finish.
+        assert sorted(processed) == sorted(expected)
+    # The failed image isn't learned from.
+    totals = json.loads(model_path.read_text())["classes"]["text"]
+    assert (totals["images"], totals["megapixels"]) == (4, 10.0)
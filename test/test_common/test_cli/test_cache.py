@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+from image_tools.common.cli.cache import ResultCache
+
+
+@dataclass(frozen=True)
+class FakeConfig:
+    input_path: str
+    dry_run: bool
+    max_dimension: int
+
+
+def write_file(path: Path, content: bytes) -> Path:
+    path.write_bytes(content)
+    return path
+
+
+def test_result_cache_key(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path / "cache", 10**6)
+    input_a = write_file(tmp_path / "a.jpg", b"a")
+    input_a_copy = write_file(tmp_path / "a_copy.jpg", b"a")
+    input_b = write_file(tmp_path / "b.jpg", b"b")
+    config = FakeConfig("a.jpg", dry_run=False, max_dimension=100)
+
+    key = cache.get_key(input_a, "tool", config)
+    # Only the content and output-affecting config matter.
+    assert cache.get_key(input_a_copy, "tool", FakeConfig("other", dry_run=True, max_dimension=100)) == key
+    assert cache.get_key(input_b, "tool", config) != key
+    assert cache.get_key(input_a, "other_tool", config) != key
+    assert cache.get_key(input_a, "tool", FakeConfig("a.jpg", dry_run=False, max_dimension=200)) != key
+
+    write_file(input_a, b"changed")
+    assert cache.get_key(input_a, "tool", config) != key
+
+
+def test_result_cache_store_restore(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path / "cache", 10**6)
+    output = write_file(tmp_path / "output.jpg", b"output")
+    assert not cache.restore("key", tmp_path / "restored.jpg")
+    cache.store("key", output)
+    assert cache.restore("key", tmp_path / "restored.jpg")
+    assert (tmp_path / "restored.jpg").read_bytes() == b"output"
+
+
+def test_result_cache_lru_eviction(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path / "cache", 25)
+    output = write_file(tmp_path / "output.jpg", b"0123456789")
+    cache.store("a", output)
+    cache.store("b", output)
+    # Access "a" so "b" is least recently used.
+    assert cache.restore("a", tmp_path / "restored.jpg")
+    cache.store("c", output)
+    assert cache.restore("a", tmp_path / "restored.jpg")
+    assert not cache.restore("b", tmp_path / "restored.jpg")
+    assert cache.restore("c", tmp_path / "restored.jpg")
@@ -0,0 +1,116 @@
+import os
+from argparse import ArgumentTypeError
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import ExifTags, Image
+
+from image_tools.common.cli import index as index_module
+from image_tools.common.cli.index import ImageIndex, iter_indexed_image_paths
+from image_tools.common.cli.index_filter import IndexFilter, parse_index_filter
+from image_tools.common.image.border import BorderSize, detect_border, detect_border_multi_resolution
+
+
+def write_image(
+    path: Path, size: tuple[int, int], camera: str, lens: str, exposure_time: float, border: int = 0
+) -> None:
+    data = np.full((size[1], size[0], 3), 255, dtype=np.uint8)
+    data[border : size[1] - border, border : size[0] - border] = np.random.default_rng(0).integers(
+        0, 256, size=(size[1] - 2 * border, size[0] - 2 * border, 3)
+    )
+    exif = Image.Exif()
+    exif[ExifTags.Base.Model] = camera
+    exif[ExifTags.IFD.Exif] = {
+        ExifTags.Base.LensModel: lens,
+        ExifTags.Base.FocalLength: 23.0,
+        ExifTags.Base.ExposureTime: exposure_time,
+        ExifTags.Base.ISOSpeedRatings: 400,
+    }
+    Image.fromarray(data).save(path, exif=exif)
+
+
+@pytest.fixture
+def library(tmp_path: Path) -> list[Path]:
+    paths = [tmp_path / f"{i}.png" for i in range(4)]
+    write_image(paths[0], (60, 40), "X-T5", "XF23mmF2 R WR", 1 / 250)
+    write_image(paths[1], (40, 60), "X-T5", "XF56mmF1.2 R", 1 / 60, border=5)
+    write_image(paths[2], (80, 50), "Z 6", "NIKKOR Z 50mm", 1 / 250)
+    write_image(paths[3], (30, 30), "Z 6", "NIKKOR Z 50mm", 2.0, border=3)
+    return paths
+
+
+def test_parse_index_filter() -> None:
+    assert parse_index_filter("camera_model ~ X-T5") == IndexFilter("camera_model", "~", "X-T5")
+    assert parse_index_filter("lens_model=XF 23mm") == IndexFilter("lens_model", "=", "XF 23mm")
+    assert parse_index_filter("width>=3000") == IndexFilter("width", ">=", 3000)
+    assert parse_index_filter(" exposure_time < 1/250 ") == IndexFilter("exposure_time", "<", 0.004)
+    for text in ("width", "size > 3", "width ~ 3", "camera_model > a", "iso = high"):
+        with pytest.raises(ArgumentTypeError):
+            parse_index_filter(text)
+
+
+@pytest.mark.parametrize(
+    ("filters", "expected"),
+    [
+        ([], [0, 1, 2, 3]),
+        (["camera_model ~ x-t"], [0, 1]),
+        (["camera_model = z 6", "exposure_time < 1"], [2]),
+        (["lens_model != NIKKOR Z 50mm", "width > 40"], [0]),
+        (["exposure_time = 1/250"], [0, 2]),
+        (["border_top > 0"], [1, 3]),
+        (["height <= 40", "border_left = 0"], [0]),
+    ],
+)
+def test_iter_indexed_image_paths(library: list[Path], tmp_path: Path, filters: list[str], expected: list[int]) -> None:
+    selected = iter_indexed_image_paths(library, tmp_path / "index.sqlite3", [parse_index_filter(f) for f in filters])
+    assert list(selected) == [library[i] for i in expected]
+
+
+def test_image_index_is_incremental(library: list[Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    read_paths: list[Path] = []
+    read_image_info = index_module.read_image_info
+
+    def counting_read_image_info(input_path, detect_border=None):
+        read_paths.append(input_path)
+        return read_image_info(input_path, detect_border)
+
+    monkeypatch.setattr(index_module, "read_image_info", counting_read_image_info)
+    index = ImageIndex(tmp_path / "index.sqlite3")
+    for path in library:
+        index.get(path)
+    assert read_paths == library
+
+    # Unchanged files aren't read again, even by another connection to the index.
+    read_paths.clear()
+    index = ImageIndex(tmp_path / "index.sqlite3")
+    info = index.get(library[1])
+    assert (info.format, info.mode, info.size) == ("PNG", "RGB", (40, 60))
+    assert (info.metadata.camera_model, info.metadata.lens_model, info.metadata.iso) == ("X-T5", "XF56mmF1.2 R", 400)
+    assert info.border is None
+    assert read_paths == []
+
+    # Only read again when a border is needed for the first time, or the file changes.
+    assert index.get(library[1], detect_border).border == BorderSize(5, 5, 5, 5)
+    assert index.get(library[1], detect_border).border == BorderSize(5, 5, 5, 5)
+    write_image(library[0], (70, 40), "X-T5", "XF23mmF2 R WR", 1 / 250)
+    os.utime(library[0], ns=(0, 0))
+    assert index.get(library[0]).size == (70, 40)
+    assert read_paths == [library[1], library[0]]
+
+    # A border detected by another function isn't used, as they may give different results.
+    read_paths.clear()
+    assert index.lookup(library[1], detect_border_multi_resolution).border is None
+    assert index.get(library[1], detect_border_multi_resolution).border == BorderSize(5, 5, 5, 5)
+    assert index.lookup(library[1], detect_border).border is None
+    assert read_paths == [library[1]]
+
+
+def test_iter_indexed_image_paths_unreadable(library: list[Path], tmp_path: Path) -> None:
+    bad_path = tmp_path / "bad.jpg"
+    bad_path.write_text("not an image")
+    index_path = tmp_path / "index.sqlite3"
+    # Left for the batch to report, unless filtering.
+    assert list(iter_indexed_image_paths([bad_path, library[0]], index_path)) == [bad_path, library[0]]
+    filters = [parse_index_filter("width > 0")]
+    assert list(iter_indexed_image_paths([bad_path, library[0]], index_path, filters)) == [library[0]]
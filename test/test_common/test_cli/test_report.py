@@ -0,0 +1,24 @@
+import csv
+import json
+from pathlib import Path
+
+from image_tools.common.cli.report import write_report
+
+
+def test_write_report_json(tmp_path: Path) -> None:
+    records = [{"input": "a.jpg", "width": 10}, {"input": "b.jpg", "width": 20}]
+    path = tmp_path / "report.json"
+    write_report(records, path)
+    assert json.loads(path.read_text()) == records
+
+
+def test_write_report_csv(tmp_path: Path) -> None:
+    records = [{"input": "a.jpg", "width": 10}, {"input": "b.jpg", "height": 20}]
+    path = tmp_path / "report.csv"
+    write_report(records, path)
+    with path.open(newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert rows == [
+        {"input": "a.jpg", "width": "10", "height": ""},
+        {"input": "b.jpg", "width": "", "height": "20"},
+    ]
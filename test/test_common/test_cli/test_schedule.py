@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from image_tools.common.cli.schedule import MAX_HISTORY_IMAGES, CostModel, LargestFirstScheduler
+
+
+def test_cost_model_learns(tmp_path: Path) -> None:
+    path = tmp_path / "model" / "cost.json"
+    model = CostModel(path)
+    # Nothing learned yet, so time is proportional to size.
+    assert model.predict("JPEG", 2.0) == 2 * model.predict("PNG", 1.0)
+
+    model.record("JPEG", 10.0, 1.0)
+    model.record("JPEG", 30.0, 3.0)
+    model.record("PNG", 10.0, 5.0)
+    model.record("TIFF", 0.0, 1.0)
+    model.save()
+
+    model = CostModel(path)
+    assert model.predict("JPEG", 1.0) == pytest.approx(0.1)
+    assert model.predict("PNG", 1.0) == pytest.approx(0.5)
+    # Unknown classes take the average time per megapixel.
+    assert model.predict("TIFF", 1.0) == pytest.approx(9 / 50)
+
+    # Later batches are added to the history, until it's full.
+    model.record("PNG", 10.0, 1.0)
+    model.save()
+    assert CostModel(path).predict("PNG", 1.0) == pytest.approx(0.3)
+    model.record("PNG", 10.0 * MAX_HISTORY_IMAGES, 1.0 * MAX_HISTORY_IMAGES)
+    for _ in range(MAX_HISTORY_IMAGES - 1):
+        model.record("PNG", 10.0, 1.0)
+    model.save()
+    assert CostModel(path).predict("PNG", 1.0) == pytest.approx(0.1)
+
+
+def test_cost_model_invalid(tmp_path: Path) -> None:
+    path = tmp_path / "cost.json"
+    path.write_text("{")
+    model = CostModel(path)
+    assert model.predict("JPEG", 1.0) == 1.0
+    model.record("JPEG", 1.0, 2.0)
+    model.save()
+    assert json.loads(path.read_text())["classes"]["JPEG"]["seconds"] == 2.0
+
+
+def estimate_text_cost(input_path: Path, config: None) -> tuple[str, float]:
+    cost_class, megapixels = input_path.read_text().split()
+    return cost_class, float(megapixels)
+
+
+def test_largest_first_scheduler_order(tmp_path: Path) -> None:
+    model_path = tmp_path / "cost.json"
+    classes = {
+        "fast": {"seconds": 1.0, "megapixels": 1.0, "images": 1},
+        "slow": {"seconds": 10.0, "megapixels": 1.0, "images": 1},
+    }
+    model_path.write_text(json.dumps({"classes": classes}))
+    paths = []
+    for i, text in enumerate(["fast 1", "fast 5", "slow 1", "fast 3", "fast 5", "missing"]):
+        input_path = tmp_path / f"{i}.txt"
+        if text != "missing":
+            input_path.write_text(text)
+        paths.append((input_path, tmp_path / f"{i}-out.txt"))
+
+    with LargestFirstScheduler(estimate_text_cost, None, CostModel(model_path)) as scheduler:
+        # Ties keep the input order, and images which can't be estimated go last.
+        assert scheduler.order(paths) == [paths[2], paths[1], paths[4], paths[3], paths[0], paths[5]]
+        scheduler.learn({"input": str(paths[1][0]), "seconds": 9.0, "stages": {"decode": 2.0, "save": 3.0}})
+        scheduler.learn({"input": str(paths[3][0]), "seconds": 9.0, "stages": {}, "cached": True})
+
+    classes = json.loads(model_path.read_text())["classes"]
+    assert classes["fast"] == {"seconds": 6.0, "megapixels": 6.0, "images": 2}
+    assert classes["slow"]["images"] == 1
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Modules which are slow to import, and shouldn't be needed until an image is processed.
+HEAVY_MODULES = ["numpy", "PIL.Image", "sqlite3", "importlib.metadata", "multiprocessing"]
+
+# Runs a tool's main() and prints which of the heavy modules were imported.
+SCRIPT = """
+import json, sys
+from {module} import main
+modules = json.loads(sys.argv[2])
+sys.argv = ["tool", *json.loads(sys.argv[1])]
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps([name for name in modules if name in sys.modules]))
+"""
+
+SRC_DIRECTORY = Path(__file__).parents[3] / "src"
+
+
+def get_heavy_modules_imported(module: str, args: list[str]) -> list[str]:
+    completed = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(module=module), json.dumps(args), json.dumps(HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=os.environ | {"PYTHONPATH": str(SRC_DIRECTORY)},
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize(
+    ("module", "command", "tool_args"),
+    [
+        ("image_tools.instagramable.cli", [], []),
+        ("image_tools.annotate_info.cli", [], ["--all-info"]),
+        ("image_tools.cli", ["run"], ["--op", "annotate", "--op", "border"]),
+    ],
+)
+def test_startup_without_images_is_lazy(module: str, command: list[str], tool_args: list[str], tmp_path: Path) -> None:
+    assert get_heavy_modules_imported(module, [*command, "--help"]) == []
+    # No files to process.
+    assert get_heavy_modules_imported(module, [*command, str(tmp_path), *tool_args]) == []
+    assert get_heavy_modules_imported(module, [*command, str(tmp_path), "--jobs", "4", *tool_args]) == []
+
+
+def test_library_api_is_imported_on_use() -> None:
+    from image_tools.instagramable import process
+
+    assert callable(process)
@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+
+from image_tools.common.cli.stats import StatsWriter, collect_image_stats, record_size, stage
+
+
+def test_stage_does_nothing_when_disabled() -> None:
+    with stage("decode"):
+        record_size("input", (10, 20))
+
+
+def test_collect_image_stats(tmp_path: Path) -> None:
+    input_path = tmp_path / "in.jpg"
+    input_path.write_bytes(b"a" * 100)
+    output_path = tmp_path / "out.jpg"
+
+    with collect_image_stats(input_path, output_path) as record:
+        for _ in range(2):
+            with stage("decode"):
+                pass
+        with stage("save"):
+            output_path.write_bytes(b"b" * 50)
+        record_size("input", (10, 20))
+
+    assert set(record["stages"]) == {"decode", "save"}
+    assert record["input_width"] == 10 and record["input_height"] == 20
+    assert record["bytes_read"] == 100
+    assert record["bytes_written"] == 50
+    assert record["seconds"] >= sum(record["stages"].values())
+
+
+def test_stats_writer(tmp_path: Path) -> None:
+    stats_path = tmp_path / "stats.jsonl"
+    with StatsWriter(stats_path) as writer:
+        for _ in range(2):
+            writer.add({"type": "image", "stages": {"decode": 1.0}, "bytes_read": 10, "bytes_written": 5})
+
+    records = [json.loads(line) for line in stats_path.read_text().splitlines()]
+    assert [r["type"] for r in records] == ["image", "image", "summary"]
+    summary = records[-1]
+    assert summary["images"] == 2
+    assert summary["bytes_read"] == 20
+    assert summary["bytes_written"] == 10
+    assert summary["stages"] == {"decode": 2.0}
@@ -0,0 +1,63 @@
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from image_tools.common.cli.exception import AppError
+from image_tools.common.cli.watch import iter_watched_image_paths
+
+
+def take_paths(paths: Iterator[Path], count: int, timeout: float = 10) -> list[Path]:
+    """Gets `count` paths from a watch, failing rather than waiting forever if they don't arrive."""
+
+    taken: list[Path] = []
+
+    def take() -> None:
+        for path in paths:
+            taken.append(path)
+            if len(taken) == count:
+                return
+
+    thread = threading.Thread(target=take, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"Only got {taken}"
+    return taken
+
+
+@pytest.mark.parametrize("poll_interval", [None, 0.05])
+def test_iter_watched_image_paths(tmp_path: Path, poll_interval: float | None) -> None:
+    (tmp_path / "existing.jpg").write_bytes(b"old")
+    (tmp_path / "sub").mkdir()
+    paths = iter_watched_image_paths(
+        str(tmp_path), recursive=True, exclude=["skip*"], settle_time=0.3, poll_interval=poll_interval
+    )
+
+    (tmp_path / "notes.txt").write_text("not an image")
+    (tmp_path / "skip.jpg").write_bytes(b"excluded")
+    (tmp_path / "sub" / "a.png").write_bytes(b"a")
+    (tmp_path / "new").mkdir()
+    (tmp_path / "new" / "b.jpg").write_bytes(b"b")
+    # Still being written, so it's only used once it stops changing.
+    slow_path = tmp_path / "slow.jpg"
+    with open(slow_path, "wb") as file:
+        for _ in range(4):
+            file.write(b"part")
+            file.flush()
+            time.sleep(0.1)
+    written_time = time.monotonic()
+
+    taken = take_paths(paths, 3)
+    assert sorted(taken) == [tmp_path / "new" / "b.jpg", slow_path, tmp_path / "sub" / "a.png"]
+    assert time.monotonic() - written_time >= 0.2
+
+    # Changed files are used again.
+    (tmp_path / "sub" / "a.png").write_bytes(b"changed")
+    assert take_paths(paths, 1) == [tmp_path / "sub" / "a.png"]
+
+
+def test_iter_watched_image_paths_not_directory(tmp_path: Path) -> None:
+    with pytest.raises(AppError, match="requires an input directory"):
+        iter_watched_image_paths(str(tmp_path / "*.jpg"))
@@ -1,6 +1,14 @@
+import numpy as np
 import pytest
+from PIL import Image
 
-from image_tools.common.image.border import BorderSize, detect_border
+from image_tools.common.image.border import (
+    BORDER_DIFF_COLOUR_THRESHOLD,
+    BORDER_DIFF_PROPORTION_THRESHOLD,
+    BorderSize,
+    detect_border,
+    detect_border_multi_resolution,
+)
 from test.helpers import get_test_data_image
 
 
@@ -29,3 +37,88 @@ def test_border_size_all_sides() -> None:
     assert not BorderSize(1, 1, 0, 0).all_sides
     assert not BorderSize(1, 1, 1, 0).all_sides
     assert BorderSize(1, 1, 1, 1).all_sides
+
+
+def detect_border_reference(
+    image: Image.Image,
+    channel_diff_threshold: float = BORDER_DIFF_COLOUR_THRESHOLD,
+    pixel_count_threshold: float = BORDER_DIFF_PROPORTION_THRESHOLD,
+) -> BorderSize:
+    """Original row-by-row implementation of `detect_border()`, to check the vectorised implementation against."""
+
+    data = np.array(image)
+    ref_colour = data[0, 0].astype(float)
+    diff_ref = np.max(data, axis=(0, 1))
+
+    def is_same_colour(pixels: np.ndarray) -> bool:
+        pixels = pixels.astype(float)
+        diffs = pixels - ref_colour
+        different = np.abs(diffs) > channel_diff_threshold * diff_ref
+        total_pixels = pixels.shape[0] * pixels.shape[1]
+        different_proportion = np.count_nonzero(different) / total_pixels
+        return different_proportion <= pixel_count_threshold
+
+    def find_border(axis: int, reverse: bool) -> int:
+        depth = 1
+        while True:
+            index = -depth if reverse else depth - 1
+            side = data[index, :] if axis == 0 else data[:, index]
+            if not is_same_colour(side):
+                return depth - 1
+            depth += 1
+
+    return BorderSize(
+        top=find_border(0, False), bottom=find_border(0, True), left=find_border(1, False), right=find_border(1, True)
+    )
+
+
+def make_synthetic_border_image(rng: np.random.Generator, max_size: int = 150) -> Image.Image:
+    """Random content surrounded by a random border, with noise so some border rows/columns are near the thresholds."""
+
+    height, width = rng.integers(20, max_size, size=2)
+    data = np.empty((height, width, 3), dtype=np.uint8)
+    data[:] = rng.integers(0, 256, size=3)
+    top, bottom = rng.integers(0, height // 3, size=2)
+    left, right = rng.integers(0, width // 3, size=2)
+    data[top : height - bottom, left : width - right] = rng.integers(
+        0, 256, size=(height - top - bottom, width - left - right, 3)
+    )
+    noise_mask = rng.random((height, width)) < rng.uniform(0, 0.03)
+    noise = rng.integers(-20, 21, size=(np.count_nonzero(noise_mask), 3))
+    data[noise_mask] = np.clip(data[noise_mask] + noise, 0, 255)
+    # Keep the reference pixel unperturbed, otherwise there's rarely any border to detect.
+    data[0, 0] = data[0, 1]
+    return Image.fromarray(data)
+
+
+@pytest.mark.parametrize("file", ["border_white.jpg", "border_black.jpg"])
+def test_detect_border_matches_reference_test_data(file: str) -> None:
+    img = get_test_data_image(file)
+    assert detect_border(img) == detect_border_reference(img)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_detect_border_matches_reference_synthetic(seed: int) -> None:
+    img = make_synthetic_border_image(np.random.default_rng(seed))
+    assert detect_border(img) == detect_border_reference(img)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_detect_border_greyscale(seed: int) -> None:
+    img = make_synthetic_border_image(np.random.default_rng(seed)).convert("L")
+    # Reference implementation only handles multichannel images, but the proportions are the same if each channel is
+    # identical.
+    assert detect_border(img) == detect_border_reference(img.convert("RGB"))
+
+
+@pytest.mark.parametrize("file", ["border_white.jpg", "border_black.jpg"])
+def test_detect_border_multi_resolution_test_data(file: str) -> None:
+    img = get_test_data_image(file)
+    assert detect_border_multi_resolution(img) == detect_border(img)
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("mode", ["RGB", "L", "I;16", "1", "P", "LAB"])
+def test_detect_border_multi_resolution_synthetic(seed: int, mode: str) -> None:
+    img = make_synthetic_border_image(np.random.default_rng(seed), max_size=600).convert(mode)
+    assert detect_border_multi_resolution(img) == detect_border(img)
@@ -0,0 +1,73 @@
+import os
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_tools.common.image.encoding import EncoderOptions, EncoderProfile, get_encoder_params
+from image_tools.common.image.imageio import encode_image, get_pil_image_write_params, save_image
+
+
+def test_get_encoder_params() -> None:
+    assert get_encoder_params("JPEG", EncoderOptions()) == {"quality": 95, "subsampling": "4:4:4", "optimize": True}
+    assert get_encoder_params("jpeg", EncoderOptions(EncoderProfile.FAST))["optimize"] is False
+    assert get_encoder_params("PNG", EncoderOptions(EncoderProfile.FAST, png_compress_level=3)) == {"compress_level": 3}
+    # Pillow's default compression level.
+    assert get_encoder_params("PNG", EncoderOptions()) == {"compress_level": 6}
+    assert get_encoder_params("WEBP", EncoderOptions(webp_method=2)) == {"quality": 95, "method": 2}
+    # Overrides only apply to their own format.
+    assert "method" not in get_encoder_params("PNG", EncoderOptions(webp_method=2))
+    assert get_encoder_params("TIFF", EncoderOptions(EncoderProfile.FAST)) == {}
+
+
+def make_image(mode: str) -> Image.Image:
+    data = np.random.default_rng(0).integers(0, 256, size=(60, 80, 3), dtype=np.uint8)
+    image = Image.fromarray(data)
+    if mode == "I;16":
+        return Image.fromarray(np.asarray(image.convert("L"), dtype=np.uint16) * 257)
+    return image.convert(mode)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "P", "I;16"])
+@pytest.mark.parametrize("format", ["JPEG", "PNG", "WEBP", "TIFF"])
+def test_encode_image_converts_mode(mode: str, format: str) -> None:
+    image = make_image(mode)
+    data = encode_image(image, format, get_pil_image_write_params(image), EncoderOptions(EncoderProfile.FAST))
+    output = Image.open(BytesIO(data))
+    assert output.format == format
+    assert output.size == image.size
+    if mode == "I;16" and format in ("JPEG", "WEBP"):
+        # Scaled to 8 bits rather than clipped.
+        assert output.convert("L").getextrema()[0] < 10
+
+
+def test_encode_image_tiff_metadata() -> None:
+    # Metadata read from a TIFF file includes tags about the file's layout, which can't be written again.
+    exif = Image.Exif()
+    exif[0x010F] = "Camera maker"
+    buffer = BytesIO()
+    make_image("RGB").save(buffer, format="TIFF", exif=exif)
+    image = Image.open(buffer)
+    output = image.resize((160, 120))
+    data = encode_image(output, "TIFF", get_pil_image_write_params(image), EncoderOptions())
+    assert Image.open(BytesIO(data)).getexif()[0x010F] == "Camera maker"
+
+
+def test_save_image_atomically(tmp_path: Path) -> None:
+    path = tmp_path / "out.png"
+    path.write_bytes(b"previous")
+    link_path = tmp_path / "link.png"
+    os.link(path, link_path)
+
+    save_image(make_image("RGB"), path, None, {}, EncoderOptions())
+    assert Image.open(path).size == (80, 60)
+    # The file was replaced rather than overwritten, so hard links keep the previous content.
+    assert link_path.read_bytes() == b"previous"
+
+    # A failed save leaves the previous file, and no temporary file.
+    with pytest.raises(ValueError):
+        save_image(make_image("RGB"), path, "JPEG", {"qtables": "bad"}, EncoderOptions())
+    assert Image.open(path).format == "PNG"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["link.png", "out.png"]
@@ -0,0 +1,36 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_tools.common.image.imageio import draft_image
+
+
+def make_image_file(format: str, size: tuple[int, int] = (800, 600)) -> BytesIO:
+    data = np.random.default_rng(0).integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(data).save(buffer, format=format)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize(
+    ("requested_size", "expected_scale"),
+    [((800, 600), 1.0), ((500, 100), 1.0), ((400, 300), 0.5), ((300, 100), 0.5), ((150, 100), 0.25), ((10, 10), 0.125)],
+)
+def test_draft_image_jpeg(requested_size: tuple[int, int], expected_scale: float) -> None:
+    image = Image.open(make_image_file("JPEG"))
+    scale = draft_image(image, requested_size)
+    assert scale == expected_scale
+    image.load()
+    # The scale applied, and never smaller than requested.
+    assert image.size == (round(800 * scale), round(600 * scale))
+    assert image.width >= requested_size[0] and image.height >= requested_size[1]
+
+
+def test_draft_image_other_formats() -> None:
+    image = Image.open(make_image_file("PNG"))
+    assert draft_image(image, (100, 100)) == 1.0
+    image.load()
+    assert image.size == (800, 600)
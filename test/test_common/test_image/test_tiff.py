@@ -0,0 +1,145 @@
+import struct
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, TiffImagePlugin
+
+from image_tools.common.image.border import detect_border, detect_border_multi_resolution
+from image_tools.common.image.tiff import map_tiff
+
+
+def write_tiled_tiff(path: Path, data: np.ndarray, tile_size: int = 16) -> None:
+    """Writes uncompressed 8 bit RGB pixel data as a tiled TIFF, which Pillow can't write."""
+
+    height, width, _ = data.shape
+    tiles = []
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            # Edge tiles are padded to the full tile size.
+            tile = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+            part = data[top : top + tile_size, left : left + tile_size]
+            tile[: part.shape[0], : part.shape[1]] = part
+            tiles.append(tile.tobytes())
+
+    bits_per_sample_offset = 8
+    tile_offsets_offset = bits_per_sample_offset + 6
+    tile_byte_counts_offset = tile_offsets_offset + 4 * len(tiles)
+    tile_offset = tile_byte_counts_offset + 4 * len(tiles)
+    tile_offsets = [tile_offset + i * len(tiles[0]) for i in range(len(tiles))]
+    ifd_offset = tile_offset + sum(len(tile) for tile in tiles)
+
+    def short(tag: int, value: int) -> bytes:
+        return struct.pack("<HHIHH", tag, 3, 1, value, 0)
+
+    def long(tag: int, count: int, value: int) -> bytes:
+        return struct.pack("<HHII", tag, 4, count, value)
+
+    entries = [
+        long(256, 1, width),
+        long(257, 1, height),
+        struct.pack("<HHII", 258, 3, 3, bits_per_sample_offset),
+        short(259, 1),  # No compression
+        short(262, 2),  # RGB
+        short(277, 3),
+        short(284, 1),  # Chunky
+        short(322, tile_size),
+        short(323, tile_size),
+        long(324, len(tiles), tile_offsets_offset),
+        long(325, len(tiles), tile_byte_counts_offset),
+    ]
+    with open(path, "wb") as file:
+        file.write(struct.pack("<2sHI", b"II", 42, ifd_offset))
+        file.write(struct.pack("<3H", 8, 8, 8))
+        file.write(struct.pack(f"<{len(tiles)}I", *tile_offsets))
+        file.write(struct.pack(f"<{len(tiles)}I", *(len(tile) for tile in tiles)))
+        file.write(b"".join(tiles))
+        file.write(struct.pack("<H", len(entries)) + b"".join(entries) + struct.pack("<I", 0))
+
+
+def make_border_data(rng: np.random.Generator) -> np.ndarray:
+    height, width = rng.integers(60, 200, size=2)
+    data = np.full((height, width, 3), rng.integers(0, 256, size=3), dtype=np.uint8)
+    top, bottom, left, right = rng.integers(1, 20, size=4)
+    data[top : height - bottom, left : width - right] = rng.integers(
+        0, 256, size=(height - top - bottom, width - left - right, 3)
+    )
+    return data
+
+
+def write_tiff(path: Path, data: np.ndarray, layout: str, mode: str = "RGB") -> None:
+    match layout:
+        case "strip":
+            Image.fromarray(data).convert(mode).save(path)
+        case "strips":
+            # Pillow only splits the image into several strips when writing with libtiff.
+            previous = TiffImagePlugin.WRITE_LIBTIFF
+            TiffImagePlugin.WRITE_LIBTIFF = True
+            try:
+                Image.fromarray(data).convert(mode).save(path, strip_size=1024)
+            finally:
+                TiffImagePlugin.WRITE_LIBTIFF = previous
+        case "tiles":
+            assert mode == "RGB"
+            write_tiled_tiff(path, data)
+        case _:
+            raise AssertionError(layout)
+
+
+@pytest.mark.parametrize("layout", ["strip", "strips", "tiles"])
+def test_map_tiff_read_region(layout: str, tmp_path: Path) -> None:
+    data = make_border_data(np.random.default_rng(0))
+    path = tmp_path / "image.tif"
+    write_tiff(path, data, layout)
+
+    image = Image.open(path)
+    mapped = map_tiff(image)
+    assert mapped is not None
+    if layout != "strip":
+        assert len(image.tile) > 1
+    height, width, _ = data.shape
+    for box in [(0, 0, width, height), (0, 0, 1, 1), (3, 5, 40, 51), (width - 17, height - 1, width, height)]:
+        np.testing.assert_array_equal(mapped.read_region(box), data[box[1] : box[3], box[0] : box[2]])
+    np.testing.assert_array_equal(mapped.sample(8), data[::8, ::8])
+    np.testing.assert_array_equal(mapped.channel_maxima(), data.max(axis=(0, 1)))
+    # Nothing was decoded.
+    assert image.tile
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize(("layout", "mode"), [("strip", "RGB"), ("strips", "RGB"), ("tiles", "RGB"), ("strip", "L")])
+def test_detect_border_mapped_tiff(seed: int, layout: str, mode: str, tmp_path: Path) -> None:
+    path = tmp_path / "image.tif"
+    write_tiff(path, make_border_data(np.random.default_rng(seed)), layout, mode)
+    loaded = Image.open(path)
+    loaded.load()
+
+    for detect in (detect_border, detect_border_multi_resolution):
+        image = Image.open(path)
+        assert detect(image) == detect(loaded)
+        assert image.tile
+
+
+def test_map_tiff_16_bit(tmp_path: Path) -> None:
+    data = np.random.default_rng(0).integers(0, 65536, size=(40, 30), dtype=np.uint16)
+    path = tmp_path / "image.tif"
+    Image.fromarray(data).save(path)
+
+    mapped = map_tiff(Image.open(path))
+    assert mapped is not None
+    np.testing.assert_array_equal(mapped.read_region((2, 3, 20, 30))[:, :, 0], data[3:30, 2:20])
+
+
+def test_map_tiff_unsupported(tmp_path: Path) -> None:
+    data = make_border_data(np.random.default_rng(0))
+    compressed_path = tmp_path / "compressed.tif"
+    Image.fromarray(data).save(compressed_path, compression="tiff_lzw")
+    assert map_tiff(Image.open(compressed_path)) is None
+
+    loaded = Image.open(compressed_path)
+    loaded.load()
+    assert map_tiff(loaded) is None
+
+    jpeg_path = tmp_path / "image.jpg"
+    Image.fromarray(data).save(jpeg_path)
+    assert map_tiff(Image.open(jpeg_path)) is None
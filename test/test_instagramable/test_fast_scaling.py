@@ -0,0 +1,80 @@
+import logging
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_tools.instagramable import (
+    ExistingBorderHandling,
+    OutputVariant,
+    ProcessingOptions,
+    process,
+    process_variants,
+)
+from image_tools.instagramable.options import ScalingMode
+from image_tools.instagramable.processing import read_image
+from test.helpers import get_test_data
+
+
+def process_sizes(data: bytes, variants: list[OutputVariant], **options) -> list[tuple[int, int]]:
+    outputs = process_variants(data, variants, ProcessingOptions(**options))
+    return [Image.open(BytesIO(output)).size for output in outputs]
+
+
+@pytest.mark.parametrize("file", ["border_white.jpg", "border_black.jpg"])
+@pytest.mark.parametrize("max_dimension", [300, 800, 1080])
+def test_fast_scaling_size(file: str, max_dimension: int) -> None:
+    data = get_test_data(file).read_bytes()
+    variants = [OutputVariant(max_dimension, 0.1)]
+    # Without an existing border to remove, the output size only depends on the full image size.
+    add = ExistingBorderHandling.ADD
+    fast_sizes = process_sizes(data, variants, existing_border_handling=add, scaling=ScalingMode.FAST)
+    assert fast_sizes == process_sizes(data, variants, existing_border_handling=add, scaling=ScalingMode.QUALITY)
+
+    # Otherwise the border is detected from the reduced size image, so it's only accurate to a pixel of that, which can
+    # change how the output size is rounded.
+    (fast_size,) = process_sizes(data, variants, scaling=ScalingMode.FAST)
+    (quality_size,) = process_sizes(data, variants, scaling=ScalingMode.QUALITY)
+    assert max(fast_size) == max(quality_size) == max_dimension
+    assert abs(fast_size[0] - quality_size[0]) <= 1 and abs(fast_size[1] - quality_size[1]) <= 1
+
+
+def test_fast_scaling_output() -> None:
+    data = get_test_data("border_white.jpg").read_bytes()
+    fast, quality = (
+        np.asarray(Image.open(BytesIO(process(data, ProcessingOptions(max_dimension=800, scaling=scaling)))), np.int16)
+        for scaling in (ScalingMode.FAST, ScalingMode.QUALITY)
+    )
+    assert fast.shape == quality.shape
+    # The content edges move by up to a pixel, as the border is detected at a reduced size, so they differ most.
+    diff = np.abs(fast - quality)
+    assert np.mean(diff) < 6
+    assert np.mean(diff[100:-100, 100:-100]) < 10
+
+
+def test_fast_scaling_decodes_again(caplog: pytest.LogCaptureFixture) -> None:
+    # Planning the decoding size assumes the whole image is the content, but removing the border scales the content up
+    # more, so the image is decoded again at a larger size.
+    data = get_test_data("border_white.jpg").read_bytes()
+    variants = [OutputVariant(800, 0.1), OutputVariant(300, 0.05)]
+    with caplog.at_level(logging.DEBUG, logger="image_tools.instagramable.processing"):
+        fast_sizes = process_sizes(data, variants, scaling=ScalingMode.FAST)
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Decoding at 0.250 scale") for message in messages)
+    assert any(message.startswith("Decoding again at 0.500 scale") for message in messages)
+    assert fast_sizes == process_sizes(data, variants, scaling=ScalingMode.QUALITY)
+
+
+def test_fast_scaling_other_formats() -> None:
+    buffer = BytesIO()
+    data = np.random.default_rng(0).integers(0, 256, size=(600, 800, 3), dtype=np.uint8)
+    Image.fromarray(data).save(buffer, format="PNG")
+
+    # Only JPEG can be decoded at a reduced size.
+    source = read_image(BytesIO(buffer.getvalue()), ProcessingOptions(max_dimension=100, scaling=ScalingMode.FAST))
+    assert source.scale == 1.0
+    assert source.image.size == source.full_size == (800, 600)
+    variants = [OutputVariant(100, 0.1)]
+    fast_sizes = process_sizes(buffer.getvalue(), variants, scaling=ScalingMode.FAST)
+    assert fast_sizes == process_sizes(buffer.getvalue(), variants, scaling=ScalingMode.QUALITY)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from colour import Color
+from PIL import Image
+
+from image_tools.common.image.border import BorderSize, detect_border, remove_border
+from image_tools.common.image.sizing import clamp_max_dimension
+from image_tools.instagramable.border import apply_new_border, calculate_new_border_size
+from image_tools.instagramable.geometry import (
+    plan_output_geometry,
+    render_content,
+    render_content_from_larger,
+    render_output_image,
+)
+from image_tools.instagramable.sizing import adjust_image_size
+from test.helpers import get_test_data_image
+
+
+@pytest.mark.parametrize("size", [(100, 100), (4000, 3000), (3000, 4000), (6000, 2000), (1999, 2001), (200, 120)])
+@pytest.mark.parametrize("baseline_border_size", [0.01, 0.05, 0.1])
+@pytest.mark.parametrize("maximum_dimension", [100, 1080, 2000, 10000])
+def test_plan_output_geometry_size(size: tuple[int, int], baseline_border_size: float, maximum_dimension: int) -> None:
+    geometry = plan_output_geometry(size, None, baseline_border_size, maximum_dimension)
+    border = calculate_new_border_size(size, baseline_border_size)
+    expected_size = clamp_max_dimension(
+        (size[0] + border.left + border.right, size[1] + border.top + border.bottom), maximum_dimension
+    )
+    assert geometry.output_size == expected_size
+    assert geometry.content_size[0] <= geometry.output_size[0]
+
+
+def test_plan_output_geometry_existing_border() -> None:
+    geometry = plan_output_geometry((1000, 800), BorderSize(top=10, bottom=20, left=30, right=40), 0.1, 10000)
+    assert geometry.content_box == (30, 10, 960, 780)
+    assert geometry.content_size == (930, 770)
+
+
+@pytest.mark.parametrize("file", ["border_white.jpg", "border_black.jpg"])
+@pytest.mark.parametrize("maximum_dimension", [500, 10000])
+def test_render_output_image_matches_sequential_pipeline(file: str, maximum_dimension: int) -> None:
+    image = get_test_data_image(file)
+    border = detect_border(image)
+    colour = Color("white")
+
+    expected = adjust_image_size(apply_new_border(remove_border(image, border), colour, 0.1), maximum_dimension)
+    geometry = plan_output_geometry(image.size, border, 0.1, maximum_dimension)
+    actual = render_output_image(image, geometry, colour)
+
+    assert actual.size == expected.size
+    assert actual.mode == expected.mode
+    diff = np.abs(np.asarray(actual, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+    assert np.mean(diff) < 0.5
+    # Resampling only the content differs at the content edges, where the new border used to be blended in.
+    # Elsewhere should be practically the same.
+    border = geometry.border
+    edge = 4
+    interior = diff[
+        border.top + edge : -border.bottom - edge,
+        border.left + edge : -border.right - edge,
+    ]
+    assert np.max(interior) <= 1
+
+
+def test_render_output_image_palette() -> None:
+    image = Image.new("P", (300, 200), 5)
+    geometry = plan_output_geometry(image.size, None, 0.1, 100)
+    actual = render_output_image(image, geometry, Color("white"))
+    assert actual.size == geometry.output_size
+
+
+@pytest.mark.parametrize("file", ["border_white.jpg", "border_black.jpg"])
+@pytest.mark.parametrize("maximum_dimension", [300, 80])
+def test_render_content_from_larger_content(file: str, maximum_dimension: int) -> None:
+    image = get_test_data_image(file)
+    border = detect_border(image)
+    larger = plan_output_geometry(image.size, border, 0.1, 1000)
+    geometry = plan_output_geometry(image.size, border, 0.05, maximum_dimension)
+
+    expected = render_content(image, geometry)
+    actual = render_content_from_larger(render_content(image, larger), larger, geometry)
+
+    assert actual.size == expected.size == geometry.content_size
+    diff = np.abs(np.asarray(actual, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+    # As for test_render_output_image_matches_sequential_pipeline(), the edges differ where the source's old border is
+    # blended in.
+    interior = diff[2:-2, 2:-2]
+    assert np.mean(interior) < 0.5
+    assert np.max(interior) <= 8
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_tools.instagramable import (
+    ExistingBorderHandling,
+    OutputVariant,
+    ProcessingOptions,
+    process,
+    process_variants,
+)
+
+
+def make_jpeg(seed: int, border: int = 20) -> bytes:
+    rng = np.random.default_rng(seed)
+    content = Image.fromarray(rng.integers(0, 256, size=(150, 200, 3), dtype=np.uint8))
+    image = ImageOps.expand(content, border=border, fill="black")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def test_process_inputs_match() -> None:
+    data = make_jpeg(0)
+    output = process(data)
+    assert process(BytesIO(data)) == output
+    assert Image.open(BytesIO(output)).format == "JPEG"
+
+    decoded = Image.open(BytesIO(data))
+    decoded.load()
+    before = decoded.tobytes()
+    assert process(decoded) == output
+    assert decoded.tobytes() == before
+
+
+def test_process_options() -> None:
+    data = make_jpeg(0)
+    options = ProcessingOptions(existing_border_handling=ExistingBorderHandling.ADD, max_dimension=100)
+    output = Image.open(BytesIO(process(data, options, format="PNG")))
+    assert output.format == "PNG"
+    assert max(output.size) <= 100 * (1 + 2 * 0.1) + 2
+
+
+def test_process_threads() -> None:
+    inputs = [make_jpeg(seed) for seed in range(8)]
+    expected = [process(data) for data in inputs]
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(process, inputs * 2)) == expected * 2
+
+
+def test_process_variants() -> None:
+    data = make_jpeg(0)
+    variants = [OutputVariant(1000, 0.1), OutputVariant(80, 0.05), OutputVariant(400, 0.1)]
+    outputs = process_variants(data, variants, format="PNG")
+    assert process_variants(data, [], format="PNG") == [process(data, format="PNG")]
+    for variant, output in zip(variants, outputs, strict=True):
+        options = ProcessingOptions(
+            max_dimension=variant.max_dimension, border_baseline_size=variant.border_baseline_size
+        )
+        expected = Image.open(BytesIO(process(data, options, format="PNG")))
+        actual = Image.open(BytesIO(output))
+        assert actual.size == expected.size
+        diff = np.abs(np.asarray(actual, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+        assert np.mean(diff) < 1
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_tools.instagramable.cli import get_config, plan_image, process_image
+from test.helpers import get_test_data
+
+
+def assert_process_matches_plan(input_path: Path, output_path: Path, args: list[str]) -> None:
+    args = [str(input_path), *args]
+    process_image(input_path, output_path, get_config(args))
+    records = plan_image(input_path, output_path, get_config([*args, "--dry-run"]))
+    assert records
+    for record in records:
+        assert Image.open(record["output"]).size == (record["output_width"], record["output_height"])
+
+
+@pytest.mark.parametrize("file", ["border_white.jpg", "border_black.jpg"])
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--detect-border"],
+        ["--detect-border", "--border-detection", "full"],
+        ["--detect-border", "--variant", "suffix=-a,max-dimension=400", "--variant", "suffix=-b,border-size=0.05"],
+        # The existing border is kept, so it needn't be detected.
+        ["--existing-border", "add"],
+        ["--existing-border", "add", "--max-dimension", "300"],
+    ],
+)
+def test_process_matches_plan(tmp_path: Path, file: str, args: list[str]) -> None:
+    assert_process_matches_plan(get_test_data(file), tmp_path / "output.jpg", args)
+
+
+@pytest.mark.parametrize("args", [[], ["--detect-border"]])
+def test_process_matches_plan_without_border(tmp_path: Path, args: list[str]) -> None:
+    # Existing borders are ignored when planning without --detect-border, which is exact if there isn't one.
+    input_path = tmp_path / "input.png"
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, size=(300, 500, 3), dtype=np.uint8)).save(input_path)
+    assert_process_matches_plan(input_path, tmp_path / "output.png", args)
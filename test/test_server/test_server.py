@@ -0,0 +1,168 @@
+import http.client
+import os
+import socket
+import stat
+import threading
+from collections.abc import Iterator
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_tools.server.client import (
+    ServerError,
+    get_default_address,
+    get_health,
+    get_metrics,
+    parse_address,
+    process_image,
+    run_tool,
+)
+from image_tools.server.server import ServerOptions, create_server
+
+
+@pytest.fixture(scope="module")
+def server_address(tmp_path_factory: pytest.TempPathFactory) -> Iterator[str]:
+    address = str(tmp_path_factory.mktemp("server") / "server.sock")
+    server = create_server(ServerOptions(address, workers=1, max_queued=4))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield address
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    server.pool.shutdown()
+    assert not Path(address).exists()
+
+
+@pytest.fixture(scope="module")
+def tcp_server_address() -> Iterator[tuple[str, int]]:
+    server = create_server(ServerOptions(("127.0.0.1", 0), workers=1, max_queued=4, token="secret"))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield "127.0.0.1", server.server_port
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    server.pool.shutdown()
+
+
+def make_jpeg() -> bytes:
+    rng = np.random.default_rng(0)
+    buffer = BytesIO()
+    Image.fromarray(rng.integers(0, 256, size=(200, 300, 3), dtype=np.uint8)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_parse_address() -> None:
+    assert parse_address("localhost:8000") == ("localhost", 8000)
+    assert parse_address("unix:/tmp/image-tools.sock") == "/tmp/image-tools.sock"
+    for text in ["localhost", "unix:", ":8000", "localhost:port"]:
+        with pytest.raises(ValueError):
+            parse_address(text)
+
+
+def test_default_address(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.delenv("IMAGE_TOOLS_SERVER", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert get_default_address() == f"unix:{tmp_path / 'image-tools.sock'}"
+    monkeypatch.setenv("IMAGE_TOOLS_SERVER", "localhost:8000")
+    assert get_default_address() == "localhost:8000"
+
+
+def test_server_socket_permissions(server_address: str) -> None:
+    assert stat.S_IMODE(os.stat(server_address).st_mode) == 0o600
+
+
+def test_server_socket_in_use(server_address: str, tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="Another server is already listening"):
+        create_server(ServerOptions(server_address, workers=1, max_queued=4))
+    assert get_health(server_address)["status"] == "ok"
+
+    # As if a server didn't shut down cleanly.
+    stale_address = str(tmp_path / "stale.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale_socket:
+        stale_socket.bind(stale_address)
+    server = create_server(ServerOptions(stale_address, workers=1, max_queued=4))
+    server.server_close()
+    server.pool.shutdown()
+
+
+def test_tcp_server_requires_token() -> None:
+    with pytest.raises(ValueError, match="A token is required"):
+        create_server(ServerOptions(("127.0.0.1", 0), workers=1, max_queued=4))
+
+
+def send_request(address: tuple[str, int], path: str, headers: dict[str, str], body: bytes = b"{}") -> int:
+    connection = http.client.HTTPConnection(*address)
+    try:
+        connection.request("POST", path, body, headers)
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def test_tcp_server_rejects_requests(tcp_server_address: tuple[str, int], tmp_path: Path) -> None:
+    (tmp_path / "in.jpg").write_bytes(make_jpeg())
+    result = run_tool(tcp_server_address, "instagramable", ["in.jpg", "--dry-run"], str(tmp_path), token="secret")
+    assert result.exit_code == 0
+    assert get_health(tcp_server_address, token="secret")["status"] == "ok"
+
+    with pytest.raises(ServerError) as error:
+        get_health(tcp_server_address, token="wrong")
+    assert error.value.status == 401
+    with pytest.raises(ServerError) as error:
+        run_tool(tcp_server_address, "instagramable", ["in.jpg"], str(tmp_path / "missing"), token="secret")
+    assert error.value.status == 400
+
+    host = f"{tcp_server_address[0]}:{tcp_server_address[1]}"
+    headers = {"Authorization": "Bearer secret", "Content-Type": "application/json"}
+    path = "/run/instagramable"
+    assert send_request(tcp_server_address, path, headers) == 400
+    # As from a web page, through a host name which resolves to the server's address.
+    assert send_request(tcp_server_address, path, headers | {"Host": "example.com"}) == 403
+    assert send_request(tcp_server_address, path, headers | {"Host": host, "Content-Type": "text/plain"}) == 415
+
+
+def test_run_tool(server_address: str, tmp_path: Path) -> None:
+    (tmp_path / "in.jpg").write_bytes(make_jpeg())
+    result = run_tool(server_address, "instagramable", ["in.jpg", "--output-dir", "out"], str(tmp_path))
+    assert result.exit_code == 0
+    assert "Saved image to 'out/in-instagram.jpg'" in result.stderr
+    assert Image.open(tmp_path / "out" / "in-instagram.jpg").size == (350, 280)
+
+    # Same exit code and messages as running the tool directly.
+    result = run_tool(server_address, "instagramable", ["in.jpg", "--output-dir", "out"], str(tmp_path))
+    assert result.exit_code == 1
+    assert "ERROR: Would overwrite existing file" in result.stderr
+    result = run_tool(server_address, "annotate-image-info", ["in.jpg"], str(tmp_path))
+    assert result.exit_code == 2
+    assert "annotate-image-info: error: At least one annotation option is required" in result.stderr
+
+
+def test_process_image(server_address: str) -> None:
+    output = process_image(server_address, "instagramable", make_jpeg(), ["--border-size", "0.05"], "PNG")
+    image = Image.open(BytesIO(output))
+    assert image.format == "PNG"
+    assert image.size == (324, 260)
+
+    with pytest.raises(ServerError) as error:
+        process_image(server_address, "instagramable", make_jpeg(), ["--bogus"])
+    assert error.value.status == 400
+    with pytest.raises(ServerError) as error:
+        process_image(server_address, "instagramable", b"not an image", [])
+    assert error.value.status == 400
+    with pytest.raises(ServerError) as error:
+        process_image(server_address, "unknown", make_jpeg(), [])
+    assert error.value.status == 404
+
+
+def test_health_and_metrics(server_address: str) -> None:
+    assert get_health(server_address) == {"status": "ok", "workers": 1}
+    metrics = get_metrics(server_address)
+    assert metrics["jobs_running"] == 0
+    assert metrics["jobs_queued"] == 0
+    assert metrics["workers"] == 1
+    assert metrics["max_queued"] == 4